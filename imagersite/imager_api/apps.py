@@ -0,0 +1,5 @@
+from django.apps import AppConfig
+
+
+class ImagerApiConfig(AppConfig):
+    name = 'imager_api'
@@ -0,0 +1,249 @@
+"""Field-selectable JSON representations of photos, albums, profiles and tags."""
+from collections import OrderedDict
+
+from django.db.models import Prefetch
+from django.urls import reverse
+
+from imager_images.models import Photo, visible_to
+from imager_images.renditions import DEFAULT_RENDITIONS, Renditions
+
+
+class InvalidFields(ValueError):
+    """The client asked for fields a resource does not have."""
+
+    pass
+
+
+def _isoformat(value):
+    """Return a datetime as ISO 8601, passing None through."""
+    return value.isoformat() if value is not None else None
+
+
+def _rendition_url(image_file, rendition):
+    """Return the url of a rendition of an image, or None if there is none."""
+    renditions = Renditions(image_file)
+    if rendition not in renditions:
+        return None
+    return renditions[rendition].url
+
+
+class Field(object):
+    """One selectable field and what the queryset must load to produce it.
+
+    value(obj, resource) builds the field. columns are passed to only(),
+    select to select_related(), and prefetch(resource), if given, returns
+    a lookup for prefetch_related(), so any combination of fields costs
+    one query for the rows plus one per embedded to-many relation.
+    """
+
+    def __init__(self, value, columns=(), select=(), prefetch=None):
+        """Describe the field."""
+        self.value = value
+        self.columns = tuple(columns)
+        self.select = tuple(select)
+        self.prefetch = prefetch
+
+
+def attribute(name):
+    """Return a field that copies a model column."""
+    return Field(lambda obj, resource: getattr(obj, name), columns=[name])
+
+
+def timestamp(name):
+    """Return a field that renders a datetime column as ISO 8601."""
+    return Field(lambda obj, resource: _isoformat(getattr(obj, name)), columns=[name])
+
+
+def rendition(name):
+    """Return a field with the url of one rendition of the photo."""
+    return Field(lambda obj, resource: _rendition_url(obj.photo, name), columns=['photo'])
+
+
+def owner():
+    """Return a field naming the owner of a photo or album."""
+    def value(obj, resource):
+        if obj.owner is None:
+            return None
+        return OrderedDict([
+            ('username', obj.owner.user.username),
+            ('url', reverse('api_profile', args=[obj.owner.user.username])),
+        ])
+    return Field(value,
+                 columns=['owner', 'owner__user', 'owner__user__username'],
+                 select=['owner__user'])
+
+
+class Resource(object):
+    """The fields a client may ask for on one model.
+
+    The client names the fields it wants, as in "?fields=id,title,thumb";
+    without a list it gets default_fields. key_columns are always loaded
+    so the rows can be paginated.
+    """
+
+    fields = {}
+    default_fields = ()
+    key_columns = ('id',)
+
+    def __init__(self, user, requested=None):
+        """Remember the viewer and the fields they asked for."""
+        self.user = user
+        self.names = self.parse(requested)
+
+    def parse(self, requested):
+        """Return the requested field names, in order and without repeats."""
+        if not requested:
+            return list(self.default_fields)
+        names = []
+        for name in requested.split(','):
+            name = name.strip()
+            if name and name not in names:
+                names.append(name)
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise InvalidFields('Unknown fields: {}.'.format(', '.join(unknown)))
+        return names
+
+    def prepare(self, queryset):
+        """Load just the columns and relations the requested fields need."""
+        columns = set(self.key_columns)
+        select = set()
+        prefetch = []
+        for name in self.names:
+            field = self.fields[name]
+            columns.update(field.columns)
+            select.update(field.select)
+            if field.prefetch is not None:
+                prefetch.append(field.prefetch(self))
+        if select:
+            queryset = queryset.select_related(*sorted(select))
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset.only(*sorted(columns))
+
+    def represent(self, obj):
+        """Return the requested fields of obj."""
+        return OrderedDict((name, self.fields[name].value(obj, self)) for name in self.names)
+
+
+def photo_summary(photo):
+    """Return the short form of a photo embedded in an album."""
+    return OrderedDict([
+        ('id', photo.id),
+        ('title', photo.title),
+        ('thumb', _rendition_url(photo.photo, 'thumb')),
+    ])
+
+
+def album_photos(resource):
+    """Prefetch an album's photos that the viewer may see."""
+    return Prefetch('photos',
+                    queryset=visible_to(Photo, resource.user)
+                    .only('id', 'title', 'photo')
+                    .order_by('-date_uploaded', '-id'),
+                    to_attr='visible_photos')
+
+
+def rank():
+    """Return a field with an object's search score, null outside search results."""
+    return Field(lambda obj, resource: getattr(obj, 'rank', None))
+
+
+def _photo_fields():
+    """Return the fields of the photo resource."""
+    fields = {
+        'id': attribute('id'),
+        'title': attribute('title'),
+        'description': attribute('description'),
+        'published': attribute('published'),
+        'date_uploaded': timestamp('date_uploaded'),
+        'date_published': timestamp('date_published'),
+        'taken_at': timestamp('taken_at'),
+        'width': attribute('width'),
+        'height': attribute('height'),
+        'file_size': attribute('file_size'),
+        'mime_type': attribute('mime_type'),
+        'camera_model': attribute('camera_model'),
+        'lens_model': attribute('lens_model'),
+        'url': Field(lambda obj, resource: reverse('api_photo', args=[obj.id])),
+        'page_url': Field(lambda obj, resource: reverse('photo', args=[obj.id])),
+        'image': Field(lambda obj, resource: obj.photo.url if obj.photo else None,
+                       columns=['photo']),
+        'owner': owner(),
+        'tags': Field(lambda obj, resource: sorted(tag.name for tag in obj.tags.all()),
+                      prefetch=lambda resource: 'tags'),
+        'rank': rank(),
+    }
+    for name in DEFAULT_RENDITIONS:
+        fields[name] = rendition(name)
+    return fields
+
+
+class PhotoResource(Resource):
+    """Photos."""
+
+    fields = _photo_fields()
+    default_fields = ('id', 'title', 'url', 'thumb')
+    key_columns = ('id', 'date_uploaded')
+
+
+class AlbumResource(Resource):
+    """Albums, optionally with the photos in them."""
+
+    fields = {
+        'id': attribute('id'),
+        'title': attribute('title'),
+        'description': attribute('description'),
+        'published': attribute('published'),
+        'date_uploaded': timestamp('date_uploaded'),
+        'date_published': timestamp('date_published'),
+        'url': Field(lambda obj, resource: reverse('api_album', args=[obj.id])),
+        'page_url': Field(lambda obj, resource: reverse('album', args=[obj.id])),
+        'photos_url': Field(lambda obj, resource: reverse('api_album_photos', args=[obj.id])),
+        'owner': owner(),
+        'cover': Field(lambda obj, resource: (_rendition_url(obj.cover_photo.photo, 'thumb')
+                                              if obj.cover_photo is not None else None),
+                       columns=['cover_photo', 'cover_photo__photo'],
+                       select=['cover_photo']),
+        'photos': Field(lambda obj, resource: [photo_summary(photo) for photo in obj.visible_photos],
+                        prefetch=album_photos),
+        'rank': rank(),
+    }
+    default_fields = ('id', 'title', 'url', 'cover')
+    key_columns = ('id', 'date_uploaded')
+
+
+class ProfileResource(Resource):
+    """The public side of photographers' profiles."""
+
+    fields = {
+        'id': attribute('id'),
+        'username': Field(lambda obj, resource: obj.user.username,
+                          columns=['user', 'user__username'], select=['user']),
+        'bio': attribute('bio'),
+        'website': attribute('website'),
+        'camera_type': attribute('camera_type'),
+        'type_of_photography': attribute('type_of_photography'),
+        'hireable': attribute('hireable'),
+        'url': Field(lambda obj, resource: reverse('api_profile', args=[obj.user.username]),
+                     columns=['user', 'user__username'], select=['user']),
+        'page_url': Field(lambda obj, resource: reverse('profile', args=[obj.user.username]),
+                          columns=['user', 'user__username'], select=['user']),
+    }
+    default_fields = ('id', 'username', 'url')
+
+
+class TagResource(Resource):
+    """Tags, by the number of public photos carrying them."""
+
+    fields = {
+        'name': Field(lambda obj, resource: obj.tag.name,
+                      columns=['tag', 'tag__name'], select=['tag']),
+        'slug': Field(lambda obj, resource: obj.tag.slug,
+                      columns=['tag', 'tag__slug'], select=['tag']),
+        'public_photos': attribute('public_photos'),
+        'photos_url': Field(lambda obj, resource: reverse('api_tag_photos', args=[obj.tag.slug]),
+                            columns=['tag', 'tag__slug'], select=['tag']),
+    }
+    default_fields = ('name', 'slug', 'public_photos', 'photos_url')
+    key_columns = ('tag', 'public_photos')
@@ -0,0 +1,163 @@
+"""Tests for the JSON API."""
+from django.core.cache import cache
+from django.test import TestCase
+
+from imager_images.search import memory_index
+from imager_images.tests import AlbumFactory, PhotoFactory
+from imager_profile.tests import UserFactory
+
+
+class ApiTests(TestCase):
+    """Field selection, pagination and visibility of the JSON API."""
+
+    def setUp(self):
+        """Make an owner with public and private photos in a public album."""
+        cache.clear()
+        self.owner = UserFactory.create()
+        self.stranger = UserFactory.create()
+        self.public = PhotoFactory.create(owner=self.owner.profile, published='PUBLIC')
+        self.public.tags.add('sun', 'sea')
+        self.private = PhotoFactory.create(owner=self.owner.profile, published='PRIVATE')
+        self.album = AlbumFactory.create(owner=self.owner.profile, published='PUBLIC',
+                                         cover_photo=self.public)
+        self.album.photos.add(self.public, self.private)
+
+    def get(self, url, **params):
+        """Fetch url with query params and return the response."""
+        return self.client.get(url, params)
+
+    def test_photo_list_shows_only_public_photos(self):
+        """Anonymous clients see the public gallery."""
+        results = self.get('/api/photos/').json()['results']
+        self.assertEqual([photo['id'] for photo in results], [self.public.id])
+
+    def test_default_photo_fields(self):
+        """Without a field list, photos come with ids, titles and thumbnails."""
+        photo = self.get('/api/photos/').json()['results'][0]
+        self.assertEqual(sorted(photo), ['id', 'thumb', 'title', 'url'])
+        self.assertTrue(photo['thumb'].endswith('.thumb.jpg'))
+
+    def test_fields_are_chosen_by_the_client(self):
+        """Only the named fields are returned, in the order asked for."""
+        photo = self.get('/api/photos/', fields='title,id').json()['results'][0]
+        self.assertEqual(list(photo), ['title', 'id'])
+
+    def test_unknown_fields_are_rejected(self):
+        """Asking for a field that does not exist is a bad request."""
+        response = self.get('/api/photos/', fields='id,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_embedded_relations(self):
+        """Owner and tags are embedded on request."""
+        photo = self.get('/api/photos/', fields='owner,tags').json()['results'][0]
+        self.assertEqual(photo['owner']['username'], self.owner.username)
+        self.assertEqual(photo['tags'], ['sea', 'sun'])
+
+    def test_embedded_relations_cost_a_query_each(self):
+        """Rows, owners and tags take one query per to-many relation, not per row."""
+        for i in range(5):
+            PhotoFactory.create(owner=UserFactory.create().profile, published='PUBLIC').tags.add('x')
+        with self.assertNumQueries(2):
+            self.get('/api/photos/', fields='id,owner,tags')
+
+    def test_owner_sees_own_private_photos(self):
+        """Listing your own photos includes the ones you have not made public."""
+        self.client.force_login(self.owner)
+        results = self.get('/api/photos/', owner=self.owner.username).json()['results']
+        self.assertEqual(sorted(photo['id'] for photo in results),
+                         sorted([self.public.id, self.private.id]))
+
+    def test_others_see_only_public_photos_of_an_owner(self):
+        """Listing someone else's photos shows their public ones."""
+        self.client.force_login(self.stranger)
+        results = self.get('/api/photos/', owner=self.owner.username).json()['results']
+        self.assertEqual([photo['id'] for photo in results], [self.public.id])
+
+    def test_private_photo_detail_is_hidden(self):
+        """Private photos are not found for other viewers."""
+        url = '/api/photos/{}/'.format(self.private.id)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(url).json()['id'], self.private.id)
+
+    def test_pagination_follows_cursors(self):
+        """next and previous links walk the whole list."""
+        for i in range(4):
+            PhotoFactory.create(published='PUBLIC')
+        first = self.get('/api/photos/', limit=2, fields='id').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        third = self.client.get(second['next']).json()
+        self.assertIsNone(third['next'])
+        seen = [photo['id'] for page in (first, second, third) for photo in page['results']]
+        self.assertEqual(len(set(seen)), 5)
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_bad_cursor_is_rejected(self):
+        """A cursor that cannot be decoded is a bad request."""
+        self.assertEqual(self.get('/api/photos/', after='nonsense').status_code, 400)
+
+    def test_album_embeds_visible_photos(self):
+        """An album's photos are limited to the ones the viewer may see."""
+        url = '/api/albums/{}/'.format(self.album.id)
+        album = self.get(url, fields='id,cover,photos').json()
+        self.assertEqual([photo['id'] for photo in album['photos']], [self.public.id])
+        self.assertTrue(album['cover'].endswith('.thumb.jpg'))
+        self.client.force_login(self.owner)
+        album = self.get(url, fields='photos').json()
+        self.assertEqual(len(album['photos']), 2)
+
+    def test_album_photo_list(self):
+        """An album's photos are paginated like the gallery."""
+        results = self.get('/api/albums/{}/photos/'.format(self.album.id)).json()['results']
+        self.assertEqual([photo['id'] for photo in results], [self.public.id])
+
+    def test_private_album_is_hidden(self):
+        """Private albums and their photos are not found for other viewers."""
+        album = AlbumFactory.create(owner=self.owner.profile, published='PRIVATE')
+        self.assertEqual(self.client.get('/api/albums/{}/'.format(album.id)).status_code, 404)
+        self.assertEqual(self.client.get('/api/albums/{}/photos/'.format(album.id)).status_code, 404)
+
+    def test_profile_detail(self):
+        """Profiles are looked up by username."""
+        profile = self.get('/api/profiles/{}/'.format(self.owner.username),
+                           fields='username,camera_type').json()
+        self.assertEqual(profile['username'], self.owner.username)
+        self.assertIn('camera_type', profile)
+
+    def test_inactive_profiles_are_hidden(self):
+        """Deactivated photographers are not listed or found."""
+        self.owner.is_active = False
+        self.owner.save()
+        self.assertEqual(self.client.get('/api/profiles/{}/'.format(self.owner.username)).status_code, 404)
+        usernames = [profile['username'] for profile in self.get('/api/profiles/').json()['results']]
+        self.assertNotIn(self.owner.username, usernames)
+
+    def test_tags_and_tagged_photos(self):
+        """Tags are listed with their public counts and link to their photos."""
+        tags = self.get('/api/tags/').json()['results']
+        self.assertEqual(sorted(tag['slug'] for tag in tags), ['sea', 'sun'])
+        results = self.client.get(tags[0]['photos_url']).json()['results']
+        self.assertEqual([photo['id'] for photo in results], [self.public.id])
+        self.assertEqual(self.client.get('/api/tags/nothing/photos/').status_code, 404)
+
+    def test_tags_are_paginated(self):
+        """The tag list pages by count and tag."""
+        first = self.get('/api/tags/', limit=1).json()
+        second = self.client.get(first['next']).json()
+        self.assertIsNone(second['next'])
+        self.assertEqual(sorted([first['results'][0]['slug'], second['results'][0]['slug']]),
+                         ['sea', 'sun'])
+
+    def test_search(self):
+        """Search results come with their rank."""
+        memory_index.clear()
+        self.addCleanup(memory_index.clear)
+        self.public.title = 'Lighthouse'
+        self.public.save()
+        results = self.get('/api/search/photos/', q='lighthouse', fields='id,rank').json()['results']
+        self.assertEqual([result['id'] for result in results], [self.public.id])
+        self.assertGreater(results[0]['rank'], 0)
+        self.assertEqual(self.get('/api/search/albums/', q='lighthouse').json()['results'], [])
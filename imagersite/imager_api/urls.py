@@ -0,0 +1,29 @@
+"""Routes for the JSON API."""
+from django.conf.urls import url
+from imager_api.views import (
+    AlbumDetailView,
+    AlbumListView,
+    AlbumPhotoListView,
+    AlbumSearchView,
+    PhotoDetailView,
+    PhotoListView,
+    PhotoSearchView,
+    ProfileDetailView,
+    ProfileListView,
+    TagListView,
+    TagPhotoListView,
+)
+
+urlpatterns = [
+    url(r'^photos/$', PhotoListView.as_view(), name='api_photos'),
+    url(r'^photos/(?P<pk>\d+)/$', PhotoDetailView.as_view(), name='api_photo'),
+    url(r'^albums/$', AlbumListView.as_view(), name='api_albums'),
+    url(r'^albums/(?P<pk>\d+)/$', AlbumDetailView.as_view(), name='api_album'),
+    url(r'^albums/(?P<pk>\d+)/photos/$', AlbumPhotoListView.as_view(), name='api_album_photos'),
+    url(r'^profiles/$', ProfileListView.as_view(), name='api_profiles'),
+    url(r'^profiles/(?P<username>[\w.@+-]+)/$', ProfileDetailView.as_view(), name='api_profile'),
+    url(r'^tags/$', TagListView.as_view(), name='api_tags'),
+    url(r'^tags/(?P<slug>[-\w]+)/photos/$', TagPhotoListView.as_view(), name='api_tag_photos'),
+    url(r'^search/photos/$', PhotoSearchView.as_view(), name='api_search_photos'),
+    url(r'^search/albums/$', AlbumSearchView.as_view(), name='api_search_albums'),
+]
@@ -0,0 +1,250 @@
+"""Read-only JSON views over photos, albums, profiles and tags."""
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.generic import View
+
+from imager_api.resources import (AlbumResource,
+                                  InvalidFields,
+                                  PhotoResource,
+                                  ProfileResource,
+                                  TagResource)
+from imager_images import search, tagindex
+from imager_images.models import Album, Photo, TagCount, visible_to
+from imager_images.pagination import CursorPaginator
+from imager_profile.models import ImagerProfile
+
+
+class ResourceView(View):
+    """Answer with the fields of one resource the client asked for."""
+
+    resource_class = None
+
+    def get_resource(self):
+        """Return the resource for the viewer and the requested fields."""
+        return self.resource_class(self.request.user, self.request.GET.get('fields'))
+
+    def dispatch(self, request, *args, **kwargs):
+        """Turn bad field lists and cursors into 400 responses."""
+        try:
+            return super(ResourceView, self).dispatch(request, *args, **kwargs)
+        except (InvalidFields, InvalidPage) as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+
+class ResourceListView(ResourceView):
+    """A cursor-paginated list of a resource.
+
+    The response holds the page's results and absolute links to the next
+    and previous pages, or null where there are none.
+    """
+
+    ordering = ('-date_uploaded', '-id')
+
+    def get_queryset(self):
+        """Return the rows the viewer may list."""
+        raise NotImplementedError
+
+    def get_page_size(self):
+        """Return the page size, letting the client ask for fewer or more rows."""
+        default = getattr(settings, 'IMAGER_API_PAGE_SIZE', 50)
+        largest = getattr(settings, 'IMAGER_API_MAX_PAGE_SIZE', 200)
+        try:
+            size = int(self.request.GET.get('limit', default))
+        except ValueError:
+            size = default
+        return min(max(size, 1), largest)
+
+    def page_link(self, direction, cursor):
+        """Return the url of the page in direction from cursor, if any."""
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query.pop('after', None)
+        query.pop('before', None)
+        query[direction] = cursor
+        return self.request.build_absolute_uri('{}?{}'.format(self.request.path, query.urlencode()))
+
+    def get_page(self, queryset):
+        """Return the page of queryset selected by the cursors."""
+        paginator = CursorPaginator(queryset, self.get_page_size(), self.ordering)
+        return paginator.page(after=self.request.GET.get('after'),
+                              before=self.request.GET.get('before'))
+
+    def get(self, request, *args, **kwargs):
+        """Return one page of results."""
+        resource = self.get_resource()
+        page = self.get_page(resource.prepare(self.get_queryset()))
+        return JsonResponse({
+            'results': [resource.represent(obj) for obj in page],
+            'next': self.page_link('after', page.next_cursor),
+            'previous': self.page_link('before', page.previous_cursor),
+        })
+
+
+class ResourceDetailView(ResourceView):
+    """A single object of a resource."""
+
+    def get_object(self, queryset):
+        """Return the object named in the url from queryset."""
+        return get_object_or_404(queryset, pk=self.kwargs['pk'])
+
+    def get_queryset(self):
+        """Return the rows the viewer may look at."""
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        """Return the object."""
+        resource = self.get_resource()
+        return JsonResponse(resource.represent(self.get_object(resource.prepare(self.get_queryset()))))
+
+
+class OwnerFilterMixin(object):
+    """List the public gallery, or one owner's objects with "?owner=<username>".
+
+    Owners listing themselves also see what they have not made public.
+    """
+
+    model = None
+
+    def get_queryset(self):
+        """Return the public objects, narrowed to the requested owner."""
+        username = self.request.GET.get('owner')
+        if username is None:
+            return self.model.public.all()
+        user = self.request.user
+        if user.is_authenticated and user.username == username:
+            return self.model.objects.filter(owner__user=user)
+        return self.model.public.filter(owner__user__username=username)
+
+
+class PhotoListView(OwnerFilterMixin, ResourceListView):
+    """Public photos, newest first."""
+
+    resource_class = PhotoResource
+    model = Photo
+
+
+class PhotoDetailView(ResourceDetailView):
+    """One photo the viewer may see."""
+
+    resource_class = PhotoResource
+
+    def get_queryset(self):
+        """Limit the lookup to photos the viewer may see."""
+        return visible_to(Photo, self.request.user)
+
+
+class AlbumListView(OwnerFilterMixin, ResourceListView):
+    """Public albums, newest first."""
+
+    resource_class = AlbumResource
+    model = Album
+
+
+class AlbumDetailView(ResourceDetailView):
+    """One album the viewer may see."""
+
+    resource_class = AlbumResource
+
+    def get_queryset(self):
+        """Limit the lookup to albums the viewer may see."""
+        return visible_to(Album, self.request.user)
+
+
+class AlbumPhotoListView(ResourceListView):
+    """The photos of an album the viewer may see, newest first."""
+
+    resource_class = PhotoResource
+
+    def get_queryset(self):
+        """Return the album's photos that the viewer may see."""
+        album = get_object_or_404(visible_to(Album, self.request.user).only('id'), pk=self.kwargs['pk'])
+        return visible_to(Photo, self.request.user).filter(albums=album)
+
+
+class ProfileListView(ResourceListView):
+    """Active photographers, oldest first."""
+
+    resource_class = ProfileResource
+    ordering = ('id',)
+
+    def get_queryset(self):
+        """Return the active profiles."""
+        return ImagerProfile.active.all()
+
+
+class ProfileDetailView(ResourceDetailView):
+    """One active photographer."""
+
+    resource_class = ProfileResource
+
+    def get_object(self, queryset):
+        """Look the profile up by username."""
+        return get_object_or_404(queryset, user__username=self.kwargs['username'])
+
+    def get_queryset(self):
+        """Return the active profiles."""
+        return ImagerProfile.active.all()
+
+
+class TagListView(ResourceListView):
+    """Tags carried by public photos, most used first."""
+
+    resource_class = TagResource
+    ordering = ('-public_photos', '-tag_id')
+
+    def get_queryset(self):
+        """Read the maintained counts."""
+        return TagCount.objects.filter(public_photos__gt=0)
+
+
+class TagPhotoListView(ResourceListView):
+    """Public photos with a tag, newest first."""
+
+    resource_class = PhotoResource
+
+    def get_queryset(self):
+        """Load the public photos the tag index pages through."""
+        self.tag_id = (TagCount.objects.filter(tag__slug=self.kwargs['slug'])
+                       .values_list('tag_id', flat=True).first())
+        if self.tag_id is None:
+            raise Http404('No such tag.')
+        return Photo.public.all()
+
+    def get_page(self, queryset):
+        """Page the tag's entries in the public tag index."""
+        paginator = tagindex.TaggedPhotoPaginator(self.tag_id, self.get_page_size(), queryset)
+        return paginator.page(after=self.request.GET.get('after'),
+                              before=self.request.GET.get('before'))
+
+
+class SearchListView(ResourceListView):
+    """Photos or albums matching "?q=", best match first."""
+
+    model = None
+
+    def get_queryset(self):
+        """Search only what the viewer may see."""
+        return visible_to(self.model, self.request.user)
+
+    def get_page(self, queryset):
+        """Return the page of ranked matches selected by the cursors."""
+        return search.search(queryset, self.request.GET.get('q', ''), self.get_page_size(),
+                             after=self.request.GET.get('after'),
+                             before=self.request.GET.get('before'))
+
+
+class PhotoSearchView(SearchListView):
+    """Photos matching a search."""
+
+    resource_class = PhotoResource
+    model = Photo
+
+
+class AlbumSearchView(SearchListView):
+    """Albums matching a search."""
+
+    resource_class = AlbumResource
+    model = Album
@@ -1,31 +1,29 @@
 from django.contrib import admin
+from imager_images.largeadmin import LargeTableAdmin, PaginatedTabularInline
 from imager_images.models import Photo, Album
 
 
-# class PhotoAdmin(admin.ModelAdmin):
-#     list_display = ("title", "description")
-#     fields = ('title',
-#               'description',
-#               'published',
-#               'owner')
+@admin.register(Photo)
+class PhotoAdmin(LargeTableAdmin):
+    list_display = ('title', 'owner', 'published', 'date_uploaded')
+    list_select_related = ('owner__user',)
+    list_filter = ('published',)
+    raw_id_fields = ('owner',)
+    search_lookups = ('title__startswith', 'owner__user__username')
 
 
-# class AlbumAdmin(admin.ModelAdmin):
-#     list_display = ("title", "description")
-#     filter_horizontal = ('photos',)
-#     fields = ('title',
-#               'description',
-#               'published',
-#               'owner')
-
-admin.site.register(Photo)
-
-
-class AlbumInline(admin.TabularInline):
+class AlbumInline(PaginatedTabularInline):
     model = Album.photos.through
+    raw_id_fields = ('photo',)
+    extra = 1
 
 
 @admin.register(Album)
-class AlbumAdmin(admin.ModelAdmin):
+class AlbumAdmin(LargeTableAdmin):
     inlines = (AlbumInline,)
     exclude = ('photos',)
+    list_display = ('title', 'owner', 'published', 'date_uploaded')
+    list_select_related = ('owner__user',)
+    list_filter = ('published',)
+    raw_id_fields = ('owner', 'cover_photo')
+    search_lookups = ('title__startswith', 'owner__user__username')
@@ -0,0 +1,214 @@
+"""Latency, query count and size of every named page, as a report to diff.
+
+Each named URL of the site's own URLconfs is requested through the test
+client in this process, so the whole middleware and view stack runs and
+every query can be counted. URLs that take arguments get them from rows
+already in the database, so seed it first with seed_data. Admin and
+registration pages belong to other apps and are left out, as is logout,
+which would sign the benchmark out.
+"""
+import json
+import math
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, RegexURLResolver, get_resolver, reverse
+from django.utils import timezone
+from django.utils.six.moves.urllib.parse import urlencode
+from taggit.models import Tag
+
+from imager_images.models import Album, Photo, TagCount
+from imager_profile.models import ImagerProfile
+
+REPORT_FORMAT = 1
+URLCONFS = ('imager_images.urls', 'imager_profile.urls', 'imager_api.urls')
+EXCLUDED = ('logout',)
+PERCENTILES = (50, 95)
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+
+def own_urlconfs():
+    """Return the URLconf modules whose pages are benchmarked."""
+    return (settings.ROOT_URLCONF,) + URLCONFS
+
+
+def _module_name(urlconf):
+    """Return the dotted name of a URLconf given as a module or a string."""
+    return getattr(urlconf, '__name__', urlconf)
+
+
+def url_names(resolver=None):
+    """Return the names of the site's own URL patterns, in URLconf order."""
+    resolver = resolver or get_resolver()
+    names = []
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, RegexURLResolver):
+            if pattern.namespace is None and _module_name(pattern.urlconf_name) in own_urlconfs():
+                names.extend(url_names(pattern))
+        elif (pattern.name and pattern.name not in EXCLUDED and
+              _module_name(resolver.urlconf_name) in own_urlconfs()):
+            names.append(pattern.name)
+    return names
+
+
+def url_arguments(user=None):
+    """Return the kwargs and query of each named URL that needs them.
+
+    Signed in, the URLs point at the user's own photos and albums, so
+    the edit pages are measured too; otherwise at public ones.
+    """
+    if user is not None:
+        photos = Photo.objects.filter(owner__user=user)
+        albums = Album.objects.filter(owner__user=user)
+    else:
+        photos = Photo.public.all()
+        albums = Album.public.all()
+    photo = photos.order_by('-id').first()
+    album = albums.order_by('-id').first()
+    tag = Tag.objects.filter(pk__in=TagCount.objects.order_by('-public_photos').values('tag_id')[:1]).first()
+    profile = ImagerProfile.objects.select_related('user').order_by('-public_photos').first()
+    kwargs = {}
+    if photo is not None:
+        kwargs.update(dict.fromkeys(('photo', 'edit_photo', 'api_photo'), {'pk': photo.pk}))
+        kwargs['media'] = {'path': photo.photo.name}
+    if album is not None:
+        kwargs['album'] = {'albumid': album.pk}
+        kwargs.update(dict.fromkeys(('download_album', 'edit_album', 'api_album', 'api_album_photos'),
+                                    {'pk': album.pk}))
+    if tag is not None:
+        kwargs.update(dict.fromkeys(('tagged_photos', 'api_tag_photos'), {'slug': tag.slug}))
+    if profile is not None:
+        kwargs['profile'] = {'slug': profile.user.username}
+        kwargs['api_profile'] = {'username': profile.user.username}
+    word = tag.name if tag is not None else 'photo'
+    query = dict.fromkeys(('search', 'api_search_photos', 'api_search_albums'), urlencode({'q': word}))
+    if album is not None and user is not None:
+        query['photo_picker'] = urlencode({'album': album.pk})
+    return kwargs, query
+
+
+def percentile(values, share):
+    """Return the nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(share / 100.0 * len(ordered))) - 1)]
+
+
+def fetch(client, path):
+    """Request path; return the status, bytes sent and queries run.
+
+    A view that raises counts as a 500, as it would behind a server. The
+    client closes the response itself; closing it again would signal the
+    end of another request and drop the database connection.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        try:
+            response = client.get(path)
+        except Exception:
+            return 500, 0, len(queries)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+    return response.status_code, size, len(queries)
+
+
+def measure(client, path, requests, warmup=1, cold=False):
+    """Request path repeatedly and summarise the timings, queries and sizes."""
+    for _ in range(warmup):
+        fetch(client, path)
+    timings, sizes, query_counts, statuses = [], [], [], Counter()
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        start = timer()
+        status, size, query_count = fetch(client, path)
+        timings.append((timer() - start) * 1000)
+        sizes.append(size)
+        query_counts.append(query_count)
+        statuses[status] += 1
+    result = {
+        'path': path,
+        'status': statuses.most_common(1)[0][0],
+        'statuses': dict((str(status), count) for status, count in statuses.items()),
+        'requests': requests,
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': percentile(query_counts, 50),
+        'max_queries': max(query_counts),
+        'bytes': percentile(sizes, 50),
+    }
+    for share in PERCENTILES:
+        result['p{}_ms'.format(share)] = round(percentile(timings, share), 3)
+    return result
+
+
+def default_host():
+    """Return a host name the site accepts, for the client's requests."""
+    for host in settings.ALLOWED_HOSTS:
+        host = host.lstrip('.')
+        if host and host != '*':
+            return host
+    return 'testserver'
+
+
+def run(user=None, names=None, requests=20, warmup=1, cold=False, host=None):
+    """Benchmark the named URLs, or all of them, and return the report.
+
+    Pages are requested anonymously unless a user is given.
+    """
+    client = Client(HTTP_HOST=host or default_host())
+    if user is not None:
+        client.force_login(user)
+    kwargs, query = url_arguments(user)
+    results = {}
+    skipped = {}
+    for name in names or url_names():
+        try:
+            path = reverse(name, kwargs=kwargs.get(name))
+        except NoReverseMatch:
+            skipped[name] = 'no rows to fill in its arguments'
+            continue
+        if query.get(name):
+            path = '{}?{}'.format(path, query[name])
+        results[name] = measure(client, path, requests, warmup, cold)
+    return {
+        'format': REPORT_FORMAT,
+        'generated_at': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'user': user.get_username() if user is not None else None,
+        'requests': requests,
+        'warmup': warmup,
+        'cold_cache': cold,
+        'rows': {
+            'users': ImagerProfile.objects.count(),
+            'photos': Photo.objects.count(),
+            'albums': Album.objects.count(),
+        },
+        'urls': results,
+        'skipped': skipped,
+    }
+
+
+def dumps(report):
+    """Return the report as JSON that diffs line by line."""
+    return json.dumps(report, indent=2, sort_keys=True)
+
+
+def compare(baseline, report, key='p95_ms'):
+    """Return (name, before, after, change in percent) for URLs in both reports."""
+    rows = []
+    for name in sorted(set(baseline['urls']) & set(report['urls'])):
+        before = baseline['urls'][name][key]
+        after = report['urls'][name][key]
+        change = (after - before) * 100.0 / before if before else None
+        rows.append((name, before, after, change))
+    return rows
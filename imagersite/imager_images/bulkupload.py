@@ -0,0 +1,190 @@
+"""Upload many photos, loose or zipped, in one request."""
+import os
+import zipfile
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from taggit.models import Tag, TaggedItem
+
+from imager_images.duplicates import dhash, near_duplicates
+from imager_images.models import Album, Photo, photos_bulk_created
+
+UploadResult = namedtuple('UploadResult', ['name', 'photo', 'error', 'duplicates'])
+IN_BATCH = 500
+
+
+class UploadRejected(Exception):
+    """An upload that cannot be stored as a photo."""
+
+
+def max_files():
+    """Return how many photos one bulk upload may create."""
+    return getattr(settings, 'IMAGER_BULK_UPLOAD_MAX_FILES', 200)
+
+
+def max_archive_bytes():
+    """Return the largest total size an archive may unpack to."""
+    return getattr(settings, 'IMAGER_BULK_UPLOAD_MAX_ARCHIVE_BYTES', 500 * 1024 * 1024)
+
+
+def orphan_grace():
+    """Return how long a stored file nobody points at is kept."""
+    return timedelta(seconds=getattr(settings, 'IMAGER_ORPHAN_FILE_GRACE', 24 * 60 * 60))
+
+
+def archive_entries(archive):
+    """Yield (name, open file) for each file in a zip archive, one at a time.
+
+    The archive is read through its own file object, which Django keeps on
+    disk for large uploads, and each entry is decompressed as it is read.
+    """
+    with zipfile.ZipFile(archive) as zipped:
+        unpacked = 0
+        for info in zipped.infolist():
+            name = os.path.basename(info.filename)
+            if info.filename.endswith('/') or not name or name.startswith('.') \
+                    or info.filename.startswith('__MACOSX/'):
+                continue
+            unpacked += info.file_size
+            if unpacked > max_archive_bytes():
+                raise UploadRejected('The archive unpacks to more than the allowed size.')
+            with zipped.open(info) as entry:
+                yield name, entry
+
+
+def iter_uploads(files=(), archive=None):
+    """Yield (name, open file) for the loose files and then the archive."""
+    for upload in files:
+        yield upload.name, upload
+    if archive is not None:
+        for name, entry in archive_entries(archive):
+            yield name, entry
+
+
+def store_image(name, content):
+    """Stream one image into the photo storage.
+
+    Returns the stored name and the image's perceptual hash.
+    """
+    field = Photo._meta.get_field('photo')
+    stored, created = field.storage.store(field.generate_filename(None, name), File(content, name))
+    try:
+        with field.storage.open(stored, 'rb') as saved:
+            Image.open(saved).verify()
+        with field.storage.open(stored, 'rb') as saved:
+            phash = dhash(saved)
+    except Exception:
+        # No photo can point at bytes that are not an image.
+        if created:
+            field.storage.delete(stored)
+        raise UploadRejected('Not a valid image.')
+    return stored, phash
+
+
+def sweep_orphans(now=None):
+    """Delete stored originals that no photo points at; return how many went.
+
+    Identical bytes share one file, so an upload that fails cannot tell
+    whether a concurrent upload of the same bytes is about to point at
+    the file it wrote, and leaves it behind. Once nothing has stored or
+    touched such a file for the grace period, it is deleted here.
+    """
+    storage = Photo._meta.get_field('photo').storage
+    cutoff = (now or timezone.now()) - orphan_grace()
+    names = storage.originals()
+    swept = 0
+    while True:
+        batch = [name for name, _ in zip(names, range(IN_BATCH))]
+        if not batch:
+            return swept
+        referenced = set(Photo.objects.filter(photo__in=batch).values_list('photo', flat=True))
+        swept += sum(storage.sweep(name, cutoff) for name in batch if name not in referenced)
+
+
+def _tags_named(names):
+    """Return the tags with these names, creating the missing ones."""
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    for name in names:
+        if name not in tags:
+            tags[name] = Tag.objects.create(name=name)
+    return list(tags.values())
+
+
+def create_photos(owner, stored, published='PRIVATE', tags=(), album=None):
+    """Create one photo per (original name, stored name, hash) in bulk.
+
+    The rows, their tags and their album membership are each inserted with
+    a single statement, so the per-photo signal receivers do not run;
+    photos_bulk_created is sent once the transaction is done so the
+    indexes and caches can catch up.
+    """
+    storage = Photo._meta.get_field('photo').storage
+    with transaction.atomic():
+        photos = Photo.objects.bulk_create([
+            Photo(owner=owner, published=published, photo=stored_name, phash=phash,
+                  title=os.path.splitext(name)[0][:128] or stored_name,
+                  file_size=storage.size(stored_name))
+            for name, stored_name, phash in stored
+        ])
+        if any(photo.pk is None for photo in photos):
+            # Backends that cannot return the new ids get them looked up by
+            # the stored names. Identical files share a name, so the newest
+            # rows with those names are the ones just inserted.
+            names = set(stored_name for name, stored_name, phash in stored)
+            created = (Photo.objects.filter(owner=owner, photo__in=names)
+                       .order_by('-id')[:len(stored)])
+            photos = list(reversed(created))
+        if tags:
+            content_type = ContentType.objects.get_for_model(Photo)
+            shared_tags = _tags_named(tags)
+            TaggedItem.objects.bulk_create([
+                TaggedItem(tag=tag, content_type=content_type, object_id=photo.pk)
+                for photo in photos for tag in shared_tags
+            ])
+        if album is not None:
+            Membership = Album.photos.through
+            Membership.objects.bulk_create([
+                Membership(album_id=album.pk, photo_id=photo.pk) for photo in photos
+            ])
+    photos_bulk_created.send(sender=Photo, photos=photos, tagged=bool(tags), album=album)
+    return photos
+
+
+def bulk_upload(owner, files=(), archive=None, published='PRIVATE', tags=(), album=None):
+    """Store every upload, create the photos and return a result per file.
+
+    Files that are not images are skipped and reported; the rest become
+    photos together or, if creating them fails, not at all.
+    """
+    results = []
+    stored = []
+    try:
+        for name, content in iter_uploads(files, archive):
+            if len(stored) >= max_files():
+                results.append(UploadResult(name, None, 'Too many files in one upload.', []))
+                continue
+            try:
+                stored_name, phash = store_image(name, content)
+                stored.append((name, stored_name, phash))
+                results.append(None)
+            except UploadRejected as error:
+                results.append(UploadResult(name, None, str(error), []))
+    except (UploadRejected, zipfile.BadZipfile) as error:
+        results.append(UploadResult(getattr(archive, 'name', 'archive'), None, str(error), []))
+    if not stored:
+        return results
+    photos = iter(create_photos(owner, stored, published, tags, album))
+    names = iter(name for name, stored_name, phash in stored)
+    created = []
+    for result in results:
+        if result is None:
+            photo = next(photos)
+            result = UploadResult(next(names), photo, None, near_duplicates(photo))
+        created.append(result)
+    return created
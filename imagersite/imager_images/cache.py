@@ -0,0 +1,144 @@
+"""Page caching for anonymous visitors with namespace-versioned invalidation."""
+import hashlib
+import math
+import random
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+
+VERSION_KEY = 'imager:version:{}'
+PAGE_KEY = 'imager:page:{}'
+LOCK_KEY = 'imager:lock:{}'
+# Longest a computation that died can keep others from a key.
+LOCK_TIMEOUT = 30
+
+
+def tag_namespace(slug):
+    """Return the namespace of the gallery for one tag."""
+    return 'tag:{}'.format(slug)
+
+
+def namespace_versions(namespaces):
+    """Return the current version of each namespace, creating missing ones."""
+    keys = [VERSION_KEY.format(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so an evicted version never comes back
+            # with a number that old cached pages were stored under.
+            cache.add(key, int(time.time() * 1000), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*namespaces):
+    """Invalidate every cached page that depends on the namespaces."""
+    for namespace in set(namespaces):
+        key = VERSION_KEY.format(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), None)
+
+
+def page_key(request, namespaces):
+    """Return the cache key of a page at the namespaces' current versions."""
+    versions = namespace_versions(namespaces)
+    raw = '|'.join([request.get_full_path()] + [str(version) for version in versions])
+    return PAGE_KEY.format(hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+
+def _is_stale(expires, cost, now):
+    """Decide whether to recompute an entry before it expires.
+
+    The chance grows as expiry nears and with how long the value took to
+    compute, so one reader of a hot key refreshes it early and the rest
+    keep being served (probabilistic early expiration, "XFetch").
+    """
+    if expires is None:
+        return False
+    return now - cost * math.log(1.0 - random.random()) >= expires
+
+
+def remember(key, compute, timeout, cacheable=None):
+    """Return the value cached under key, computing it when missing or stale.
+
+    Only one caller at a time computes a key, the one that takes its lock
+    in the shared cache. Callers that find a value being refreshed are
+    given the old one; callers with nothing to serve wait up to
+    IMAGER_CACHE_LOCK_WAIT seconds for it before computing it
+    themselves. cacheable(value), if given, decides whether to store it.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and not _is_stale(entry[1], entry[2], now):
+        return entry[0]
+    lock = LOCK_KEY.format(key)
+    wait = getattr(settings, 'IMAGER_CACHE_LOCK_WAIT', 2.0)
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry[0]
+        deadline = now + wait
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+    try:
+        started = time.time()
+        value = compute()
+        if cacheable is None or cacheable(value):
+            finished = time.time()
+            expires = finished + timeout if timeout is not None else None
+            cache.set(key, (value, expires, finished - started), timeout)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value
+
+
+class AnonymousPageCacheMixin(object):
+    """Serve a view's page to anonymous GET requests from the cache.
+
+    The cache key covers the full path, so each cursor page and tag is
+    stored separately, plus the version of every namespace the page
+    depends on. The model signal receivers bump those versions when the
+    underlying rows change, which retires the stale pages at once. Pages
+    are stored through remember(), so a popular page that expires is
+    rendered once, not once per waiting visitor. A visitor with messages
+    waiting is shown a fresh page, so they are never stored for others.
+    """
+
+    cache_namespaces = ()
+    cache_timeout = None
+
+    def get_cache_namespaces(self):
+        """Return the namespaces this page depends on."""
+        return self.cache_namespaces
+
+    def get_cache_timeout(self):
+        """Return how long the page may stay cached."""
+        if self.cache_timeout is not None:
+            return self.cache_timeout
+        return getattr(settings, 'IMAGER_PAGE_CACHE_TIMEOUT', 300)
+
+    def dispatch(self, request, *args, **kwargs):
+        """Return the cached page or render and store it."""
+        user = getattr(request, 'user', None)
+        if (request.method not in ('GET', 'HEAD') or user is None or user.is_authenticated or
+                len(messages.get_messages(request))):
+            return super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+        self.request, self.args, self.kwargs = request, args, kwargs
+        key = page_key(request, self.get_cache_namespaces())
+        return remember(key, lambda: self.render_page(request, *args, **kwargs),
+                        self.get_cache_timeout(), cacheable=lambda response: response.status_code == 200)
+
+    def render_page(self, request, *args, **kwargs):
+        """Return the view's response, rendered so it can be stored."""
+        response = super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response
@@ -0,0 +1,51 @@
+"""Conditional GET for pages built from photos and albums."""
+import calendar
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin(object):
+    """Answer revalidation with 304 Not Modified from cheap validators.
+
+    Views return the values that change whenever their page would from
+    get_validators(), and may give a last modified time. The ETag covers
+    those values, the full path and the viewer, and is checked before the
+    view builds its querysets or renders anything.
+    """
+
+    def get_validators(self):
+        """Return the values the page depends on, or None to skip the check."""
+        return None
+
+    def get_last_modified(self):
+        """Return when the page last changed, if known."""
+        return None
+
+    def get_etag(self, validators):
+        """Return the ETag of the page for this viewer."""
+        user = getattr(self.request, 'user', None)
+        viewer = user.pk if user is not None and user.is_authenticated else 'anonymous'
+        raw = '|'.join(str(value) for value in [self.request.get_full_path(), viewer] + list(validators))
+        return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    def dispatch(self, request, *args, **kwargs):
+        """Return 304 if the client's copy is current, else the page with validators."""
+        if request.method not in ('GET', 'HEAD'):
+            return super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+        self.request, self.args, self.kwargs = request, args, kwargs
+        validators = self.get_validators()
+        if validators is None:
+            return super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+        etag = self.get_etag(validators)
+        last_modified = self.get_last_modified()
+        timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super(ConditionalGetMixin, self).dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
@@ -0,0 +1,77 @@
+"""Zip downloads of whole albums."""
+import os
+import re
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from imager_images.zipstream import ZipMember, ZipStream
+
+UNSAFE_CHARACTERS = re.compile(r'[\x00-\x1f\\/:*?"<>|]+')
+
+
+def safe_name(title, fallback):
+    """Return title made safe as a file name, or fallback if nothing is left."""
+    name = UNSAFE_CHARACTERS.sub('_', title or '').strip(' .')
+    return name[:100] or fallback
+
+
+def member_names(photos):
+    """Return an archive name for each photo, made unique by numbering."""
+    taken = set()
+    names = []
+    for photo in photos:
+        ext = os.path.splitext(photo.photo.name)[1].lower()
+        stem = safe_name(photo.title, 'photo-{}'.format(photo.id))
+        name = stem + ext
+        number = 1
+        while name.lower() in taken:
+            number += 1
+            name = '{} ({}){}'.format(stem, number, ext)
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def album_photos(album, user):
+    """Return the album's photos that user may see, oldest first."""
+    photos = album.photos.all()
+    if user.is_authenticated:
+        photos = photos.filter(Q(published='PUBLIC') | Q(owner__user_id=user.id))
+    else:
+        photos = photos.filter(published='PUBLIC')
+    return photos.only('id', 'title', 'photo', 'date_uploaded').order_by('date_uploaded', 'id')
+
+
+def album_archive(album, user):
+    """Return a ZipStream of the originals of the album's visible photos.
+
+    Photos whose file is missing from storage are left out.
+    """
+    photos = [photo for photo in album_photos(album, user) if photo.photo]
+    members = []
+    for photo, name in zip(photos, member_names(photos)):
+        storage = photo.photo.storage
+        try:
+            size = storage.size(photo.photo.name)
+        except (IOError, OSError):
+            continue
+        uploaded = photo.date_uploaded
+        if timezone.is_aware(uploaded):
+            uploaded = timezone.localtime(uploaded)
+        members.append(ZipMember(name, size, uploaded,
+                                 lambda storage=storage, path=photo.photo.name: storage.open(path, 'rb')))
+    return ZipStream(members)
+
+
+def album_response(album, user):
+    """Return a response streaming the album as a zip attachment."""
+    archive = album_archive(album, user)
+    response = StreamingHttpResponse(iter(archive), content_type='application/zip')
+    response['Content-Length'] = len(archive)
+    response['Content-Disposition'] = 'attachment; filename="{}.zip"'.format(
+        safe_name(album.title, 'album-{}'.format(album.id)))
+    # Let a buffering proxy pass the bytes straight through.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,203 @@
+"""Perceptual hashes and a BK-tree index for finding near-duplicate photos."""
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+HASH_SIZE = 8
+
+
+def dhash(image_file):
+    """Return the 64 bit difference hash of an open image as 16 hex digits.
+
+    The image is shrunk to 9x8 greys and each bit says whether a pixel is
+    brighter than its right-hand neighbour, so re-encoding, resizing and
+    small edits change few bits.
+    """
+    image = Image.open(image_file)
+    image.draft('L', (HASH_SIZE * 4, HASH_SIZE * 4))
+    grey = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = list(grey.getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return '{:016x}'.format(value)
+
+
+def hash_field_file(field_file):
+    """Return the hash of a photo's file, or '' if it cannot be read."""
+    try:
+        field_file.open('rb')
+        try:
+            return dhash(field_file)
+        finally:
+            field_file.seek(0)
+    except Exception:
+        return ''
+
+
+def distance(first, second):
+    """Return how many bits two hashes differ in."""
+    return bin(first ^ second).count('1')
+
+
+def max_distance():
+    """Return the largest distance still counted as a near duplicate."""
+    return getattr(settings, 'IMAGER_DUPLICATE_DISTANCE', 6)
+
+
+class BKTree(object):
+    """A Burkhard-Keller tree of hashes under the Hamming distance.
+
+    Each node keeps its children by their distance to it, so a search
+    within d of a hash only descends into children whose distance is
+    within d of the hash's own distance to the node.
+    """
+
+    def __init__(self):
+        """Start empty."""
+        self.root = None
+
+    def add(self, value, item):
+        """File item under the hash value."""
+        if self.root is None:
+            self.root = [value, set([item]), {}]
+            return
+        node = self.root
+        while True:
+            gap = distance(value, node[0])
+            if gap == 0:
+                node[1].add(item)
+                return
+            child = node[2].get(gap)
+            if child is None:
+                node[2][gap] = [value, set([item]), {}]
+                return
+            node = child
+
+    def discard(self, value, item):
+        """Remove item from under the hash value, keeping the node."""
+        node = self.root
+        while node is not None:
+            gap = distance(value, node[0])
+            if gap == 0:
+                node[1].discard(item)
+                return
+            node = node[2].get(gap)
+
+    def search(self, value, within):
+        """Return (distance, item) for every item within the distance."""
+        found = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node = pending.pop()
+            gap = distance(value, node[0])
+            if gap <= within:
+                found.extend((gap, item) for item in node[1])
+            for child_gap, child in node[2].items():
+                if gap - within <= child_gap <= gap + within:
+                    pending.append(child)
+        return sorted(found, key=lambda pair: pair[0])
+
+
+class DuplicateIndex(object):
+    """An in-process BK-tree over the hash of every photo.
+
+    Items are (photo id, owner id) pairs. The tree is loaded lazily,
+    reloaded every IMAGER_DUPLICATE_INDEX_REFRESH seconds to pick up
+    photos added by other processes, and kept current in between by the
+    Photo save/delete receivers.
+    """
+
+    def __init__(self):
+        """Start with an unloaded tree."""
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        self._loaded_at = None
+
+    def add(self, photo):
+        """Index a photo's hash."""
+        with self._lock:
+            if self._loaded_at is not None and photo.phash:
+                self._tree.add(int(photo.phash, 16), (photo.id, photo.owner_id))
+
+    def discard(self, photo):
+        """Stop finding a photo."""
+        with self._lock:
+            if self._loaded_at is not None and photo.phash:
+                self._tree.discard(int(photo.phash, 16), (photo.id, photo.owner_id))
+
+    def clear(self):
+        """Forget the tree so the next search reloads it."""
+        with self._lock:
+            self._tree = BKTree()
+            self._loaded_at = None
+
+    def search(self, phash, owner_id=None, within=None):
+        """Return (distance, photo id) for photos near the hash, closest first."""
+        if not phash:
+            return []
+        self._refresh_if_stale()
+        within = max_distance() if within is None else within
+        with self._lock:
+            found = self._tree.search(int(phash, 16), within)
+        return [(gap, photo_id) for gap, (photo_id, photo_owner_id) in found
+                if owner_id is None or photo_owner_id == owner_id]
+
+    def _refresh_if_stale(self):
+        """Reload the tree from the database if it is missing or old."""
+        from imager_images.models import Photo
+
+        refresh = getattr(settings, 'IMAGER_DUPLICATE_INDEX_REFRESH', 600)
+        if self._loaded_at is not None and time.time() - self._loaded_at < refresh:
+            return
+        tree = BKTree()
+        rows = Photo.objects.exclude(phash='').values_list('id', 'owner_id', 'phash')
+        for photo_id, owner_id, phash in rows.iterator():
+            tree.add(int(phash, 16), (photo_id, owner_id))
+        with self._lock:
+            self._tree = tree
+            self._loaded_at = time.time()
+
+
+index = DuplicateIndex()
+
+
+def near_duplicates(photo, within=None):
+    """Return the owner's other photos that look like photo, closest first."""
+    from imager_images.models import Photo
+
+    ids = [photo_id for gap, photo_id in index.search(photo.phash, photo.owner_id, within)
+           if photo_id != photo.id]
+    found = Photo.objects.in_bulk(ids)
+    return [found[photo_id] for photo_id in ids if photo_id in found]
+
+
+def duplicate_groups(photos, within=None):
+    """Group photos whose hashes are near each other.
+
+    Returns lists of two or more photos, each list closest-first from the
+    photo it was found from.
+    """
+    tree = BKTree()
+    by_id = {}
+    for photo in photos:
+        if photo.phash:
+            tree.add(int(photo.phash, 16), photo.id)
+            by_id[photo.id] = photo
+    within = max_distance() if within is None else within
+    grouped = set()
+    groups = []
+    for photo_id in sorted(by_id):
+        if photo_id in grouped:
+            continue
+        near = [other for gap, other in tree.search(int(by_id[photo_id].phash, 16), within)
+                if other not in grouped]
+        if len(near) > 1:
+            grouped.update(near)
+            groups.append([by_id[other] for other in near])
+    return groups
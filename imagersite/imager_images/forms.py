@@ -1,37 +1,102 @@
 """Create album/upload photo forms."""
-from imager_images.models import Album, Photo
-from django import forms
-
+import zipfile
 
-class AddAlbumForm(forms.ModelForm):
-    """Form to add new album."""
+from imager_images.membership import change_photos, owned
+from imager_images.models import Album, Photo, UploadSession
+from django import forms
+from taggit.forms import TagField
+
+# Filled in from the image file by imager_images.metadata.
+PHOTO_METADATA_FIELDS = [
+    'width',
+    'height',
+    'file_size',
+    'mime_type',
+    'orientation',
+    'camera_model',
+    'lens_model',
+    'taken_at',
+    'phash',
+]
+
+
+class PhotoIdsField(forms.Field):
+    """A comma separated list of photo ids."""
+
+    widget = forms.HiddenInput
+
+    def to_python(self, value):
+        """Return the ids as a sorted list of distinct integers."""
+        ids = set()
+        for part in (value or '').split(','):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                ids.add(int(part))
+            except ValueError:
+                raise forms.ValidationError('Enter photo ids separated by commas.')
+        return sorted(ids)
+
+
+class AlbumForm(forms.ModelForm):
+    """Album details, with photos added and removed by id.
+
+    Rather than every photo the owner has, the form carries only the ids
+    to add and remove, picked a page at a time from the photo picker.
+    """
+
+    add_photos = PhotoIdsField(required=False)
+    remove_photos = PhotoIdsField(required=False)
 
     class Meta:
-        """Define model and stuff."""
+        """Leave membership to the id lists."""
 
         model = Album
         exclude = [
+            'owner',
+            'photos',
             'date_uploaded',
             'date_modified',
             'date_published',
-            'owner'
         ]
+        widgets = {'cover_photo': forms.HiddenInput}
+
+    def __init__(self, *args, **kwargs):
+        """Limit the photos to those of owner."""
+        self.owner = kwargs.pop('owner')
+        super(AlbumForm, self).__init__(*args, **kwargs)
+        self.fields['cover_photo'].queryset = self.owner.photos.all()
+
+    def clean_add_photos(self):
+        """Refuse photos that belong to someone else."""
+        ids = self.cleaned_data['add_photos']
+        if len(owned(self.owner, ids)) != len(ids):
+            raise forms.ValidationError('You can only add your own photos.')
+        return ids
+
+    def save(self, commit=True):
+        """Save the album and, if committing, apply the photo changes."""
+        album = super(AlbumForm, self).save(commit=commit)
+        if commit:
+            self.save_photos()
+        return album
+
+    def save_photos(self):
+        """Add and remove the photos picked."""
+        change_photos(self.instance, self.cleaned_data['add_photos'], self.cleaned_data['remove_photos'])
+
+
+class AddAlbumForm(AlbumForm):
+    """Form to add new album."""
 
+    pass
 
-class EditAlbumForm(forms.ModelForm):
-    """Form to add new album."""
 
-    class Meta:
-        """Define the model and exclude fields."""
+class EditAlbumForm(AlbumForm):
+    """Form to edit an album."""
 
-        model = Album
-        exclude = [
-            'owner',
-            'date_uploaded',
-            'date_modified',
-            'date_published',
-            'owner'
-        ]
+    pass
 
 
 class AddPhotoForm(forms.ModelForm):
@@ -46,7 +111,7 @@ class AddPhotoForm(forms.ModelForm):
             'date_uploaded',
             'date_modified',
             'date_published',
-        ]
+        ] + PHOTO_METADATA_FIELDS
 
 
 class EditPhotoForm(forms.ModelForm):
@@ -62,4 +127,62 @@ class EditPhotoForm(forms.ModelForm):
             'date_modified',
             'date_published',
             'photo'
-        ]
+        ] + PHOTO_METADATA_FIELDS
+
+
+class BulkUploadForm(forms.Form):
+    """Form to upload many photos, or a zip of them, at once."""
+
+    files = forms.FileField(
+        required=False,
+        widget=forms.ClearableFileInput(attrs={'multiple': True}),
+    )
+    archive = forms.FileField(required=False, help_text='A zip file of photos.')
+    published = forms.ChoiceField(choices=Photo.PUBLISH_CHOICES, initial='PRIVATE')
+    tags = TagField(required=False, help_text='Given to every photo.')
+    album = forms.ModelChoiceField(queryset=Album.objects.none(), required=False)
+
+    def uploaded_files(self):
+        """Return every file sent in the files field."""
+        if not hasattr(self.files, 'getlist'):
+            return []
+        return self.files.getlist(self.add_prefix('files'))
+
+    def clean_archive(self):
+        """Reject archives that are not zip files."""
+        archive = self.cleaned_data.get('archive')
+        if archive and not zipfile.is_zipfile(archive):
+            raise forms.ValidationError('Upload a zip file.')
+        return archive
+
+    def clean(self):
+        """Require at least one file or an archive."""
+        cleaned_data = super(BulkUploadForm, self).clean()
+        if not self.uploaded_files() and not cleaned_data.get('archive'):
+            raise forms.ValidationError('Choose some photos or a zip file to upload.')
+        return cleaned_data
+
+
+class UploadSessionForm(forms.ModelForm):
+    """Form to start a resumable upload."""
+
+    class Meta:
+        """Take what the client announces about the file."""
+
+        model = UploadSession
+        fields = ['filename', 'size', 'title', 'published']
+
+    def clean_filename(self):
+        """Keep only the base name of the file, dropping any client path."""
+        filename = self.cleaned_data['filename'].replace('\\', '/').split('/')[-1].strip()
+        if not filename:
+            raise forms.ValidationError('Give the name of the file.')
+        return filename
+
+    def clean_size(self):
+        """Refuse empty files and files over the limit."""
+        from imager_images.uploads import max_upload_bytes
+        size = self.cleaned_data['size']
+        if size <= 0 or size > max_upload_bytes():
+            raise forms.ValidationError('Uploads must be between 1 and {} bytes.'.format(max_upload_bytes()))
+        return size
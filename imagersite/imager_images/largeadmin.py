@@ -0,0 +1,140 @@
+"""Admin pieces that stay fast when a table holds millions of rows.
+
+The stock admin counts the whole table twice per change list page,
+searches with leading-wildcard LIKEs no index can serve, renders every
+related row into each foreign key <select> and puts every row of an
+inline on the form. These replacements count from the planner's
+statistics, search with lookups an index can answer, and page inlines.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.forms.models import BaseInlineFormSet
+from django.http import QueryDict
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """Return PostgreSQL's estimate of the rows in queryset's table, or None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                       [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return int(row[0]) if row is not None else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """A paginator that takes an unfiltered table's size from statistics.
+
+    Below IMAGER_ADMIN_EXACT_COUNT_LIMIT rows, or once the change list
+    is filtered or searched, the count is exact.
+    """
+
+    def estimate(self):
+        """Return the estimated size of the whole table, or None."""
+        return estimated_count(self.object_list)
+
+    @cached_property
+    def count(self):
+        """Return the estimate for a large unfiltered table, else the exact count."""
+        if not self.object_list.query.where:
+            estimate = self.estimate()
+            if estimate is not None and estimate >= getattr(settings, 'IMAGER_ADMIN_EXACT_COUNT_LIMIT', 100000):
+                return estimate
+        return super(EstimatedCountPaginator, self).count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """A ModelAdmin for tables too big to count or scan.
+
+    search_lookups are ORed together, each applied to the whole search
+    term, and a numeric term also matches the primary key; pick lookups
+    that have an index behind them.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_lookups = ()
+
+    def get_search_fields(self, request):
+        """Show the search box when there are lookups to search with."""
+        return self.search_lookups
+
+    def get_search_results(self, request, queryset, search_term):
+        """Filter by the search lookups instead of icontains over every field."""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = Q()
+        if term.isdigit():
+            condition |= Q(pk=int(term))
+        for lookup in self.search_lookups:
+            condition |= Q(**{lookup: term})
+        return queryset.filter(condition), False
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """An inline formset holding one page of the related rows."""
+
+    per_page = 20
+    page_param = 'inline_page'
+    page_number = 1
+    query = QueryDict()
+
+    def get_queryset(self):
+        """Return the rows on the requested page, or on the last one."""
+        if not hasattr(self, '_page'):
+            self.paginator = Paginator(super(PaginatedInlineFormSet, self).get_queryset(), self.per_page)
+            try:
+                self._page = self.paginator.page(self.page_number)
+            except InvalidPage:
+                self._page = self.paginator.page(self.paginator.num_pages)
+        return self._page.object_list
+
+    @property
+    def page(self):
+        """Return the page being edited."""
+        self.get_queryset()
+        return self._page
+
+    def page_query(self, number):
+        """Return the change form's query string for another page."""
+        query = self.query.copy()
+        query[self.page_param] = number
+        return query.urlencode()
+
+    @property
+    def previous_page_query(self):
+        """Return the query string of the page before."""
+        return self.page_query(self.page.previous_page_number())
+
+    @property
+    def next_page_query(self):
+        """Return the query string of the page after."""
+        return self.page_query(self.page.next_page_number())
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """A tabular inline that edits per_page related rows at a time."""
+
+    formset = PaginatedInlineFormSet
+    template = 'admin/edit_inline/paginated_tabular.html'
+    per_page = 20
+    page_param = 'inline_page'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        """Point the formset at the page named in the query string."""
+        formset = super(PaginatedTabularInline, self).get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.page_param = self.page_param
+        formset.query = request.GET
+        try:
+            formset.page_number = int(request.GET.get(self.page_param, 1))
+        except ValueError:
+            formset.page_number = 1
+        return formset
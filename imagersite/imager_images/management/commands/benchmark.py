@@ -0,0 +1,61 @@
+"""Measure every named page and write a report to compare releases with."""
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from imager_images import benchmark
+
+
+class Command(BaseCommand):
+    """Request each page repeatedly and report latency, queries and size."""
+
+    help = 'Benchmark the named URLs and write a JSON report.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('names', nargs='*',
+                            help='Only benchmark these URL names.')
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Timed requests per URL.')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Untimed requests per URL first.')
+        parser.add_argument('--user', default=None,
+                            help='Username to sign in as; anonymous by default.')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the cache before every request.')
+        parser.add_argument('--host', default=None,
+                            help='Host header to send; one of ALLOWED_HOSTS by default.')
+        parser.add_argument('--output', default=None,
+                            help='File to write the report to instead of stdout.')
+        parser.add_argument('--compare', default=None,
+                            help='An earlier report to show p95 changes against.')
+
+    def handle(self, *args, **options):
+        """Run the benchmark and write the report."""
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('--requests must be at least 1 and --warmup at least 0.')
+        unknown = set(options['names']) - set(benchmark.url_names())
+        if unknown:
+            raise CommandError('Unknown URL names: {}.'.format(', '.join(sorted(unknown))))
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get_by_natural_key(options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError('No user named {}.'.format(options['user']))
+        report = benchmark.run(user, options['names'] or None, requests=options['requests'],
+                               warmup=options['warmup'], cold=options['cold'], host=options['host'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(benchmark.dumps(report) + '\n')
+        else:
+            self.stdout.write(benchmark.dumps(report))
+        for name, reason in sorted(report['skipped'].items()):
+            self.stderr.write('Skipped {}: {}.'.format(name, reason))
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                rows = benchmark.compare(json.load(baseline), report)
+            for name, before, after, change in rows:
+                self.stderr.write('{:<20} p95 {:>9.1f} ms -> {:>9.1f} ms {}'.format(
+                    name, before, after, '' if change is None else '{:+.0f}%'.format(change)))
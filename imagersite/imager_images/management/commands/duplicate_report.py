@@ -0,0 +1,35 @@
+"""Report the near-duplicate photos in each user's library."""
+from django.core.management.base import BaseCommand
+
+from imager_images.duplicates import duplicate_groups, hash_field_file
+from imager_images.models import Photo
+from imager_profile.models import ImagerProfile
+
+
+class Command(BaseCommand):
+    """List groups of photos that look alike, per profile."""
+
+    help = 'Report near-duplicate photos for each profile, or for the given usernames.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('usernames', nargs='*', help='Only report these users.')
+        parser.add_argument('--distance', type=int, default=None,
+                            help='Most differing hash bits still counted as a duplicate.')
+
+    def handle(self, *args, **options):
+        """Hash any unhashed photos, then print each profile's groups."""
+        profiles = ImagerProfile.objects.select_related('user').order_by('user__username')
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+        for profile in profiles.iterator():
+            for photo in profile.photos.filter(phash='').exclude(photo='').iterator():
+                Photo.objects.filter(pk=photo.pk).update(phash=hash_field_file(photo.photo))
+            photos = profile.photos.exclude(phash='').only('id', 'title', 'phash', 'photo')
+            groups = duplicate_groups(photos, options['distance'])
+            if not groups:
+                continue
+            self.stdout.write('{} ({} groups)'.format(profile.user.username, len(groups)))
+            for group in groups:
+                self.stdout.write('  ' + ', '.join(
+                    '#{} {} ({})'.format(photo.id, photo.title, photo.photo.name) for photo in group))
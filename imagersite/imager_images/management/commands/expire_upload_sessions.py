@@ -0,0 +1,14 @@
+"""Delete resumable uploads that were abandoned."""
+from django.core.management.base import BaseCommand
+
+from imager_images.uploads import expire_sessions
+
+
+class Command(BaseCommand):
+    """Expire idle upload sessions; meant to be run from cron."""
+
+    help = 'Delete upload sessions idle for longer than IMAGER_UPLOAD_SESSION_TTL.'
+
+    def handle(self, *args, **options):
+        """Expire the sessions and report how many went."""
+        self.stdout.write('Expired {} upload sessions.'.format(expire_sessions()))
@@ -0,0 +1,28 @@
+"""Backfill the metadata columns of existing photos."""
+from django.core.management.base import BaseCommand
+
+from imager_images.metadata import backfill
+from imager_images.models import Photo
+
+
+class Command(BaseCommand):
+    """Read dimensions, size, type and EXIF fields into the photo table."""
+
+    help = 'Extract metadata for photos that have none, in parallel batches.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes; defaults to IMAGER_METADATA_WORKERS.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Photos read from the database at a time.')
+        parser.add_argument('--force', action='store_true',
+                            help='Extract again for photos that already have metadata.')
+
+    def handle(self, *args, **options):
+        """Extract the metadata and report how many photos were updated."""
+        photos = Photo.objects.exclude(photo='')
+        if not options['force']:
+            photos = photos.filter(width__isnull=True)
+        updated = backfill(photos, workers=options['workers'], batch_size=options['batch_size'])
+        self.stdout.write('Extracted metadata for {} photos.'.format(updated))
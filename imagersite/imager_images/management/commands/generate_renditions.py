@@ -0,0 +1,31 @@
+"""Backfill the fixed-size renditions of existing photos."""
+from django.core.management.base import BaseCommand
+
+from imager_images.models import Photo
+from imager_images.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    """Write the renditions of every photo that is missing some."""
+
+    help = 'Generate missing photo renditions.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate renditions that already exist.')
+
+    def handle(self, *args, **options):
+        """Walk every photo and generate its renditions."""
+        photos = Photo.objects.exclude(photo='').only('id', 'photo').order_by('id')
+        done = failed = 0
+        for photo in photos.iterator():
+            try:
+                written = generate_renditions(photo.photo, force=options['force'])
+            except (IOError, OSError) as e:
+                failed += 1
+                self.stderr.write('Photo {}: {}'.format(photo.id, e))
+                continue
+            if written:
+                done += 1
+        self.stdout.write('Generated renditions for {} photos, {} failed.'.format(done, failed))
@@ -0,0 +1,22 @@
+"""Rebuild the full-text search vectors of photos and albums."""
+from django.core.management.base import BaseCommand
+
+from imager_images import search
+from imager_images.models import Album, Photo
+
+
+class Command(BaseCommand):
+    """Recompute every photo's and album's search text."""
+
+    help = 'Rebuild the search vectors of all photos and albums.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows read from the database at a time.')
+
+    def handle(self, *args, **options):
+        """Reindex and report how many rows were indexed."""
+        photos = search.reindex(Photo.objects.all(), batch_size=options['batch_size'])
+        albums = search.reindex(Album.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write('Indexed {} photos and {} albums.'.format(photos, albums))
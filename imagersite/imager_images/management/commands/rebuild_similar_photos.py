@@ -0,0 +1,21 @@
+"""Rebuild the similar photos index from the photo tags."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from imager_images.models import Photo
+from imager_images.similarity import rebuild_similar_photos
+
+
+class Command(BaseCommand):
+    """Recompute every photo's list of similar photos."""
+
+    help = 'Rebuild the precomputed similar photos index.'
+
+    def handle(self, *args, **options):
+        """Rebuild the list of each photo in turn."""
+        count = 0
+        for photo_id in Photo.objects.order_by('id').values_list('id', flat=True).iterator():
+            with transaction.atomic():
+                rebuild_similar_photos(photo_id)
+            count += 1
+        self.stdout.write('Rebuilt similar photos for {} photos.'.format(count))
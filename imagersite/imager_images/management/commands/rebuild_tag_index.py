@@ -0,0 +1,17 @@
+"""Rebuild the public tag index and tag counts."""
+from django.core.management.base import BaseCommand
+
+from imager_images import tagindex
+from imager_images.models import PublicTaggedPhoto, TagCount
+
+
+class Command(BaseCommand):
+    """Recreate the tag index from the tagging tables."""
+
+    help = 'Rebuild the public photo tag index and counts.'
+
+    def handle(self, *args, **options):
+        """Drop and refill the index."""
+        tagindex.rebuild()
+        self.stdout.write('Indexed {} tag entries over {} tags.'.format(
+            PublicTaggedPhoto.objects.count(), TagCount.objects.count()))
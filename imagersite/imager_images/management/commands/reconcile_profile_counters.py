@@ -0,0 +1,26 @@
+"""Recompute the photo, album, byte and tag counters on profiles."""
+from django.core.management.base import BaseCommand
+
+from imager_images.profilestats import reconcile
+from imager_profile.models import ImagerProfile
+
+
+class Command(BaseCommand):
+    """Bring profile counters back in line with the photo and album tables."""
+
+    help = 'Recompute profile counters, for every profile or the named users.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('usernames', nargs='*',
+                            help='Only reconcile these users.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Profiles locked and recomputed at a time.')
+
+    def handle(self, *args, **options):
+        """Reconcile and report how many profiles were corrected."""
+        profiles = ImagerProfile.objects.all()
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+        corrected = reconcile(profiles, batch_size=options['batch_size'])
+        self.stdout.write('Corrected the counters of {} profiles.'.format(corrected))
@@ -0,0 +1,78 @@
+"""Move existing photo files into the content-addressed layout."""
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from imager_images.cache import bump, tag_namespace
+from imager_images.models import Photo, TagCount
+from imager_images.renditions import generate_renditions, rendition_name, rendition_specs
+from imager_images.storage import is_addressed
+
+
+class Command(BaseCommand):
+    """Copy each flat-named photo to its content address and repoint the row.
+
+    Rows are walked by id in batches and each row is switched with a
+    conditional update, so the site keeps serving while this runs and a
+    photo replaced in the meantime is left alone. Media is served by the
+    name stored on the row, so once a row is switched its old urls are
+    gone whether or not the old file is; cached pages are retired so
+    none keep linking to them. Old files are kept, to check or undo the
+    move by hand, unless --delete-old is given.
+    """
+
+    help = 'Relocate photo files to content-addressed, sharded names.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Photos read from the database at a time.')
+        parser.add_argument('--delete-old', action='store_true',
+                            help='Delete the old files once no photo uses them.')
+
+    def handle(self, *args, **options):
+        """Relocate every photo that is not yet content addressed."""
+        storage = Photo._meta.get_field('photo').storage
+        moved = missing = 0
+        last_id = 0
+        while True:
+            batch = list(Photo.objects.filter(id__gt=last_id).exclude(photo='')
+                         .order_by('id').values_list('id', 'photo')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            for photo_id, old_name in batch:
+                if is_addressed(old_name):
+                    continue
+                if not storage.exists(old_name):
+                    missing += 1
+                    self.stderr.write('Photo {} is missing its file {}.'.format(photo_id, old_name))
+                    continue
+                new_name = self.relocate(storage, old_name)
+                if not Photo.objects.filter(pk=photo_id, photo=old_name).update(photo=new_name):
+                    continue
+                moved += 1
+                if options['delete_old'] and not Photo.objects.filter(photo=old_name).exists():
+                    self.delete(storage, old_name)
+        if moved:
+            # Cached pages link to the old names.
+            bump('photos', 'albums', *[tag_namespace(slug) for slug in
+                                       TagCount.objects.values_list('tag__slug', flat=True)])
+        self.stdout.write('Relocated {} photos; {} files missing.'.format(moved, missing))
+
+    def relocate(self, storage, old_name):
+        """Copy a file and its renditions to the content address and return it."""
+        with storage.open(old_name, 'rb') as original:
+            new_name = storage.save(old_name, File(original, old_name))
+        for rendition in rendition_specs():
+            old_rendition = rendition_name(old_name, rendition)
+            if storage.exists(old_rendition):
+                with storage.open(old_rendition, 'rb') as rendered:
+                    storage.save(rendition_name(new_name, rendition), File(rendered))
+        generate_renditions(Photo(photo=new_name).photo)
+        return new_name
+
+    def delete(self, storage, old_name):
+        """Remove an old file and its renditions."""
+        storage.delete(old_name)
+        for rendition in rendition_specs():
+            storage.delete(rendition_name(old_name, rendition))
@@ -0,0 +1,57 @@
+"""Fill the database with synthetic users, photos and albums for benchmarking."""
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from imager_images import seeding
+from imager_images.duplicates import index
+from imager_images.sampling import sampler
+
+
+class Command(BaseCommand):
+    """Bulk insert realistic volumes of data, then rebuild the derived tables."""
+
+    help = 'Seed synthetic users, photos, tags and albums in bulk.'
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Users to create, each with a profile.')
+        parser.add_argument('--photos', type=int, default=100000,
+                            help='Photos to spread over the new users.')
+        parser.add_argument('--albums', type=int, default=5000,
+                            help='Albums to make from the new photos.')
+        parser.add_argument('--tags', type=int, default=len(seeding.WORDS),
+                            help='Distinct tags, used along a Zipf curve.')
+        parser.add_argument('--images', type=int, default=20,
+                            help='Distinct JPEGs the photos point at.')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed, to make the same data again.')
+        parser.add_argument('--prefix', default='seed',
+                            help='Start of the new usernames.')
+        parser.add_argument('--batch-size', type=int, default=seeding.BATCH_SIZE,
+                            help='Photos built and inserted per transaction.')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Leave the tag index, similar photos, search '
+                                 'vectors and profile counters to be rebuilt later.')
+
+    def handle(self, *args, **options):
+        """Seed, rebuild and report what was made."""
+        if min(options['users'], options['photos'], options['albums'], options['tags']) < 0:
+            raise CommandError('Counts cannot be negative.')
+        if options['images'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--images and --batch-size must be at least 1.')
+        made = seeding.seed(options['users'], options['photos'], options['albums'],
+                            tags=options['tags'], images=options['images'], seed=options['seed'],
+                            prefix=options['prefix'], batch_size=options['batch_size'])
+        self.stdout.write('Created {users} users, {photos} photos from {images} images '
+                          'and {albums} albums holding {memberships} photos.'.format(**made))
+        if options['skip_rebuild']:
+            return
+        for name in ('rebuild_tag_index', 'rebuild_similar_photos',
+                     'rebuild_search_index', 'reconcile_profile_counters'):
+            call_command(name, stdout=self.stdout, stderr=self.stderr)
+        # The bulk inserts bypassed the receivers that keep these current.
+        index.clear()
+        sampler.clear()
+        cache.clear()
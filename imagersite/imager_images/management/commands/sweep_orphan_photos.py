@@ -0,0 +1,14 @@
+"""Delete stored photo files that no photo points at."""
+from django.core.management.base import BaseCommand
+
+from imager_images.bulkupload import sweep_orphans
+
+
+class Command(BaseCommand):
+    """Sweep orphaned originals; meant to be run from cron."""
+
+    help = 'Delete stored originals no photo has pointed at for IMAGER_ORPHAN_FILE_GRACE.'
+
+    def handle(self, *args, **options):
+        """Sweep the files and report how many went."""
+        self.stdout.write('Deleted {} orphaned files.'.format(sweep_orphans()))
@@ -0,0 +1,145 @@
+"""Access-checked delivery of photo files and their renditions."""
+import calendar
+import mimetypes
+import re
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from imager_images.models import Photo
+from imager_images.renditions import rendition_specs
+from imager_images.storage import is_addressed
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def photos_for_path(path):
+    """Return the photos whose original or a rendition is stored at path."""
+    query = Q(photo=path)
+    for rendition in rendition_specs():
+        suffix = '.{}.jpg'.format(rendition)
+        if path.endswith(suffix):
+            query |= Q(photo__startswith=path[:-len(suffix)] + '.')
+    return Photo.objects.filter(query).select_related('owner__user')
+
+
+def visible_photo(path, user):
+    """Return a photo stored at path that user may see, or None.
+
+    Identical files are stored once, so several photos can share a path;
+    any one of them being visible is enough.
+    """
+    for photo in photos_for_path(path):
+        if photo.is_visible_to(user):
+            return photo
+    return None
+
+
+def accel_prefix():
+    """Return the internal location the front proxy serves media from, if any."""
+    return getattr(settings, 'IMAGER_MEDIA_ACCEL_PREFIX', None)
+
+
+def file_etag(path, size, modified):
+    """Return an ETag for a stored file.
+
+    Content-addressed names already say what the bytes are.
+    """
+    if is_addressed(path):
+        return path.replace('/', '')
+    return '{:x}-{:x}'.format(int(modified), size)
+
+
+def parse_range(header, size):
+    """Return (start, end) of a single byte range, None for the whole file.
+
+    Raises ValueError if the range cannot be satisfied.
+    """
+    match = RANGE.match(header or '')
+    if not match or not size:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def _read_range(opened, start, length):
+    """Yield length bytes of an open file from start, a block at a time."""
+    try:
+        opened.seek(start)
+        while length > 0:
+            block = opened.read(min(CHUNK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        opened.close()
+
+
+def cache_control(photo):
+    """Return the Cache-Control value for a photo's files."""
+    if photo.published == 'PUBLIC':
+        return 'public, max-age={}'.format(getattr(settings, 'IMAGER_MEDIA_MAX_AGE', 86400))
+    return 'private, max-age=0, must-revalidate'
+
+
+def serve(request, path, photo):
+    """Return a response delivering the file at path.
+
+    With a front proxy configured, the response only names the file in
+    X-Accel-Redirect and the proxy sends the bytes, handling ranges and
+    validators itself. Otherwise the file is streamed from storage,
+    honouring Range, If-Range, If-None-Match and If-Modified-Since.
+    """
+    storage = photo.photo.storage
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    prefix = accel_prefix()
+    if prefix:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + path
+        response['Cache-Control'] = cache_control(photo)
+        return response
+    if not storage.exists(path):
+        return None
+    size = storage.size(path)
+    timestamp = calendar.timegm(storage.get_modified_time(path).utctimetuple())
+    etag = file_etag(path, size, timestamp)
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if not if_range or if_range in (quote_etag(etag), http_date(timestamp)):
+            try:
+                byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+            except ValueError:
+                response = HttpResponse(status=416, content_type=content_type)
+                response['Content-Range'] = 'bytes */{}'.format(size)
+                return response
+        opened = storage.open(path, 'rb')
+        if byte_range is None:
+            response = FileResponse(opened, content_type=content_type)
+            response['Content-Length'] = size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(opened, start, end - start + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+            response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(timestamp)
+    response['Cache-Control'] = cache_control(photo)
+    return response
@@ -0,0 +1,73 @@
+"""Album membership changed by the photos added and removed, not the whole set.
+
+Assigning album.photos rewrites the set from a full list of ids, which
+for a large library means sending, validating and diffing every photo
+the album holds. Here the client sends only what changed, and the rows
+are inserted and deleted in batches on the through table. m2m_changed is
+sent as album.photos.add() and remove() would, so the cache and
+conditional GET receivers see the change.
+"""
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed
+
+from imager_images.models import Album, Photo
+
+BATCH_SIZE = 500
+
+
+def batches(ids, size=BATCH_SIZE):
+    """Yield ids in sorted lists of at most size."""
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def owned(owner, ids):
+    """Return which of the photo ids belong to owner."""
+    found = set()
+    for batch in batches(ids):
+        found.update(owner.photos.filter(pk__in=batch).values_list('id', flat=True))
+    return found
+
+
+def members(album, ids):
+    """Return which of the photo ids are in the album."""
+    Membership = Album.photos.through
+    found = set()
+    for batch in batches(ids):
+        found.update(Membership.objects.filter(album_id=album.pk, photo_id__in=batch)
+                     .values_list('photo_id', flat=True))
+    return found
+
+
+def _send(album, action, pk_set):
+    """Tell the receivers about a change to the album's photos."""
+    m2m_changed.send(sender=Album.photos.through, action=action, instance=album,
+                     reverse=False, model=Photo, pk_set=pk_set,
+                     using=router.db_for_write(Album.photos.through, instance=album))
+
+
+def change_photos(album, add=(), remove=()):
+    """Add and remove photos of a saved album by id.
+
+    Ids already in or already out of the album are skipped; a photo in
+    both lists is removed. Returns the sets of ids added and removed.
+    """
+    Membership = Album.photos.through
+    remove = set(remove)
+    add = set(add) - remove
+    with transaction.atomic():
+        added = add - members(album, add)
+        removed = members(album, remove)
+        if added:
+            _send(album, 'pre_add', added)
+            for batch in batches(added):
+                Membership.objects.bulk_create([Membership(album_id=album.pk, photo_id=photo_id)
+                                                for photo_id in batch])
+            _send(album, 'post_add', added)
+        if removed:
+            _send(album, 'pre_remove', removed)
+            for batch in batches(removed):
+                Membership.objects.filter(album_id=album.pk, photo_id__in=batch).delete()
+            _send(album, 'post_remove', removed)
+    return added, removed
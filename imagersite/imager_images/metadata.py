@@ -0,0 +1,188 @@
+"""Image metadata read off the request path into indexed photo columns."""
+import multiprocessing
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.utils import six, timezone
+from PIL import Image
+
+from imager_images.models import Photo
+
+# EXIF tag numbers of the fields kept on the photo.
+EXIF_ORIENTATION = 274
+EXIF_MODEL = 272
+EXIF_LENS_MODEL = 42036
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = None
+
+
+def metadata_workers():
+    """Return how many processes extract metadata; 0 extracts inline."""
+    return getattr(settings, 'IMAGER_METADATA_WORKERS', 2)
+
+
+def metadata_queue_limit():
+    """Return how many extractions may wait for a worker at once."""
+    return getattr(settings, 'IMAGER_METADATA_QUEUE_LIMIT', 100)
+
+
+def _text(value, length):
+    """Return an EXIF string value cleaned up for a CharField."""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', 'replace')
+    if not isinstance(value, six.text_type):
+        return ''
+    return value.strip('\x00 ').strip()[:length]
+
+
+def _taken_at(value):
+    """Return an EXIF date as an aware datetime, or None."""
+    try:
+        taken = datetime.strptime(_text(value, 19), EXIF_DATE_FORMAT)
+    except ValueError:
+        return None
+    return timezone.make_aware(taken) if settings.USE_TZ else taken
+
+
+def exif_fields(exif):
+    """Return the photo columns found in an EXIF dictionary."""
+    orientation = exif.get(EXIF_ORIENTATION)
+    return {
+        'orientation': orientation if orientation in range(1, 9) else None,
+        'camera_model': _text(exif.get(EXIF_MODEL), 128),
+        'lens_model': _text(exif.get(EXIF_LENS_MODEL), 128),
+        'taken_at': _taken_at(exif.get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)),
+    }
+
+
+def extract(image_file):
+    """Return the metadata columns of an open image file.
+
+    Only the header is parsed; the pixels are never decoded.
+    """
+    image = Image.open(image_file)
+    fields = {
+        'width': image.size[0],
+        'height': image.size[1],
+        'mime_type': Image.MIME.get(image.format, ''),
+    }
+    try:
+        exif = image._getexif() or {}
+    except Exception:
+        exif = {}
+    fields.update(exif_fields(exif))
+    return fields
+
+
+def read_metadata(job):
+    """Return (photo id, columns) for a (photo id, file name) job.
+
+    Runs in the worker processes, so it touches the storage only, never
+    the database. Columns are None if the file cannot be read.
+    """
+    photo_id, name = job
+    storage = Photo._meta.get_field('photo').storage
+    try:
+        with storage.open(name, 'rb') as image_file:
+            fields = extract(image_file)
+        fields['file_size'] = storage.size(name)
+    except Exception:
+        fields = None
+    return photo_id, fields
+
+
+def store_metadata(result):
+    """Write the columns read by read_metadata onto the photo."""
+    photo_id, fields = result
+    if fields:
+        # update() rather than save(), so no post_save fires to start the
+        # extraction over or expire cached pages.
+        Photo.objects.filter(pk=photo_id).update(**fields)
+
+
+def _init_worker():
+    """Make Django usable in worker processes that were spawned, not forked."""
+    import django
+    django.setup()
+
+
+def get_pool():
+    """Return the shared worker pool, starting it on first use."""
+    global _pool, _pending
+    with _pool_lock:
+        if _pool is None:
+            _pending = threading.BoundedSemaphore(metadata_queue_limit())
+            _pool = multiprocessing.Pool(metadata_workers(), initializer=_init_worker,
+                                         maxtasksperchild=100)
+    return _pool
+
+
+def _stored_in_background(result):
+    """Store a worker's result from the pool's result thread."""
+    try:
+        store_metadata(result)
+    finally:
+        _pending.release()
+        connection.close()
+
+
+def schedule(photo_id, name):
+    """Have the metadata of one photo extracted off the request path.
+
+    Returns False if the queue is full; the photo is then left for the
+    extract_photo_metadata command to pick up.
+    """
+    if not name:
+        return False
+    if not metadata_workers():
+        store_metadata(read_metadata((photo_id, name)))
+        return True
+    pool = get_pool()
+    if not _pending.acquire(False):
+        return False
+    pool.apply_async(read_metadata, ((photo_id, name),), callback=_stored_in_background)
+    return True
+
+
+def backfill(photos, workers=None, batch_size=100):
+    """Extract the metadata of many photos in parallel batches.
+
+    Returns how many photos were updated.
+    """
+    workers = metadata_workers() if workers is None else workers
+    pool = multiprocessing.Pool(workers, initializer=_init_worker) if workers else None
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            # Walk by id rather than holding a cursor open over rows that
+            # are being updated underneath it.
+            batch = list(photos.filter(id__gt=last_id).order_by('id')
+                         .values_list('id', 'photo')[:batch_size])
+            if not batch:
+                break
+            updated += _backfill_batch(pool, batch)
+            last_id = batch[-1][0]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return updated
+
+
+def _backfill_batch(pool, batch):
+    """Extract one batch, in the pool if there is one, and store it."""
+    results = pool.imap_unordered(read_metadata, batch) if pool else map(read_metadata, batch)
+    updated = 0
+    for result in results:
+        if result[1]:
+            store_metadata(result)
+            updated += 1
+    return updated
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imager_images', '0005_auto_20170206_1658'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarPhoto',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shared_tags', models.PositiveIntegerField()),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='imager_images.Photo')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='imager_images.Photo')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='similarphoto',
+            unique_together=set([('photo', 'similar')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='similarphoto',
+            index_together=set([('photo', 'shared_tags')]),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_public_photos(apps, schema_editor):
+    """Fill the tag index and counts from the existing tags."""
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Photo = apps.get_model('imager_images', 'Photo')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    PublicTaggedPhoto = apps.get_model('imager_images', 'PublicTaggedPhoto')
+    TagCount = apps.get_model('imager_images', 'TagCount')
+    try:
+        content_type = ContentType.objects.get(app_label='imager_images', model='photo')
+    except ContentType.DoesNotExist:
+        return
+    uploaded = dict(Photo.objects.filter(published='PUBLIC').values_list('id', 'date_uploaded'))
+    counts = {}
+    entries = []
+    tagged = TaggedItem.objects.filter(content_type=content_type).values_list('tag_id', 'object_id')
+    for tag_id, photo_id in tagged.iterator():
+        if photo_id in uploaded:
+            entries.append(PublicTaggedPhoto(tag_id=tag_id, photo_id=photo_id,
+                                             date_uploaded=uploaded[photo_id]))
+            counts[tag_id] = counts.get(tag_id, 0) + 1
+    PublicTaggedPhoto.objects.bulk_create(entries, batch_size=1000)
+    TagCount.objects.bulk_create([TagCount(tag_id=tag_id, public_photos=count)
+                                  for tag_id, count in counts.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0002_auto_20150616_2121'),
+        ('imager_images', '0006_similarphoto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublicTaggedPhoto',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_uploaded', models.DateTimeField()),
+                ('photo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='public_tag_entries', to='imager_images.Photo')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='public_count', serialize=False, to='taggit.Tag')),
+                ('public_photos', models.PositiveIntegerField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='publictaggedphoto',
+            name='tag',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='taggit.Tag'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='publictaggedphoto',
+            unique_together=set([('tag', 'photo')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='publictaggedphoto',
+            index_together=set([('tag', 'date_uploaded', 'photo')]),
+        ),
+        migrations.RunPython(index_public_photos, migrations.RunPython.noop),
+    ]
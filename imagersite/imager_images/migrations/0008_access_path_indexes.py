@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:15
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imager_profile', '0001_initial'),
+        ('imager_images', '0007_tag_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='album',
+            index_together=set([('published', 'date_uploaded', 'id'), ('owner', 'date_uploaded'), ('published', 'date_published')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='photo',
+            index_together=set([('published', 'date_uploaded', 'id'), ('owner', 'date_uploaded'), ('published', 'date_published')]),
+        ),
+        migrations.RunSQL(
+            ['CREATE INDEX imager_images_album_photos_photo_album '
+             'ON imager_images_album_photos (photo_id, album_id)'],
+            ['DROP INDEX imager_images_album_photos_photo_album'],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imager_images', '0010_photo_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='phash',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import imager_images.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imager_images', '0012_content_addressed_photos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photo',
+            name='photo',
+            field=models.ImageField(db_index=True, storage=imager_images.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
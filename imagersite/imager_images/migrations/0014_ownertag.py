@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taggit', '0002_auto_20150616_2121'),
+        ('imager_profile', '0002_profile_counters'),
+        ('imager_images', '0013_index_photo_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OwnerTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('photos', models.PositiveIntegerField(default=0)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_uses', to='imager_profile.ImagerProfile')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='taggit.Tag')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='ownertag',
+            unique_together=set([('owner', 'tag')]),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:53
+from __future__ import unicode_literals
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEXES = [
+    ('imager_images_photo_search_vector', 'imager_images_photo'),
+    ('imager_images_album_search_vector', 'imager_images_album'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    """Index the vectors with GIN where the database has text search."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in SEARCH_INDEXES:
+        schema_editor.execute('CREATE INDEX {} ON {} USING gin (search_vector)'.format(name, table))
+
+
+def drop_search_indexes(apps, schema_editor):
+    """Drop the GIN indexes."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in SEARCH_INDEXES:
+        schema_editor.execute('DROP INDEX {}'.format(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imager_images', '0014_ownertag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 18:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imager_images', '0015_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='album',
+            name='title',
+            field=models.CharField(db_index=True, max_length=128),
+        ),
+        migrations.AlterField(
+            model_name='photo',
+            name='title',
+            field=models.CharField(db_index=True, max_length=128),
+        ),
+    ]
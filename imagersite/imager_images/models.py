@@ -1,8 +1,25 @@
 """Models for the imager_images app."""
+import os
+import uuid
 
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.signals import (
+    pre_save,
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 from imager_profile.models import ImagerProfile
+from imager_images.renditions import Renditions, generate_renditions
+from imager_images.storage import photo_storage
 
 
 class PublicPhotosManger(models.Manager):
@@ -13,7 +30,31 @@ class PublicPhotosManger(models.Manager):
         return super(PublicPhotosManger, self).get_queryset().filter(published="PUBLIC")
 
 
-class Photo(models.Model):
+class Shareable(object):
+    """Access checks shared by photos and albums."""
+
+    def is_owned_by(self, user):
+        """Return True if user owns this object."""
+        return (user.is_authenticated and self.owner_id is not None and
+                self.owner.user_id == user.id)
+
+    def is_visible_to(self, user):
+        """Return True if user may look at this object."""
+        return self.published == 'PUBLIC' or self.is_owned_by(user)
+
+
+def visible_to(model, user):
+    """Return the photos or albums user may look at.
+
+    Anonymous viewers get the model's public manager; signed in users
+    also see everything they own.
+    """
+    if not user.is_authenticated:
+        return model.public.all()
+    return model.objects.filter(Q(published='PUBLIC') | Q(owner__user_id=user.id))
+
+
+class Photo(Shareable, models.Model):
     """The Photo model and all of its attributes."""
 
     objects = models.Manager()
@@ -34,7 +75,8 @@ class Photo(models.Model):
         ('PUBLIC', 'Public'),
     )
 
-    title = models.CharField(max_length=128)
+    # Indexed for prefix searches in the admin.
+    title = models.CharField(max_length=128, db_index=True)
     description = models.TextField(max_length=255, blank=True, null=True)
     date_uploaded = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
@@ -42,7 +84,35 @@ class Photo(models.Model):
     published = models.CharField(max_length=144,
                                  choices=PUBLISH_CHOICES,
                                  default='PRIVATE')
-    photo = models.ImageField(upload_to='')
+    photo = models.ImageField(upload_to='', storage=photo_storage, db_index=True)
+
+    # Read from the file after upload by imager_images.metadata.
+    width = models.PositiveIntegerField(blank=True, null=True)
+    height = models.PositiveIntegerField(blank=True, null=True)
+    file_size = models.BigIntegerField(blank=True, null=True)
+    mime_type = models.CharField(max_length=64, blank=True)
+    orientation = models.PositiveSmallIntegerField(blank=True, null=True)
+    camera_model = models.CharField(max_length=128, blank=True)
+    lens_model = models.CharField(max_length=128, blank=True)
+    taken_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    # Perceptual hash set on upload by imager_images.duplicates.
+    phash = models.CharField(max_length=16, blank=True, db_index=True)
+    # Title, tags and description, kept by imager_images.search.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        """Index the gallery, publish date and library access paths."""
+
+        index_together = [
+            ('published', 'date_uploaded', 'id'),
+            ('published', 'date_published'),
+            ('owner', 'date_uploaded'),
+        ]
+
+    @property
+    def renditions(self):
+        """Return the resized copies of the photo, by rendition name."""
+        return Renditions(self.photo)
 
     def __str__(self):
         """Return readable repr."""
@@ -57,7 +127,7 @@ class PublicAlbumManger(models.Manager):
         return super(PublicAlbumManger, self).get_queryset().filter(published="PUBLIC")
 
 
-class Album(models.Model):
+class Album(Shareable, models.Model):
     """The Album model and all of its attributes."""
 
     objects = models.Manager()
@@ -96,7 +166,8 @@ class Album(models.Model):
         ('PUBLIC', 'Public'),
     )
 
-    title = models.CharField(max_length=128)
+    # Indexed for prefix searches in the admin.
+    title = models.CharField(max_length=128, db_index=True)
     description = models.TextField(max_length=255, blank=True, null=True)
     date_uploaded = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
@@ -104,7 +175,500 @@ class Album(models.Model):
     published = models.CharField(max_length=144,
                                  choices=PUBLISH_CHOICES,
                                  default='PRIVATE')
+    # Title and description, kept by imager_images.search.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        """Index the gallery, publish date and library access paths."""
+
+        index_together = [
+            ('published', 'date_uploaded', 'id'),
+            ('published', 'date_published'),
+            ('owner', 'date_uploaded'),
+        ]
 
     def __str__(self):
         """Return readable repr."""
         return self.title
+
+
+class SimilarPhoto(models.Model):
+    """One entry in a photo's precomputed list of photos sharing its tags."""
+
+    photo = models.ForeignKey(
+        Photo,
+        related_name='similar_entries',
+        on_delete=models.CASCADE,
+    )
+    similar = models.ForeignKey(
+        Photo,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    shared_tags = models.PositiveIntegerField()
+
+    class Meta:
+        """Keep one entry per pair, read best first per photo."""
+
+        unique_together = ('photo', 'similar')
+        index_together = ('photo', 'shared_tags')
+
+
+class PublicTaggedPhoto(models.Model):
+    """A public photo filed under one of its tags."""
+
+    tag = models.ForeignKey(
+        Tag,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    photo = models.ForeignKey(
+        Photo,
+        related_name='public_tag_entries',
+        on_delete=models.CASCADE,
+    )
+    date_uploaded = models.DateTimeField()
+
+    class Meta:
+        """Keep one entry per pair, read newest first per tag."""
+
+        unique_together = ('tag', 'photo')
+        index_together = ('tag', 'date_uploaded', 'photo')
+
+
+class TagCount(models.Model):
+    """How many public photos carry a tag."""
+
+    tag = models.OneToOneField(
+        Tag,
+        primary_key=True,
+        related_name='public_count',
+        on_delete=models.CASCADE,
+    )
+    public_photos = models.PositiveIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        """Return readable repr."""
+        return '{} ({})'.format(self.tag, self.public_photos)
+
+
+class OwnerTag(models.Model):
+    """How many of a photographer's photos carry a tag."""
+
+    owner = models.ForeignKey(
+        ImagerProfile,
+        related_name='tag_uses',
+        on_delete=models.CASCADE,
+    )
+    tag = models.ForeignKey(
+        Tag,
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    photos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """Keep one row per photographer and tag."""
+
+        unique_together = ('owner', 'tag')
+
+    def __str__(self):
+        """Return readable repr."""
+        return '{} {} ({})'.format(self.owner, self.tag, self.photos)
+
+
+def upload_staging_dir():
+    """Return the directory unfinished uploads are gathered in."""
+    return getattr(settings, 'IMAGER_UPLOAD_STAGING_DIR', os.path.join(settings.BASE_DIR, 'STAGING'))
+
+
+class UploadSession(models.Model):
+    """A resumable upload whose bytes are gathered in a staging file."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        ImagerProfile,
+        related_name='upload_sessions',
+        on_delete=models.CASCADE,
+    )
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    title = models.CharField(max_length=128, blank=True)
+    published = models.CharField(max_length=144,
+                                 choices=Photo.PUBLISH_CHOICES,
+                                 default='PRIVATE')
+    photo = models.ForeignKey(
+        Photo,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    @property
+    def staging_path(self):
+        """Return the file the uploaded bytes are appended to."""
+        return os.path.join(upload_staging_dir(), '{}.part'.format(self.id.hex))
+
+    @property
+    def is_complete(self):
+        """Return True once every byte has arrived."""
+        return self.offset >= self.size
+
+    def __str__(self):
+        """Return readable repr."""
+        return '{} ({}/{})'.format(self.filename, self.offset, self.size)
+
+
+# Sent after photos are created with bulk_create, which sends no post_save
+# or m2m_changed. "tagged" says whether tags were attached and "album" is
+# the album the photos were added to, if any.
+photos_bulk_created = Signal(providing_args=['photos', 'tagged', 'album'])
+
+
+@receiver(pre_save, sender=Photo)
+@receiver(pre_save, sender=Album)
+def remember_stored_visibility(sender, instance, **kwargs):
+    """Note the visibility, owner and file size the row had before this save."""
+    instance._stored_published = None
+    instance._stored_owner_id = None
+    instance._stored_file_size = None
+    if instance.pk is not None:
+        fields = ['published', 'owner_id'] + (['file_size'] if sender is Photo else [])
+        row = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+        if row is not None:
+            instance._stored_published, instance._stored_owner_id = row[:2]
+            if sender is Photo:
+                instance._stored_file_size = row[2]
+
+
+def was_or_is_public(instance):
+    """Return True if a save could change what public pages show."""
+    return 'PUBLIC' in (instance.published, getattr(instance, '_stored_published', None))
+
+
+@receiver(post_save, sender=Photo)
+def update_public_photo_pool(sender, instance, **kwargs):
+    """Keep the random sampling pool in step with photo visibility."""
+    from imager_images.sampling import sampler
+    if instance.published == 'PUBLIC':
+        sampler.add(instance.id)
+    else:
+        sampler.discard(instance.id)
+
+
+@receiver(post_save, sender=Photo)
+def make_photo_renditions(sender, instance, **kwargs):
+    """Write the fixed-size renditions of a newly saved image."""
+    generate_renditions(instance.photo)
+
+
+@receiver(post_save, sender=Photo)
+def update_tag_index(sender, instance, **kwargs):
+    """File or unfile a photo under its tags as its visibility changes."""
+    from imager_images import tagindex
+    tagindex.sync_photo(instance)
+
+
+@receiver(pre_delete, sender=Photo)
+def remove_from_tag_counts(sender, instance, **kwargs):
+    """Take a deleted photo out of its tags' counts."""
+    from imager_images import tagindex
+    tagindex.forget_photo(instance)
+
+
+@receiver(post_delete, sender=Photo)
+def remove_from_public_photo_pool(sender, instance, **kwargs):
+    """Drop deleted photos from the random sampling pool."""
+    from imager_images.sampling import sampler
+    sampler.discard(instance.id)
+
+
+@receiver(m2m_changed, sender=Photo.tags.through)
+def update_similar_photos(sender, instance, action, **kwargs):
+    """Refresh the similar photos index when a photo's tags change."""
+    from imager_images.similarity import photo_tags_changed
+    if isinstance(instance, Photo) and action in ('post_add', 'post_remove', 'post_clear'):
+        photo_tags_changed(instance.id)
+
+
+@receiver(post_save, sender=Photo)
+def relist_similar_photo(sender, instance, created, **kwargs):
+    """List a photo as similar once it is public, and only while it is."""
+    from imager_images.similarity import photo_visibility_changed
+    stored = getattr(instance, '_stored_published', None)
+    if not created and stored is not None and stored != instance.published and was_or_is_public(instance):
+        photo_visibility_changed(instance.id)
+
+
+@receiver(m2m_changed, sender=Photo.tags.through)
+def update_tag_index_for_tags(sender, instance, action, **kwargs):
+    """Refile a photo in the tag index when its tags change."""
+    from imager_images import tagindex
+    if isinstance(instance, Photo) and action in ('post_add', 'post_remove', 'post_clear'):
+        tagindex.sync_photo(instance)
+
+
+@receiver(post_save, sender=Photo)
+def expire_photo_pages(sender, instance, **kwargs):
+    """Expire the cached galleries a changed public photo appears on."""
+    from imager_images.cache import bump, tag_namespace
+    if was_or_is_public(instance):
+        bump('photos', *[tag_namespace(slug) for slug in instance.tags.slugs()])
+
+
+@receiver(pre_delete, sender=Photo)
+def note_deleted_photo_tags(sender, instance, **kwargs):
+    """Remember a public photo's tags before they are deleted with it."""
+    instance._deleted_tag_slugs = []
+    if instance.published == 'PUBLIC':
+        instance._deleted_tag_slugs = list(instance.tags.slugs())
+
+
+@receiver(post_delete, sender=Photo)
+def expire_deleted_photo_pages(sender, instance, **kwargs):
+    """Expire the cached galleries a deleted public photo appeared on."""
+    from imager_images.cache import bump, tag_namespace
+    if instance.published == 'PUBLIC':
+        bump('photos', *[tag_namespace(slug) for slug in instance._deleted_tag_slugs])
+
+
+@receiver(m2m_changed, sender=Photo.tags.through)
+def expire_tag_pages(sender, instance, action, pk_set, **kwargs):
+    """Expire the cached tag galleries a public photo joined or left."""
+    from imager_images.cache import bump, tag_namespace
+    if not isinstance(instance, Photo) or instance.published != 'PUBLIC':
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_slugs = list(instance.tags.slugs())
+    elif action == 'post_clear':
+        bump(*[tag_namespace(slug) for slug in instance._cleared_tag_slugs])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        slugs = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+        bump(*[tag_namespace(slug) for slug in slugs])
+
+
+@receiver(post_save, sender=Album)
+@receiver(post_delete, sender=Album)
+def expire_album_pages(sender, instance, **kwargs):
+    """Expire the cached album gallery when a public album changes."""
+    from imager_images.cache import bump
+    if was_or_is_public(instance):
+        bump('albums')
+
+
+@receiver(m2m_changed, sender=Album.photos.through)
+def expire_album_pages_for_photos(sender, instance, action, **kwargs):
+    """Expire the cached album gallery when a public album's photos change."""
+    from imager_images.cache import bump
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if isinstance(instance, Album) and instance.published == 'PUBLIC':
+            bump('albums')
+        elif isinstance(instance, Photo):
+            bump('albums')
+
+
+@receiver(photos_bulk_created, sender=Photo)
+def index_bulk_created_photos(sender, photos, tagged, **kwargs):
+    """Do for bulk created photos what post_save and m2m_changed would."""
+    from imager_images import tagindex
+    from imager_images.sampling import sampler
+    from imager_images.similarity import photo_tags_changed
+    for photo in photos:
+        generate_renditions(photo.photo)
+        if photo.published == 'PUBLIC':
+            sampler.add(photo.id)
+            if tagged:
+                tagindex.sync_photo(photo)
+        if tagged:
+            photo_tags_changed(photo.id)
+
+
+@receiver(photos_bulk_created, sender=Photo)
+def expire_bulk_created_photo_pages(sender, photos, tagged, album, **kwargs):
+    """Expire the cached galleries bulk created photos appear on."""
+    from imager_images.cache import bump, tag_namespace
+    namespaces = []
+    if any(photo.published == 'PUBLIC' for photo in photos):
+        namespaces.append('photos')
+        if tagged:
+            namespaces.extend(tag_namespace(slug) for slug in photos[0].tags.slugs())
+    if album is not None and album.published == 'PUBLIC':
+        namespaces.append('albums')
+    if namespaces:
+        bump(*namespaces)
+
+
+@receiver(post_delete, sender=UploadSession)
+def remove_staging_file(sender, instance, **kwargs):
+    """Delete the bytes of a finished or abandoned upload."""
+    try:
+        os.remove(instance.staging_path)
+    except OSError:
+        pass
+
+
+@receiver(post_save, sender=Photo)
+def extract_photo_metadata(sender, instance, created, **kwargs):
+    """Queue a new photo's file for metadata extraction once it is committed."""
+    from imager_images.metadata import schedule
+    if created and instance.photo:
+        photo_id, name = instance.id, instance.photo.name
+        transaction.on_commit(lambda: schedule(photo_id, name))
+
+
+@receiver(photos_bulk_created, sender=Photo)
+def extract_bulk_created_photo_metadata(sender, photos, **kwargs):
+    """Queue bulk created photos for metadata extraction once committed."""
+    from imager_images.metadata import schedule
+    jobs = [(photo.id, photo.photo.name) for photo in photos]
+    transaction.on_commit(lambda: [schedule(photo_id, name) for photo_id, name in jobs])
+
+
+@receiver(pre_save, sender=Photo)
+def hash_photo(sender, instance, **kwargs):
+    """Give a photo its perceptual hash."""
+    from imager_images import duplicates
+    if not instance.phash and instance.photo:
+        instance.phash = duplicates.hash_field_file(instance.photo)
+
+
+@receiver(post_save, sender=Photo)
+def index_photo_hash(sender, instance, **kwargs):
+    """Make a saved photo findable as a near duplicate."""
+    from imager_images.duplicates import index
+    index.add(instance)
+
+
+@receiver(post_delete, sender=Photo)
+def unindex_photo_hash(sender, instance, **kwargs):
+    """Stop finding a deleted photo as a near duplicate."""
+    from imager_images.duplicates import index
+    index.discard(instance)
+
+
+@receiver(photos_bulk_created, sender=Photo)
+def index_bulk_created_photo_hashes(sender, photos, **kwargs):
+    """Make bulk created photos findable as near duplicates."""
+    from imager_images.duplicates import index
+    for photo in photos:
+        index.add(photo)
+
+
+@receiver(m2m_changed, sender=Photo.tags.through)
+def touch_retagged_photo(sender, instance, action, **kwargs):
+    """Mark a photo modified when its tags change, for conditional GET."""
+    if isinstance(instance, Photo) and action in ('post_add', 'post_remove', 'post_clear'):
+        instance.date_modified = timezone.now()
+        Photo.objects.filter(pk=instance.pk).update(date_modified=instance.date_modified)
+
+
+@receiver(m2m_changed, sender=Album.photos.through)
+def touch_regrouped_albums(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mark albums modified when their photos change, for conditional GET."""
+    if reverse and action == 'pre_clear':
+        instance._cleared_album_ids = list(instance.albums.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    now = timezone.now()
+    if not reverse:
+        instance.date_modified = now
+        Album.objects.filter(pk=instance.pk).update(date_modified=now)
+    else:
+        album_ids = instance._cleared_album_ids if action == 'post_clear' else pk_set
+        if album_ids:
+            Album.objects.filter(pk__in=album_ids).update(date_modified=now)
+
+
+@receiver(pre_save, sender=Photo)
+def measure_photo(sender, instance, **kwargs):
+    """Record the size of a photo's file for its owner's byte total."""
+    from imager_images import profilestats
+    profilestats.measure(instance)
+
+
+@receiver(post_save, sender=Photo)
+def count_saved_photo(sender, instance, **kwargs):
+    """Keep the owner's photo counters in step with the photo."""
+    from imager_images import profilestats
+    profilestats.photo_saved(instance)
+
+
+@receiver(pre_delete, sender=Photo)
+def uncount_deleted_photo(sender, instance, **kwargs):
+    """Take a deleted photo out of its owner's counters."""
+    from imager_images import profilestats
+    profilestats.photo_deleted(instance)
+
+
+@receiver(m2m_changed, sender=Photo.tags.through)
+def count_photo_tags(sender, instance, action, pk_set, **kwargs):
+    """Keep the owner's distinct tag count in step with a photo's tags."""
+    from imager_images import profilestats
+    if not isinstance(instance, Photo):
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif action == 'post_clear':
+        profilestats.adjust_tags(instance.owner_id, instance._cleared_tag_ids, -1)
+    elif action == 'post_add' and pk_set:
+        profilestats.adjust_tags(instance.owner_id, pk_set, 1)
+    elif action == 'post_remove' and pk_set:
+        profilestats.adjust_tags(instance.owner_id, pk_set, -1)
+
+
+@receiver(photos_bulk_created, sender=Photo)
+def count_bulk_created_photos(sender, photos, tagged, **kwargs):
+    """Count bulk created photos and their tags."""
+    from imager_images import profilestats
+    profilestats.photos_created(photos, tagged)
+
+
+@receiver(post_save, sender=Album)
+def count_saved_album(sender, instance, **kwargs):
+    """Keep the owner's album counters in step with the album."""
+    from imager_images import profilestats
+    profilestats.album_saved(instance)
+
+
+@receiver(post_delete, sender=Album)
+def uncount_deleted_album(sender, instance, **kwargs):
+    """Take a deleted album out of its owner's counters."""
+    from imager_images import profilestats
+    profilestats.album_deleted(instance)
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_save, sender=Album)
+def index_search_text(sender, instance, **kwargs):
+    """Make a saved photo or album findable by its current text."""
+    from imager_images import search
+    search.index(instance)
+
+
+@receiver(post_delete, sender=Photo)
+@receiver(post_delete, sender=Album)
+def unindex_search_text(sender, instance, **kwargs):
+    """Stop finding a deleted photo or album."""
+    from imager_images import search
+    search.unindex(instance)
+
+
+@receiver(m2m_changed, sender=Photo.tags.through)
+def index_search_tags(sender, instance, action, **kwargs):
+    """Make a photo findable by its new tags."""
+    from imager_images import search
+    if isinstance(instance, Photo) and action in ('post_add', 'post_remove', 'post_clear'):
+        search.index(instance)
+
+
+@receiver(photos_bulk_created, sender=Photo)
+def index_bulk_created_search_text(sender, photos, tagged, **kwargs):
+    """Make bulk created photos findable."""
+    from imager_images import search
+    tag_names = list(photos[0].tags.names()) if tagged and photos else []
+    for photo in photos:
+        search.index(photo, tag_names)
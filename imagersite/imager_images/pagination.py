@@ -0,0 +1,178 @@
+"""Keyset (cursor) pagination for the galleries."""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(InvalidPage):
+    """The cursor could not be decoded."""
+
+    pass
+
+
+def encode_cursor(values):
+    """Turn a tuple of ordering values into an opaque url-safe token."""
+    raw = json.dumps([_jsonable(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Turn a token made by encode_cursor back into a list of values."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise InvalidCursor('Malformed cursor.')
+    if not isinstance(values, list):
+        raise InvalidCursor('Malformed cursor.')
+    return values
+
+
+def _jsonable(value):
+    """Serialize datetimes so they survive the trip through json."""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class CursorPage(object):
+    """One page of a cursor paginated queryset."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        """Hold the objects and the cursors to the neighbouring pages."""
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        """Iterate over the objects on the page."""
+        return iter(self.object_list)
+
+    def __len__(self):
+        """Return the number of objects on the page."""
+        return len(self.object_list)
+
+    def has_next(self):
+        """Return True if there is a page after this one."""
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        """Return True if there is a page before this one."""
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        """Return True if there is a page on either side."""
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator(object):
+    """Paginate a queryset by seeking past the last row seen.
+
+    Every page is a single indexed range query of per_page + 1 rows, so
+    page one hundred costs the same as page one and rows inserted while a
+    visitor is browsing never shift the pages they have not seen yet.
+    The ordering must end in a unique field so the key is total.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-date_uploaded', '-id')):
+        """Set up the paginator."""
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def page(self, after=None, before=None):
+        """Return the page after or before the given cursor tokens."""
+        if after:
+            rows = self._seek(decode_cursor(after), forward=True)
+            has_previous = True
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        elif before:
+            rows = self._seek(decode_cursor(before), forward=False)
+            has_next = True
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+        else:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_previous = False
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        if not rows:
+            return CursorPage(rows)
+        return CursorPage(
+            rows,
+            next_cursor=self.cursor_for(rows[-1]) if has_next else None,
+            previous_cursor=self.cursor_for(rows[0]) if has_previous else None,
+        )
+
+    def cursor_for(self, obj):
+        """Return the cursor token pointing at obj."""
+        return encode_cursor([getattr(obj, name) for name in self.fields])
+
+    def _seek(self, values, forward):
+        """Fetch per_page + 1 rows strictly past the key in either direction."""
+        return list(self.seek(values, forward)[:self.per_page + 1])
+
+    def seek(self, values, forward=True):
+        """Return the ordered queryset of rows strictly past the key values."""
+        if len(values) != len(self.fields):
+            raise InvalidCursor('Cursor does not match ordering.')
+        values = [self._to_python(name, value) for name, value in zip(self.fields, values)]
+        ordering = self.ordering
+        if not forward:
+            ordering = tuple(name[1:] if name.startswith('-') else '-' + name
+                             for name in ordering)
+        query = Q()
+        for index, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = '__lt' if name.startswith('-') else '__gt'
+            term = Q(**{field + lookup: values[index]})
+            for prior in range(index):
+                term &= Q(**{self.fields[prior]: values[prior]})
+            query |= term
+        return self.queryset.filter(query).order_by(*ordering)
+
+    def _to_python(self, name, value):
+        """Coerce a decoded cursor value back to the field's type."""
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        try:
+            python_value = field.to_python(value)
+        except ValidationError:
+            raise InvalidCursor('Cursor value for {} is invalid.'.format(name))
+        if python_value is None and value is not None:
+            raise InvalidCursor('Cursor value for {} is invalid.'.format(name))
+        return python_value
+
+
+class CursorPaginationMixin(object):
+    """Swap a ListView's page-number paginator for the cursor paginator."""
+
+    paginate_by = 30
+    ordering = ('-date_uploaded', '-id')
+
+    def get_paginate_by(self, queryset):
+        """Let settings override the page size."""
+        return getattr(settings, 'IMAGER_GALLERY_PAGE_SIZE', self.paginate_by)
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        """Return a cursor paginator in the view's ordering."""
+        return CursorPaginator(queryset, per_page, self.get_ordering())
+
+    def paginate_queryset(self, queryset, page_size):
+        """Return the page selected by the after/before query arguments."""
+        paginator = self.get_paginator(queryset, page_size)
+        try:
+            page = paginator.page(after=self.request.GET.get('after'),
+                                  before=self.request.GET.get('before'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,214 @@
+"""Denormalised photo, album, byte and tag totals on each profile.
+
+The totals live on ImagerProfile so profile and library pages read them
+from the one row they load anyway. The Photo and Album receivers keep
+them current, and every change drops the copy cached for
+request.profile; distinct tags are counted through OwnerTag, which
+holds how many of a photographer's photos carry each tag. reconcile()
+recomputes everything from the photo and album tables.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from imager_images.models import Album, OwnerTag, Photo
+from imager_profile.middleware import forget_profiles_by_id
+from imager_profile.models import ImagerProfile
+
+VISIBILITIES = ('PUBLIC', 'SHARED', 'PRIVATE')
+COUNTER_FIELDS = tuple('{}_{}'.format(published.lower(), kind)
+                       for kind in ('photos', 'albums') for published in VISIBILITIES)
+COUNTER_FIELDS += ('photo_bytes', 'tag_count')
+
+
+def counter(kind, published):
+    """Return the profile column counting 'photos' or 'albums' at a visibility."""
+    return '{}_{}'.format(published.lower(), kind)
+
+
+def _add(deltas, owner_id, changes, sign=1):
+    """Fold sign times changes into the owner's pending deltas."""
+    if owner_id is None:
+        return
+    for name, delta in changes.items():
+        deltas[owner_id][name] += sign * delta
+
+
+def _apply(deltas):
+    """Write the pending deltas with one update per owner."""
+    changed = []
+    for owner_id, changes in deltas.items():
+        changes = dict((name, F(name) + delta) for name, delta in changes.items() if delta)
+        if changes:
+            ImagerProfile.objects.filter(pk=owner_id).update(**changes)
+            changed.append(owner_id)
+    forget_profiles_by_id(changed)
+
+
+def _photo_totals(published, size):
+    """Return what one photo adds to its owner's counters."""
+    return {counter('photos', published): 1, 'photo_bytes': size or 0}
+
+
+def adjust_tags(owner_id, tag_ids, delta):
+    """Count delta more or fewer of the owner's photos under each tag."""
+    tag_ids = list(tag_ids)
+    if owner_id is None or not tag_ids or not delta:
+        return
+    with transaction.atomic():
+        # Changes to one photographer's tags recount one after another.
+        list(ImagerProfile.objects.select_for_update().filter(pk=owner_id).values_list('id'))
+        if delta > 0:
+            existing = set(OwnerTag.objects.filter(owner_id=owner_id, tag_id__in=tag_ids)
+                           .values_list('tag_id', flat=True))
+            OwnerTag.objects.bulk_create([OwnerTag(owner_id=owner_id, tag_id=tag_id)
+                                          for tag_id in set(tag_ids) - existing])
+        OwnerTag.objects.filter(owner_id=owner_id, tag_id__in=tag_ids).update(photos=F('photos') + delta)
+        if delta < 0:
+            OwnerTag.objects.filter(owner_id=owner_id, photos__lte=0).delete()
+        ImagerProfile.objects.filter(pk=owner_id).update(
+            tag_count=OwnerTag.objects.filter(owner_id=owner_id).count())
+        forget_profiles_by_id([owner_id])
+
+
+@transaction.atomic
+def photo_saved(photo):
+    """Move a saved photo's contribution if its owner, visibility or size changed."""
+    new = (photo.owner_id, photo.published, photo.file_size)
+    stored_published = getattr(photo, '_stored_published', None)
+    old = None
+    if stored_published is not None:
+        old = (photo._stored_owner_id, stored_published, photo._stored_file_size)
+        if old == new:
+            return
+    deltas = defaultdict(lambda: defaultdict(int))
+    if old is not None:
+        _add(deltas, old[0], _photo_totals(old[1], old[2]), -1)
+    _add(deltas, new[0], _photo_totals(new[1], new[2]))
+    _apply(deltas)
+    if old is not None and old[0] != new[0]:
+        tag_ids = list(photo.tags.values_list('id', flat=True))
+        adjust_tags(old[0], tag_ids, -1)
+        adjust_tags(new[0], tag_ids, 1)
+
+
+@transaction.atomic
+def photo_deleted(photo):
+    """Take a photo that is about to be deleted out of its owner's counters."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    _add(deltas, photo.owner_id, _photo_totals(photo.published, photo.file_size), -1)
+    _apply(deltas)
+    adjust_tags(photo.owner_id, photo.tags.values_list('id', flat=True), -1)
+
+
+@transaction.atomic
+def photos_created(photos, tagged):
+    """Count photos made with bulk_create."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    owners = defaultdict(int)
+    for photo in photos:
+        _add(deltas, photo.owner_id, _photo_totals(photo.published, photo.file_size))
+        owners[photo.owner_id] += 1
+    _apply(deltas)
+    if tagged and photos:
+        # Every photo of one bulk upload carries the same tags.
+        tag_ids = list(photos[0].tags.values_list('id', flat=True))
+        for owner_id, count in owners.items():
+            adjust_tags(owner_id, tag_ids, count)
+
+
+def album_saved(album):
+    """Move a saved album's count if its owner or visibility changed."""
+    new = (album.owner_id, album.published)
+    stored_published = getattr(album, '_stored_published', None)
+    old = None
+    if stored_published is not None:
+        old = (album._stored_owner_id, stored_published)
+        if old == new:
+            return
+    deltas = defaultdict(lambda: defaultdict(int))
+    if old is not None:
+        _add(deltas, old[0], {counter('albums', old[1]): 1}, -1)
+    _add(deltas, new[0], {counter('albums', new[1]): 1})
+    _apply(deltas)
+
+
+def album_deleted(album):
+    """Take a deleted album out of its owner's counts."""
+    deltas = defaultdict(lambda: defaultdict(int))
+    _add(deltas, album.owner_id, {counter('albums', album.published): 1}, -1)
+    _apply(deltas)
+
+
+def measure(photo):
+    """Give a photo its file size if it does not have one yet."""
+    if not photo.photo:
+        return
+    if not getattr(photo.photo, '_committed', True):
+        photo.file_size = photo.photo.size
+    elif photo.file_size is None:
+        try:
+            photo.file_size = photo.photo.storage.size(photo.photo.name)
+        except (IOError, OSError):
+            pass
+
+
+def _expected(profile_ids):
+    """Return the counters and tag uses the rows say each profile should have."""
+    counters = dict((profile_id, dict.fromkeys(COUNTER_FIELDS, 0)) for profile_id in profile_ids)
+    photo_rows = (Photo.objects.filter(owner_id__in=profile_ids).order_by()
+                  .values_list('owner_id', 'published').annotate(Count('id'), Sum('file_size')))
+    for owner_id, published, count, size in photo_rows:
+        counters[owner_id][counter('photos', published)] += count
+        counters[owner_id]['photo_bytes'] += size or 0
+    album_rows = (Album.objects.filter(owner_id__in=profile_ids).order_by()
+                  .values_list('owner_id', 'published').annotate(Count('id')))
+    for owner_id, published, count in album_rows:
+        counters[owner_id][counter('albums', published)] += count
+    uses = (Photo.objects.filter(owner_id__in=profile_ids, tags__isnull=False).order_by()
+            .values_list('owner_id', 'tags').annotate(Count('id')))
+    tag_uses = [OwnerTag(owner_id=owner_id, tag_id=tag_id, photos=count)
+                for owner_id, tag_id, count in uses]
+    for use in tag_uses:
+        counters[use.owner_id]['tag_count'] += 1
+    return counters, tag_uses
+
+
+def _measure_missing(profile_ids):
+    """Store the file size of the profiles' photos that have none."""
+    missing = Photo.objects.filter(owner_id__in=profile_ids, file_size__isnull=True).exclude(photo='')
+    for photo in missing.only('id', 'photo'):
+        measure(photo)
+        if photo.file_size is not None:
+            Photo.objects.filter(pk=photo.pk).update(file_size=photo.file_size)
+
+
+def reconcile(profiles=None, batch_size=500):
+    """Recompute the counters of profiles, all of them by default.
+
+    Works through the profiles a batch at a time, each batch locked and
+    rewritten in one transaction. Returns how many profiles were off.
+    """
+    if profiles is None:
+        profiles = ImagerProfile.objects.all()
+    profile_ids = list(profiles.order_by('pk').values_list('pk', flat=True))
+    corrected = 0
+    for start in range(0, len(profile_ids), batch_size):
+        batch = profile_ids[start:start + batch_size]
+        _measure_missing(batch)
+        with transaction.atomic():
+            current = dict((row[0], dict(zip(COUNTER_FIELDS, row[1:]))) for row in
+                           ImagerProfile.objects.select_for_update().filter(pk__in=batch)
+                           .values_list('pk', *COUNTER_FIELDS))
+            expected, tag_uses = _expected(batch)
+            OwnerTag.objects.filter(owner_id__in=batch).delete()
+            OwnerTag.objects.bulk_create(tag_uses)
+            changed = []
+            for profile_id, values in expected.items():
+                if current.get(profile_id) != values:
+                    ImagerProfile.objects.filter(pk=profile_id).update(**values)
+                    changed.append(profile_id)
+            forget_profiles_by_id(changed)
+            corrected += len(changed)
+    return corrected
@@ -0,0 +1,154 @@
+"""Fixed-size renditions generated next to each uploaded photo."""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# name: (width, height, crop). Every rendition is also made at twice the
+# size under "<name>@2x" for high density screens.
+DEFAULT_RENDITIONS = {
+    'thumb': (100, 100, True),
+    'card': (400, 400, False),
+    'display': (1200, 1200, False),
+}
+
+
+# EXIF orientation, and the transposes that turn each value's pixels upright.
+EXIF_ORIENTATION = 274
+ORIENTATION_TRANSPOSES = {
+    2: (Image.FLIP_LEFT_RIGHT,),
+    3: (Image.ROTATE_180,),
+    4: (Image.FLIP_TOP_BOTTOM,),
+    5: (Image.FLIP_LEFT_RIGHT, Image.ROTATE_90),
+    6: (Image.ROTATE_270,),
+    7: (Image.FLIP_LEFT_RIGHT, Image.ROTATE_270),
+    8: (Image.ROTATE_90,),
+}
+
+
+def rendition_specs():
+    """Return the configured renditions, including the @2x variants."""
+    specs = {}
+    for name, (width, height, crop) in getattr(settings, 'IMAGER_RENDITIONS', DEFAULT_RENDITIONS).items():
+        specs[name] = (width, height, crop)
+        specs[name + '@2x'] = (width * 2, height * 2, crop)
+    return specs
+
+
+def rendition_name(original_name, rendition):
+    """Return the storage name of a rendition of original_name."""
+    stem, ext = os.path.splitext(original_name)
+    return '{}.{}.jpg'.format(stem, rendition)
+
+
+class Rendition(object):
+    """One rendition of a photo at 1x and 2x."""
+
+    def __init__(self, original_name, rendition, storage=None):
+        """Remember where the rendition lives."""
+        self.storage = storage or default_storage
+        self.name = rendition_name(original_name, rendition)
+        self.name_2x = rendition_name(original_name, rendition + '@2x')
+
+    @property
+    def url(self):
+        """Return the url of the 1x rendition."""
+        return self.storage.url(self.name)
+
+    @property
+    def url_2x(self):
+        """Return the url of the 2x rendition."""
+        return self.storage.url(self.name_2x)
+
+    @property
+    def srcset(self):
+        """Return a srcset attribute value covering both densities."""
+        return '{} 1x, {} 2x'.format(self.url, self.url_2x)
+
+
+class Renditions(object):
+    """Look renditions of a photo up by name, as in photo.renditions.card."""
+
+    def __init__(self, image_file):
+        """Wrap the photo's image field file."""
+        self.image_file = image_file
+
+    def __getitem__(self, rendition):
+        """Return the named rendition if the photo has an image."""
+        if not self.image_file or rendition not in rendition_specs():
+            raise KeyError(rendition)
+        return Rendition(self.image_file.name, rendition, self.image_file.storage)
+
+    def __contains__(self, rendition):
+        """Return True if the named rendition is configured."""
+        return bool(self.image_file) and rendition in rendition_specs()
+
+
+def orientation(image):
+    """Return the EXIF orientation of an opened image, 1 if it has none."""
+    try:
+        exif = image._getexif() or {}
+    except Exception:
+        return 1
+    return exif.get(EXIF_ORIENTATION, 1)
+
+
+def upright(image, orientation):
+    """Return image turned the way its EXIF orientation says it is viewed."""
+    for method in ORIENTATION_TRANSPOSES.get(orientation, ()):
+        image = image.transpose(method)
+    return image
+
+
+def render(image, width, height, crop):
+    """Return a JPEG of image scaled to fit, or fill when cropping, the box."""
+    if crop:
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail((width, height), Image.LANCZOS)
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=85, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def generate_renditions(image_file, force=False):
+    """Write every missing rendition of image_file to its storage.
+
+    Returns the names that were written.
+    """
+    if not image_file:
+        return []
+    storage = image_file.storage
+    specs = rendition_specs()
+    pending = {}
+    for rendition, spec in specs.items():
+        name = rendition_name(image_file.name, rendition)
+        if storage.exists(name):
+            if not force:
+                continue
+            storage.delete(name)
+        pending[name] = spec
+    if not pending:
+        return []
+    with storage.open(image_file.name, 'rb') as original:
+        image = Image.open(original)
+        turn = orientation(image)
+        largest = (max(spec[0] for spec in pending.values()),
+                   max(spec[1] for spec in pending.values()))
+        if turn in (5, 6, 7, 8):
+            # The stored pixels are on their side; size the draft to match.
+            largest = largest[::-1]
+        image.draft('RGB', largest)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.load()
+    # Renditions carry no EXIF, so the pixels themselves must be upright.
+    image = upright(image, turn)
+    written = []
+    for name, (width, height, crop) in sorted(pending.items()):
+        written.append(storage.save(name, ContentFile(render(image, width, height, crop))))
+    return written
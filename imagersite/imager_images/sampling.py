@@ -0,0 +1,128 @@
+"""Constant-time random selection of public photos."""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max, Min
+
+
+class PublicPhotoSampler(object):
+    """An in-process pool of public photo ids that can be sampled in O(1).
+
+    The pool is loaded lazily, refreshed every IMAGER_SAMPLING_REFRESH
+    seconds and kept current between refreshes by the Photo save/delete
+    receivers. Libraries too big for IMAGER_SAMPLING_POOL_LIMIT skip the
+    pool and probe a random point of the primary key index instead.
+    """
+
+    def __init__(self):
+        """Start with an empty, unloaded pool."""
+        self._lock = threading.Lock()
+        self._ids = []
+        self._positions = {}
+        self._loaded_at = None
+        self._too_big = False
+
+    def add(self, photo_id):
+        """Put a newly public photo into the pool."""
+        with self._lock:
+            if self._loaded_at is None or photo_id in self._positions:
+                return
+            self._positions[photo_id] = len(self._ids)
+            self._ids.append(photo_id)
+
+    def discard(self, photo_id):
+        """Take a photo that is no longer public out of the pool."""
+        with self._lock:
+            position = self._positions.pop(photo_id, None)
+            if position is None:
+                return
+            last = self._ids.pop()
+            if last != photo_id:
+                self._ids[position] = last
+                self._positions[last] = position
+
+    def clear(self):
+        """Forget the pool so the next sample reloads it."""
+        with self._lock:
+            self._ids = []
+            self._positions = {}
+            self._loaded_at = None
+            self._too_big = False
+
+    def sample(self, count):
+        """Return up to count distinct public photos in random order."""
+        from imager_images.models import Photo
+
+        ids = self._sample_ids(count)
+        if ids is None:
+            return self._probe(count)
+        found = Photo.public.select_related('owner__user').in_bulk(ids)
+        for photo_id in set(ids) - set(found):
+            self.discard(photo_id)
+        photos = [found[photo_id] for photo_id in ids if photo_id in found]
+        if not photos and ids:
+            return self._probe(count)
+        return photos
+
+    def _sample_ids(self, count):
+        """Pick ids from the pool, or None when the pool is not usable."""
+        self._refresh_if_stale()
+        with self._lock:
+            if self._too_big:
+                return None
+            return random.sample(self._ids, min(count, len(self._ids)))
+
+    def _refresh_if_stale(self):
+        """Reload the pool from the database if it is missing or old."""
+        from imager_images.models import Photo
+
+        refresh = getattr(settings, 'IMAGER_SAMPLING_REFRESH', 600)
+        limit = getattr(settings, 'IMAGER_SAMPLING_POOL_LIMIT', 100000)
+        if self._loaded_at is not None and time.time() - self._loaded_at < refresh:
+            return
+        ids = list(Photo.public.order_by().values_list('id', flat=True)[:limit + 1])
+        with self._lock:
+            self._too_big = len(ids) > limit
+            self._ids = [] if self._too_big else ids
+            self._positions = dict((photo_id, i) for i, photo_id in enumerate(self._ids))
+            self._loaded_at = time.time()
+
+    def _probe(self, count):
+        """Pick photos by seeking to random points of the id index."""
+        from imager_images.models import Photo
+
+        bounds = Photo.public.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return []
+        photos = []
+        seen = set()
+        for attempt in range(count * 3):
+            if len(photos) == count:
+                break
+            pivot = random.randint(bounds['low'], bounds['high'])
+            queryset = Photo.public.select_related('owner__user').exclude(id__in=seen)
+            photo = (queryset.filter(id__gte=pivot).order_by('id').first() or
+                     queryset.filter(id__lt=pivot).order_by('-id').first())
+            if photo is None:
+                break
+            seen.add(photo.id)
+            photos.append(photo)
+        return photos
+
+
+sampler = PublicPhotoSampler()
+
+
+def random_public_photo():
+    """Return one random public photo, or None if there are none."""
+    photos = sampler.sample(1)
+    return photos[0] if photos else None
+
+
+def featured_photos(count=None):
+    """Return a random featured set of public photos for the hero strip."""
+    if count is None:
+        count = getattr(settings, 'IMAGER_FEATURED_COUNT', 5)
+    return sampler.sample(count)
@@ -0,0 +1,260 @@
+"""Ranked full-text search over photo and album titles, descriptions and tags.
+
+On PostgreSQL each row keeps a weighted tsvector in search_vector,
+rewritten whenever the row or its tags change and read through a GIN
+index. Other databases, as in development and tests, fall back to an
+in-process inverted index that ranks with the same weights. Either way
+results come best first as cursor pages, and the caller's queryset
+decides what the viewer may see.
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, TextField, Value
+from django.db.models.functions import Cast
+
+from imager_images.models import Album, Photo
+from imager_images.pagination import (CursorPage,
+                                      CursorPaginator,
+                                      InvalidCursor,
+                                      decode_cursor,
+                                      encode_cursor)
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+# ts_rank's default weights for the title (A), tags (B) and description (C).
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+ORDERING = ('-rank', '-id')
+IN_BATCH = 500
+
+
+def search_config():
+    """Return the PostgreSQL text search configuration to stem words with."""
+    return getattr(settings, 'IMAGER_SEARCH_CONFIG', 'english')
+
+
+def uses_postgres():
+    """Return True if the database can search tsvectors itself."""
+    return connection.vendor == 'postgresql'
+
+
+def tokenize(text):
+    """Return the lower-cased words of text."""
+    return TOKEN.findall((text or '').lower())
+
+
+def document(obj, tag_names=None):
+    """Return the (text, weight) parts a photo or album is found by."""
+    if tag_names is None:
+        tag_names = list(obj.tags.names()) if isinstance(obj, Photo) else []
+    return [(obj.title or '', 'A'), (' '.join(sorted(tag_names)), 'B'), (obj.description or '', 'C')]
+
+
+def search_vector(parts):
+    """Return the weighted tsvector expression for document parts."""
+    vector = None
+    for text, weight in parts:
+        part = SearchVector(Value(text, output_field=TextField()), weight=weight, config=search_config())
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def index(obj, tag_names=None):
+    """Make a saved photo or album findable by its current text."""
+    parts = document(obj, tag_names)
+    if uses_postgres():
+        type(obj).objects.filter(pk=obj.pk).update(search_vector=search_vector(parts))
+    else:
+        memory_index.add(obj, parts)
+
+
+def unindex(obj):
+    """Stop finding a deleted photo or album."""
+    if not uses_postgres():
+        memory_index.discard(obj)
+
+
+def reindex(queryset, batch_size=500):
+    """Index every row of queryset a batch at a time; return how many."""
+    if not uses_postgres():
+        memory_index.clear()
+        return queryset.count()
+    is_photo = queryset.model is Photo
+    done = 0
+    last_id = 0
+    while True:
+        batch = queryset.filter(pk__gt=last_id).order_by('pk').only('id', 'title', 'description')
+        if is_photo:
+            batch = batch.prefetch_related('tags')
+        batch = list(batch[:batch_size])
+        if not batch:
+            return done
+        for obj in batch:
+            index(obj, [tag.name for tag in obj.tags.all()] if is_photo else [])
+        done += len(batch)
+        last_id = batch[-1].pk
+
+
+def search(queryset, text, per_page, after=None, before=None):
+    """Return the page of queryset's rows matching every word of text, best first.
+
+    Each object on the page carries its score as obj.rank. ts_rank is a
+    float4, which does not survive the trip through a cursor, so it is
+    widened to a float8 that compares equal to itself when read back.
+    """
+    if not tokenize(text):
+        return CursorPage([])
+    if uses_postgres():
+        query = SearchQuery(text, config=search_config())
+        ranked = (queryset.filter(search_vector=query)
+                  .annotate(rank=Cast(SearchRank(F('search_vector'), query), FloatField())))
+        return CursorPaginator(ranked, per_page, ORDERING).page(after=after, before=before)
+    return memory_index.page(queryset, text, per_page, after=after, before=before)
+
+
+def _key(obj):
+    """Return the index key of a photo or album."""
+    return (obj._meta.model_name, obj.pk)
+
+
+class SearchIndex(object):
+    """An in-process inverted index, for databases without text search.
+
+    Maps each word to the rows it appears in and the weight it carries
+    there. Loaded lazily, reloaded every IMAGER_SEARCH_INDEX_REFRESH
+    seconds to pick up other processes' writes, and kept current in
+    between by the save and delete receivers. Words are matched as
+    written, without stemming or dropping stop words, so it finds some
+    rows PostgreSQL's text search would not, and the other way round.
+    """
+
+    def __init__(self):
+        """Start unloaded."""
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)
+        self._words = {}
+        self._loaded_at = None
+
+    def add(self, obj, parts):
+        """Index or reindex a row."""
+        with self._lock:
+            if self._loaded_at is not None:
+                self._put(_key(obj), parts)
+
+    def discard(self, obj):
+        """Forget a row."""
+        with self._lock:
+            if self._loaded_at is not None:
+                self._remove(_key(obj))
+
+    def clear(self):
+        """Forget everything so the next search reloads."""
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._words = {}
+            self._loaded_at = None
+
+    def ranked(self, model, text):
+        """Return (score, id) of the model's rows matching every word, best first."""
+        self._refresh_if_stale()
+        name = model._meta.model_name
+        words = set(tokenize(text))
+        with self._lock:
+            postings = [self._postings.get(word, {}) for word in words]
+        if not postings or not all(postings):
+            return []
+        postings.sort(key=len)
+        scores = []
+        for key in postings[0]:
+            if key[0] == name and all(key in posting for posting in postings[1:]):
+                scores.append((sum(posting[key] for posting in postings), key[1]))
+        return sorted(scores, reverse=True)
+
+    def page(self, queryset, text, per_page, after=None, before=None):
+        """Return a cursor page of queryset's rows matching text, best first."""
+        ranked = self.ranked(queryset.model, text)
+        ids = [row_id for score, row_id in ranked]
+        visible = set()
+        for start in range(0, len(ids), IN_BATCH):
+            visible.update(queryset.filter(pk__in=ids[start:start + IN_BATCH])
+                           .values_list('pk', flat=True))
+        ranked = [row for row in ranked if row[1] in visible]
+        if after:
+            cursor = self._cursor(after)
+            rows = [row for row in ranked if row < cursor]
+            has_previous, has_next = True, len(rows) > per_page
+            rows = rows[:per_page]
+        elif before:
+            cursor = self._cursor(before)
+            rows = [row for row in ranked if row > cursor]
+            has_previous, has_next = len(rows) > per_page, True
+            rows = rows[-per_page:]
+        else:
+            rows = ranked[:per_page + 1]
+            has_previous, has_next = False, len(rows) > per_page
+            rows = rows[:per_page]
+        found = queryset.in_bulk([row_id for score, row_id in rows])
+        objects = []
+        for score, row_id in rows:
+            if row_id in found:
+                found[row_id].rank = score
+                objects.append(found[row_id])
+        if not objects:
+            return CursorPage(objects)
+        return CursorPage(
+            objects,
+            next_cursor=encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=encode_cursor(rows[0]) if has_previous else None,
+        )
+
+    def _cursor(self, token):
+        """Decode a (score, id) cursor."""
+        values = decode_cursor(token)
+        if len(values) != 2 or not all(isinstance(value, (int, float)) for value in values):
+            raise InvalidCursor('Cursor does not match ordering.')
+        return (values[0], values[1])
+
+    def _put(self, key, parts):
+        """Replace the postings of a row."""
+        self._remove(key)
+        weights = defaultdict(float)
+        for text, weight in parts:
+            for word in set(tokenize(text)):
+                weights[word] += WEIGHTS[weight]
+        for word, weight in weights.items():
+            self._postings[word][key] = weight
+        self._words[key] = list(weights)
+
+    def _remove(self, key):
+        """Drop the postings of a row."""
+        for word in self._words.pop(key, ()):
+            posting = self._postings.get(word)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[word]
+
+    def _refresh_if_stale(self):
+        """Rebuild the index from the database if it is missing or old."""
+        refresh = getattr(settings, 'IMAGER_SEARCH_INDEX_REFRESH', 600)
+        if self._loaded_at is not None and time.time() - self._loaded_at < refresh:
+            return
+        fresh = SearchIndex()
+        tag_names = defaultdict(list)
+        for photo_id, name in Photo.objects.filter(tags__isnull=False).values_list('id', 'tags__name'):
+            tag_names[photo_id].append(name)
+        for photo in Photo.objects.only('id', 'title', 'description').iterator():
+            fresh._put(_key(photo), document(photo, tag_names[photo.id]))
+        for album in Album.objects.only('id', 'title', 'description').iterator():
+            fresh._put(_key(album), document(album, []))
+        with self._lock:
+            self._postings = fresh._postings
+            self._words = fresh._words
+            self._loaded_at = time.time()
+
+
+memory_index = SearchIndex()
@@ -0,0 +1,289 @@
+"""Synthetic users, photos and albums in realistic volumes, inserted in bulk.
+
+The test factories make a handful of rows; measuring the galleries and
+the library needs hundreds of thousands. Rows here go in with
+bulk_create, a batch at a time, so none of the per-row receivers
+run: afterwards the derived tables (tag index, similar photos, search
+vectors and profile counters) must be rebuilt once, which the seed_data
+command does.
+
+The shapes follow a real site: a few users own most of the photos, tag
+use follows a Zipf curve, most photos are public and albums vary in
+size. Every photo points at one of a small palette of real JPEGs, so
+renditions, media delivery and downloads work on the seeded rows.
+"""
+import io
+import random
+from bisect import bisect
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from PIL import Image, ImageDraw
+from taggit.models import Tag, TaggedItem
+
+from imager_images.bulkupload import store_image
+from imager_images.models import Album, Photo
+from imager_images.renditions import generate_renditions
+from imager_profile.models import ImagerProfile
+
+BATCH_SIZE = 1000
+IN_BATCH = 500
+IMAGE_SIZE = (320, 240)
+# Share of photos and albums at each visibility.
+VISIBILITY = (('PUBLIC', 60), ('SHARED', 15), ('PRIVATE', 25))
+# Share of photos carrying each number of tags.
+TAGS_PER_PHOTO = ((0, 15), (1, 25), (2, 25), (3, 20), (4, 10), (5, 5))
+WORDS = (
+    'nature', 'city', 'portrait', 'street', 'sunset', 'beach', 'mountain',
+    'forest', 'night', 'winter', 'summer', 'travel', 'food', 'family', 'dog',
+    'cat', 'bird', 'flower', 'architecture', 'bridge', 'river', 'lake', 'snow',
+    'rain', 'market', 'festival', 'concert', 'wedding', 'garden', 'harbour',
+)
+CAMERAS = ('iPhone 7', 'Nikon D750', 'Canon EOS 80D', 'Fujifilm X-T2', '')
+
+
+class Weighted(object):
+    """Draws items at random with probability proportional to their weights."""
+
+    def __init__(self, items, weights, rng):
+        """Build the cumulative weights once."""
+        self.items = list(items)
+        self.rng = rng
+        self.totals = []
+        total = 0
+        for weight in weights:
+            total += weight
+            self.totals.append(total)
+
+    def draw(self):
+        """Return one item."""
+        return self.items[bisect(self.totals, self.rng.random() * self.totals[-1])]
+
+
+def weighted(pairs, rng):
+    """Return a Weighted over (item, weight) pairs."""
+    return Weighted([item for item, weight in pairs], [weight for item, weight in pairs], rng)
+
+
+def zipf_weights(count, exponent=1.1):
+    """Return the weights of count ranks on a Zipf curve, most common first."""
+    return [1.0 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def tag_names(count):
+    """Return count distinct tag names, plain words first."""
+    names = list(WORDS[:count])
+    round_ = 2
+    while len(names) < count:
+        names.extend('{}-{}'.format(word, round_) for word in WORDS[:count - len(names)])
+        round_ += 1
+    return names
+
+
+def batches(items, size):
+    """Yield items in lists of at most size."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def insert(model, objects, batch_size=BATCH_SIZE):
+    """Insert objects in bulk and give each its id.
+
+    Backends that cannot return new ids get them looked up as the newest
+    rows of the table, which holds while nothing else is writing to it:
+    seed a database nobody else is using.
+    """
+    for batch in batches(objects, batch_size):
+        model.objects.bulk_create(batch)
+        if batch and batch[0].pk is None:
+            ids = model.objects.order_by('-pk').values_list('pk', flat=True)[:len(batch)]
+            for obj, pk in zip(batch, reversed(list(ids))):
+                obj.pk = pk
+    return objects
+
+
+def make_jpeg(rng, size=IMAGE_SIZE):
+    """Return the bytes of a small JPEG: a gradient with a few shapes on it."""
+    width, height = size
+    top = tuple(rng.randint(0, 255) for _ in range(3))
+    bottom = tuple(rng.randint(0, 255) for _ in range(3))
+    image = Image.new('RGB', size)
+    draw = ImageDraw.Draw(image)
+    for y in range(height):
+        share = float(y) / max(height - 1, 1)
+        draw.line([(0, y), (width, y)],
+                  fill=tuple(int(a + (b - a) * share) for a, b in zip(top, bottom)))
+    for _ in range(rng.randint(3, 8)):
+        x, y = rng.randint(0, width), rng.randint(0, height)
+        box = [x, y, x + rng.randint(10, width // 2), y + rng.randint(10, height // 2)]
+        fill = tuple(rng.randint(0, 255) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.ellipse(box, fill=fill)
+        else:
+            draw.rectangle(box, fill=fill)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=80)
+    return output.getvalue()
+
+
+def seed_images(count, rng):
+    """Store count distinct JPEGs with their renditions.
+
+    Returns a dict per image of the Photo fields it fills in.
+    """
+    storage = Photo._meta.get_field('photo').storage
+    images = []
+    for number in range(count):
+        stored_name, phash = store_image('seed{}.jpg'.format(number), io.BytesIO(make_jpeg(rng)))
+        generate_renditions(Photo(photo=stored_name).photo)
+        images.append({
+            'photo': stored_name,
+            'phash': phash,
+            'width': IMAGE_SIZE[0],
+            'height': IMAGE_SIZE[1],
+            'file_size': storage.size(stored_name),
+            'mime_type': 'image/jpeg',
+            'orientation': 1,
+        })
+    return images
+
+
+def seed_users(count, rng, prefix='seed', batch_size=BATCH_SIZE):
+    """Create count users with profiles; return the profile ids.
+
+    Usernames continue from the users a previous run left behind, and
+    nobody can log in with a password.
+    """
+    start = User.objects.filter(username__startswith=prefix).count()
+    password = make_password(None)
+    users = insert(User, [
+        User(username='{}{}'.format(prefix, start + number),
+             email='{}{}@example.com'.format(prefix, start + number),
+             first_name=rng.choice(WORDS).title(), password=password)
+        for number in range(count)
+    ], batch_size)
+    cameras = [choice for choice, label in ImagerProfile.CAMERA_CHOICES]
+    kinds = [choice for choice, label in ImagerProfile.PHOTOGRAPHY_CHOICES]
+    profiles = insert(ImagerProfile, [
+        ImagerProfile(user_id=user.pk, camera_type=rng.choice(cameras),
+                      type_of_photography=rng.choice(kinds), hireable=rng.random() < 0.3)
+        for user in users
+    ], batch_size)
+    return [profile.pk for profile in profiles]
+
+
+def tag_ids(names, batch_size=BATCH_SIZE):
+    """Return the ids of the tags with these names, creating the missing ones."""
+    ids = {}
+    for batch in batches(names, IN_BATCH):
+        ids.update(Tag.objects.filter(name__in=batch).values_list('name', 'id'))
+    missing = [Tag(name=name, slug=slugify(name)) for name in names if name not in ids]
+    for tag in insert(Tag, missing, batch_size):
+        ids[tag.name] = tag.pk
+    return [ids[name] for name in names]
+
+
+def seed_photos(profile_ids, count, images, tags, rng, batch_size=BATCH_SIZE):
+    """Create count photos spread over the profiles, with tags.
+
+    Returns {profile id: [photo id, ...]}.
+    """
+    owners = Weighted(profile_ids, [rng.paretovariate(1.2) for _ in profile_ids], rng)
+    visibility = weighted(VISIBILITY, rng)
+    tags_per_photo = weighted(TAGS_PER_PHOTO, rng)
+    tag_ranks = Weighted(tag_ids(tags, batch_size), zipf_weights(len(tags)), rng) if tags else None
+    content_type = ContentType.objects.get_for_model(Photo)
+    now = timezone.now()
+    owned = dict((profile_id, []) for profile_id in profile_ids)
+    made = 0
+    while made < count:
+        size = min(batch_size, count - made)
+        photos = []
+        for number in range(made, made + size):
+            published = visibility.draw()
+            taken_at = now - timedelta(days=rng.randint(0, 3650), seconds=rng.randint(0, 86399))
+            photos.append(Photo(
+                owner_id=owners.draw(),
+                title='{} {}'.format(rng.choice(WORDS).title(), number),
+                description=' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 12))),
+                published=published,
+                date_published=(min(now, taken_at + timedelta(days=rng.randint(0, 30)))
+                                if published == 'PUBLIC' else None),
+                taken_at=taken_at,
+                camera_model=rng.choice(CAMERAS),
+                **rng.choice(images)
+            ))
+        with transaction.atomic():
+            insert(Photo, photos, batch_size)
+            tagged = []
+            for photo in photos:
+                owned[photo.owner_id].append(photo.pk)
+                wanted = min(tags_per_photo.draw(), len(tags))
+                chosen = set()
+                while len(chosen) < wanted:
+                    chosen.add(tag_ranks.draw())
+                tagged.extend(TaggedItem(tag_id=tag_id, content_type=content_type, object_id=photo.pk)
+                              for tag_id in chosen)
+            TaggedItem.objects.bulk_create(tagged)
+        made += size
+    return owned
+
+
+def seed_albums(owned, count, rng, batch_size=BATCH_SIZE):
+    """Create count albums of their owners' photos.
+
+    Returns how many albums were made and how many photos they hold.
+    """
+    owners = sorted(profile_id for profile_id, photo_ids in owned.items() if photo_ids)
+    if not owners:
+        return 0, 0
+    pick = Weighted(owners, [len(owned[profile_id]) for profile_id in owners], rng)
+    visibility = weighted(VISIBILITY, rng)
+    albums = []
+    contents = []
+    for number in range(count):
+        owner_id = pick.draw()
+        photo_ids = owned[owner_id]
+        # Mostly a dozen or so photos, now and then a few hundred.
+        size = min(len(photo_ids), int(rng.lognormvariate(2.5, 1.0)) + 1)
+        chosen = rng.sample(photo_ids, size)
+        contents.append(chosen)
+        albums.append(Album(
+            owner_id=owner_id,
+            title='{} {}'.format(rng.choice(WORDS).title(), number),
+            description=' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 12))),
+            published=visibility.draw(),
+            cover_photo_id=chosen[0],
+        ))
+    Membership = Album.photos.through
+    with transaction.atomic():
+        insert(Album, albums, batch_size)
+        rows = [Membership(album_id=album.pk, photo_id=photo_id)
+                for album, chosen in zip(albums, contents) for photo_id in chosen]
+        Membership.objects.bulk_create(rows)
+    return len(albums), len(rows)
+
+
+def seed(users, photos, albums, tags=len(WORDS), images=20, seed=None, prefix='seed',
+         batch_size=BATCH_SIZE):
+    """Create the users, photos and albums; return how many of each were made.
+
+    The same seed makes the same data.
+    """
+    rng = random.Random(seed)
+    palette = seed_images(images, rng) if photos else []
+    profile_ids = seed_users(users, rng, prefix, batch_size)
+    owned = seed_photos(profile_ids, photos, palette, tag_names(tags), rng, batch_size) if profile_ids else {}
+    album_count, memberships = seed_albums(owned, albums, rng, batch_size)
+    return {
+        'users': len(profile_ids),
+        'photos': sum(len(photo_ids) for photo_ids in owned.values()),
+        'albums': album_count,
+        'memberships': memberships,
+        'images': len(palette),
+    }
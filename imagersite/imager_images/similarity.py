@@ -0,0 +1,123 @@
+"""Precomputed "similar photos" index built from shared tags.
+
+Only public photos are ever listed as similar, since only they can be
+shown to every viewer; a photo enters or leaves the other lists as its
+visibility changes.
+"""
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count
+from taggit.models import TaggedItem
+
+from imager_images.models import Photo, SimilarPhoto
+
+
+def neighbours_kept():
+    """Return how many similar photos are stored per photo."""
+    return getattr(settings, 'IMAGER_SIMILAR_PHOTOS_KEPT', 20)
+
+
+def _photo_tags():
+    """Return the tagged items that belong to photos."""
+    return TaggedItem.objects.filter(content_type=ContentType.objects.get_for_model(Photo))
+
+
+def find_neighbours(photo_id, limit=None, public_only=True):
+    """Return (photo id, shared tag count) for the photos sharing most tags.
+
+    Only public photos are candidates unless public_only is False.
+    """
+    tagged = _photo_tags()
+    tag_ids = tagged.filter(object_id=photo_id).values('tag_id')
+    rows = tagged.filter(tag_id__in=tag_ids).exclude(object_id=photo_id)
+    if public_only:
+        rows = rows.filter(object_id__in=Photo.public.values('id'))
+    rows = (rows.values('object_id')
+            .annotate(shared=Count('id'))
+            .order_by('-shared', '-object_id'))
+    if limit is not None:
+        rows = rows[:limit]
+    return [(row['object_id'], row['shared']) for row in rows]
+
+
+def shared_tag_count(photo_id, other_id):
+    """Return how many tags two photos have in common."""
+    tagged = _photo_tags()
+    return tagged.filter(object_id=other_id,
+                         tag_id__in=tagged.filter(object_id=photo_id).values('tag_id')).count()
+
+
+def rebuild_similar_photos(photo_id):
+    """Recompute one photo's list of similar photos from scratch."""
+    SimilarPhoto.objects.filter(photo_id=photo_id).delete()
+    SimilarPhoto.objects.bulk_create([
+        SimilarPhoto(photo_id=photo_id, similar_id=similar_id, shared_tags=shared)
+        for similar_id, shared in find_neighbours(photo_id, neighbours_kept())
+    ])
+
+
+def _place(photo_id, similar_id, shared):
+    """Put similar_id into photo_id's list with a new score, trimming the tail."""
+    entries = SimilarPhoto.objects.filter(photo_id=photo_id)
+    if not shared:
+        entries.filter(similar_id=similar_id).delete()
+        return
+    updated = entries.filter(similar_id=similar_id).update(shared_tags=shared)
+    if not updated:
+        SimilarPhoto.objects.create(photo_id=photo_id, similar_id=similar_id, shared_tags=shared)
+    overflow = list(entries.order_by('-shared_tags', '-similar_id')
+                    .values_list('id', flat=True)[neighbours_kept():])
+    if overflow:
+        SimilarPhoto.objects.filter(id__in=overflow).delete()
+
+
+def _relist(photo_id):
+    """Correct photo_id's entry in the lists it is in or now belongs in.
+
+    A public photo is placed in the lists of the photos closest to it,
+    public or not, and rescored in the lists it was already in; a photo
+    that is not public is taken out of every list.
+    """
+    listed_in = set(SimilarPhoto.objects.filter(similar_id=photo_id).values_list('photo_id', flat=True))
+    if not Photo.public.filter(pk=photo_id).exists():
+        SimilarPhoto.objects.filter(similar_id=photo_id).delete()
+        return
+    closest = dict(find_neighbours(photo_id, neighbours_kept(), public_only=False))
+    for other_id, shared in closest.items():
+        _place(other_id, photo_id, shared)
+    for other_id in listed_in - set(closest):
+        _place(other_id, photo_id, shared_tag_count(photo_id, other_id))
+
+
+@transaction.atomic
+def photo_tags_changed(photo_id):
+    """Update the index after one photo's tags were added or removed.
+
+    The photo's own list is rebuilt, and its score is corrected in the
+    lists of its closest photos and of those already listing it, so each
+    change costs a bounded number of queries. Photos further away may
+    keep a stale score until the next rebuild_similar_photos run.
+    """
+    rebuild_similar_photos(photo_id)
+    _relist(photo_id)
+
+
+@transaction.atomic
+def photo_visibility_changed(photo_id):
+    """Add a photo that went public to the lists, or drop one that went private."""
+    _relist(photo_id)
+
+
+def similar_public_photos(photo, count=5):
+    """Return the public photos most similar to photo, best first.
+
+    The index holds public photos only; the filter covers a photo made
+    private since its entries were written.
+    """
+    entries = (SimilarPhoto.objects
+               .filter(photo=photo, similar__published='PUBLIC')
+               .select_related('similar')
+               .prefetch_related('similar__tags')
+               .order_by('-shared_tags', '-similar_id')[:count])
+    return [entry.similar for entry in entries]
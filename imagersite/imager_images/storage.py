@@ -0,0 +1,238 @@
+"""Content-addressed, sharded file storage for photos."""
+import errno
+import hashlib
+import os
+import re
+import tempfile
+from datetime import datetime
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import force_text
+
+# "ab/cd/abcd...", optionally followed by more of the name, as in the
+# renditions stored next to an original.
+ADDRESSED_NAME = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}(\.|$)')
+# Just the address and an extension: the name of an original.
+ORIGINAL_NAME = re.compile(r'^([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}(\.[0-9a-z]+)?$')
+EXTENSION_ALIASES = {'.jpeg': '.jpg'}
+
+
+def is_addressed(name):
+    """Return True if name already lives at, or next to, a content address."""
+    return bool(ADDRESSED_NAME.match(name or ''))
+
+
+def is_original(name):
+    """Return True if name is the address of an original, not a file beside it."""
+    return bool(ORIGINAL_NAME.match(name or ''))
+
+
+def address(digest, original_name):
+    """Return the sharded name for a sha256 hex digest, keeping the extension."""
+    ext = os.path.splitext(original_name)[1].lower()
+    ext = EXTENSION_ALIASES.get(ext, ext)
+    return '{}/{}/{}{}'.format(digest[:2], digest[2:4], digest, ext)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Store every file under the sha256 of its bytes.
+
+    Files go to "ab/cd/<digest>.<ext>", so no directory grows past 65536
+    shards and the same bytes saved twice land on the same name, stored
+    once. Because a name never needs to be made unique, the usual
+    get_available_name probing is skipped. Originals are always hashed,
+    whatever name they are offered under; only names derived from an
+    address, like the renditions kept beside an original, are saved as
+    given.
+    """
+
+    def save(self, name, content, max_length=None):
+        """Save content and return the name it is stored under."""
+        return self.store(name, content)[0]
+
+    def store(self, name, content):
+        """Save content; return its name and whether this call wrote the file.
+
+        A file that was already stored is shared with whoever else points
+        at it, and is touched so a sweep leaves it to the new caller.
+        """
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if is_addressed(name) and not is_original(name):
+            if self.exists(name):
+                return force_text(name), False
+            self._place(name, content)
+            return force_text(name), True
+        if hasattr(content, 'temporary_file_path'):
+            name = address(self._digest(content), name)
+            if self._touch(name):
+                return force_text(name), False
+            created = self._claim_file(content.temporary_file_path(), name)
+            return force_text(name), created
+        return self._stream_to_address(name, content)
+
+    def generate_filename(self, filename):
+        """Keep only the base name; callers never choose where a file goes."""
+        return super(ContentAddressedStorage, self).generate_filename(os.path.basename(filename))
+
+    def get_available_name(self, name, max_length=None):
+        """Return name unchanged; an address is unique to its bytes."""
+        return name
+
+    def originals(self):
+        """Yield the name of every original in the storage."""
+        for root, dirs, files in os.walk(self.location):
+            for filename in files:
+                name = os.path.relpath(os.path.join(root, filename), self.location)
+                name = name.replace(os.sep, '/')
+                if is_original(name):
+                    yield name
+
+    def sweep(self, name, cutoff):
+        """Delete name unless it was stored or touched since cutoff; return True if deleted.
+
+        The file is moved aside before it is checked again, so a caller
+        touching it from then on finds it gone and writes it afresh, and
+        one that touched it just before the move gets it put back.
+        """
+        path = self.path(name)
+        aside = path + '.sweeping'
+        try:
+            if self._modified(path) >= cutoff:
+                return False
+            os.rename(path, aside)
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                return False
+            raise
+        if self._modified(aside) >= cutoff:
+            try:
+                os.link(aside, path)
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+            os.remove(aside)
+            return False
+        os.remove(aside)
+        return True
+
+    def _modified(self, path):
+        """Return when the file at path was last written or touched."""
+        return datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+
+    def _touch(self, name):
+        """Mark name as just claimed; return False if it is not stored."""
+        try:
+            os.utime(self.path(name), None)
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                return False
+            raise
+        return True
+
+    def _digest(self, content):
+        """Return the sha256 of content, leaving it rewound."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def _claim(self, path, name):
+        """Link the file at path to name unless name exists; return True if linked.
+
+        Linking fails rather than replaces, so of two racing writers of
+        the same bytes exactly one learns that it created the file.
+        """
+        self._prepare_directory(name)
+        try:
+            os.link(path, self.path(name))
+        except OSError as error:
+            if error.errno == errno.EEXIST:
+                return False
+            raise
+        self._set_permissions(name)
+        return True
+
+    def _claim_file(self, path, name):
+        """Move the file at path to name unless name exists; return True if moved."""
+        try:
+            created = self._claim(path, name)
+        except OSError as error:
+            if error.errno != errno.EXDEV:
+                raise
+            # Another filesystem: copy next to the storage and link from there.
+            with open(path, 'rb') as source:
+                return self._stream_to_address(name, File(source, name))[1]
+        if created:
+            os.remove(path)
+        return created
+
+    def _stream_to_address(self, original_name, content):
+        """Copy content to a temporary file while hashing, then link it at its address.
+
+        Returns the name and whether this call created the file.
+        """
+        self._make_directory(self.location)
+        fd, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=self.location)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            name = address(digest.hexdigest(), original_name)
+            created = not self._touch(name) and self._claim(temp_path, name)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return force_text(name), created
+
+    def _place(self, name, content):
+        """Write content at exactly name."""
+        self._prepare_directory(name)
+        fd, temp_path = tempfile.mkstemp(prefix='.incoming-', dir=os.path.dirname(self.path(name)))
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            os.rename(temp_path, self.path(name))
+            self._set_permissions(name)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _prepare_directory(self, name):
+        """Create the shard directories name will be written into."""
+        self._make_directory(os.path.dirname(self.path(name)))
+
+    def _make_directory(self, directory):
+        """Create directory and its parents if they are missing."""
+        try:
+            if self.directory_permissions_mode is not None:
+                old_umask = os.umask(0)
+                try:
+                    os.makedirs(directory, self.directory_permissions_mode)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+    def _set_permissions(self, name):
+        """Apply the configured file mode to a newly written file."""
+        # mkstemp creates files readable by their owner only, so fall back
+        # to the usual world-readable mode when none is configured.
+        mode = self.file_permissions_mode
+        os.chmod(self.path(name), mode if mode is not None else 0o644)
+
+
+photo_storage = ContentAddressedStorage()
@@ -0,0 +1,102 @@
+"""Denormalised index of public photos by tag, with live counts."""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from taggit.models import Tag
+
+from imager_images.models import Photo, PublicTaggedPhoto, TagCount
+from imager_images.pagination import CursorPaginator
+
+
+def _adjust_counts(tag_ids, delta):
+    """Add delta to the public photo count of each tag."""
+    if not tag_ids:
+        return
+    if delta > 0:
+        existing = set(TagCount.objects.filter(tag_id__in=tag_ids).values_list('tag_id', flat=True))
+        for tag_id in set(tag_ids) - existing:
+            try:
+                with transaction.atomic():
+                    TagCount.objects.create(tag_id=tag_id)
+            except IntegrityError:
+                pass
+    TagCount.objects.filter(tag_id__in=tag_ids).update(public_photos=F('public_photos') + delta)
+
+
+@transaction.atomic
+def sync_photo(photo):
+    """Bring the index entries and counts of one photo up to date."""
+    if photo.published == 'PUBLIC':
+        wanted = set(photo.tags.values_list('id', flat=True))
+    else:
+        wanted = set()
+    current = set(PublicTaggedPhoto.objects.filter(photo=photo).values_list('tag_id', flat=True))
+    added = wanted - current
+    removed = current - wanted
+    if removed:
+        PublicTaggedPhoto.objects.filter(photo=photo, tag_id__in=removed).delete()
+        _adjust_counts(removed, -1)
+    if added:
+        PublicTaggedPhoto.objects.bulk_create([
+            PublicTaggedPhoto(tag_id=tag_id, photo=photo, date_uploaded=photo.date_uploaded)
+            for tag_id in added
+        ])
+        _adjust_counts(added, 1)
+
+
+def forget_photo(photo):
+    """Take a photo that is about to be deleted out of the counts."""
+    _adjust_counts(list(PublicTaggedPhoto.objects.filter(photo=photo)
+                        .values_list('tag_id', flat=True)), -1)
+
+
+def tag_id(slug):
+    """Return the id of the tag with this slug, or None if there is none."""
+    return Tag.objects.filter(slug=slug).values_list('id', flat=True).first()
+
+
+def tag_entries(tag_id):
+    """Return the index entries of the public photos filed under a tag."""
+    if tag_id is None:
+        return PublicTaggedPhoto.objects.none()
+    return PublicTaggedPhoto.objects.filter(tag_id=tag_id).only('date_uploaded', 'photo')
+
+
+class TaggedPhotoPaginator(CursorPaginator):
+    """Page the public photos of a tag by seeking its index entries.
+
+    Each page is a range read of the (tag, date_uploaded, photo) index
+    followed by one fetch of those photos by id from photos, newest first.
+    Photos are fetched from the public ones unless told otherwise, so a
+    stale index entry can shorten a page but never show a private photo.
+    """
+
+    def __init__(self, tag_id, per_page, photos=None):
+        """Set up the paginator over the tag's entries."""
+        super(TaggedPhotoPaginator, self).__init__(
+            tag_entries(tag_id), per_page, ('-date_uploaded', '-photo_id'))
+        self.photos = Photo.public.all() if photos is None else photos
+
+    def page(self, after=None, before=None):
+        """Return the page of photos after or before the cursor tokens."""
+        page = super(TaggedPhotoPaginator, self).page(after, before)
+        if page.object_list:
+            found = self.photos.in_bulk([entry.photo_id for entry in page])
+            page.object_list = [found[entry.photo_id] for entry in page if entry.photo_id in found]
+        return page
+
+
+def popular_tags(limit=50):
+    """Return the tag counts with the most public photos, biggest first."""
+    return (TagCount.objects.filter(public_photos__gt=0)
+            .select_related('tag')
+            .order_by('-public_photos', 'tag__name')[:limit])
+
+
+@transaction.atomic
+def rebuild():
+    """Recreate the whole index and every count from the tagging tables."""
+    PublicTaggedPhoto.objects.all().delete()
+    TagCount.objects.all().delete()
+    for photo in Photo.public.order_by('id').iterator():
+        sync_photo(photo)
@@ -1,12 +1,65 @@
-from django.test import TestCase, Client, RequestFactory
-from django.contrib.auth.models import User
-from django.urls import reverse_lazy
+import datetime
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from io import BytesIO
+
+import factory
+from PIL import Image, ImageOps
+from bs4 import BeautifulSoup as Soup
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages import constants
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, override_settings, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.six import StringIO
+from django.utils.six.moves.urllib.parse import urlencode
+from taggit.models import Tag, TaggedItem
+
+from imager_images import uploads
+from imager_images.benchmark import url_names
+from imager_images.bulkupload import bulk_upload, sweep_orphans
+from imager_images.cache import LOCK_KEY, remember
+from imager_images.duplicates import BKTree, dhash, distance, index
+from imager_images.forms import AddPhotoForm, EditPhotoForm
+from imager_images.largeadmin import EstimatedCountPaginator
+from imager_images.metadata import exif_fields, extract, schedule
+from imager_images.models import (Album,
+                                  Photo,
+                                  PublicTaggedPhoto,
+                                  SimilarPhoto,
+                                  TagCount,
+                                  UploadSession,
+                                  visible_to)
+from imager_images.pagination import CursorPaginator
+from imager_images.profilestats import COUNTER_FIELDS
+from imager_images.renditions import generate_renditions, rendition_name, rendition_specs
+from imager_images.sampling import featured_photos, random_public_photo, sampler
+from imager_images.search import memory_index, search
+from imager_images.similarity import rebuild_similar_photos, similar_public_photos
+from imager_images.storage import is_addressed, photo_storage
+from imager_images.tagindex import tag_entries, tag_id, TaggedPhotoPaginator
+from imager_images.tieredcache import TieredCache
+from imager_images.uploads import expire_sessions
+from imager_profile.middleware import PROFILE_KEY
 from imager_profile.models import ImagerProfile
-from imager_images.models import Photo, Album
 from imager_profile.tests import UserFactory
-import factory
-from bs4 import BeautifulSoup as Soup
 
 
 class PhotoFactory(factory.django.DjangoModelFactory):
@@ -37,6 +90,7 @@ class PhotoAlbumTests(TestCase):
 
     def setUp(self):
         """The appropriate setup for the appropriate test."""
+        cache.clear()
         self.client = Client()
         self.request = RequestFactory()
         self.users = [UserFactory.create() for i in range(20)]
@@ -360,3 +414,1962 @@ class PhotoAlbumTests(TestCase):
         response = self.client.get('/images/photos/tagged/burpkin/')
         soup = Soup(response.content, 'html.parser')
         self.assertEqual(len(soup.find_all('img')), 2)
+
+
+@override_settings(IMAGER_GALLERY_PAGE_SIZE=3)
+class GalleryPaginationTests(TestCase):
+    """Test the cursor pagination on the public galleries."""
+
+    def setUp(self):
+        """Make a few public photos and albums."""
+        self.client = Client()
+        self.photos = [PhotoFactory.create(published='PUBLIC') for i in range(7)]
+        self.albums = [AlbumFactory.create(published='PUBLIC') for i in range(7)]
+
+    def gallery_ids(self, url, **params):
+        """Return the ids on one gallery page and the page object."""
+        response = self.client.get(url, params)
+        page = response.context['page_obj']
+        return [obj.id for obj in page.object_list], page
+
+    def test_first_page_is_newest_photos(self):
+        """The first page holds the newest photos, newest first."""
+        ids, page = self.gallery_ids('/images/photos/')
+        self.assertEqual(ids, [p.id for p in reversed(self.photos)][:3])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_walking_next_cursors_visits_every_photo_once(self):
+        """Following the next cursors covers the gallery without overlap."""
+        seen = []
+        ids, page = self.gallery_ids('/images/photos/')
+        seen.extend(ids)
+        while page.has_next():
+            ids, page = self.gallery_ids('/images/photos/', after=page.next_cursor)
+            seen.extend(ids)
+        self.assertEqual(seen, [p.id for p in reversed(self.photos)])
+
+    def test_new_upload_does_not_shift_older_pages(self):
+        """A photo added after page one was served does not reappear on page two."""
+        first_ids, page = self.gallery_ids('/images/photos/')
+        PhotoFactory.create(published='PUBLIC')
+        second_ids, page = self.gallery_ids('/images/photos/', after=page.next_cursor)
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertEqual(second_ids, [p.id for p in reversed(self.photos)][3:6])
+
+    def test_previous_cursor_returns_to_prior_page(self):
+        """The previous cursor of page two points back at page one."""
+        first_ids, page = self.gallery_ids('/images/photos/')
+        second_ids, page = self.gallery_ids('/images/photos/', after=page.next_cursor)
+        back_ids, page = self.gallery_ids('/images/photos/', before=page.previous_cursor)
+        self.assertEqual(back_ids, first_ids)
+        self.assertFalse(page.has_previous())
+
+    def test_album_gallery_is_paginated(self):
+        """The album gallery is cursor paginated too."""
+        ids, page = self.gallery_ids('/images/albums/')
+        self.assertEqual(ids, [a.id for a in reversed(self.albums)][:3])
+
+    def test_invalid_cursor_is_not_found(self):
+        """A garbage cursor gives a 404 rather than a server error."""
+        response = self.client.get('/images/photos/', {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_gallery_renders_next_link(self):
+        """The gallery template links to the next page."""
+        response = self.client.get('/images/photos/')
+        soup = Soup(response.content, 'html.parser')
+        link = soup.find('li', class_='next').find('a')
+        self.assertTrue(link['href'].startswith('?after='))
+
+
+class PublicPhotoSamplerTests(TestCase):
+    """Test the random public photo sampler behind the home page."""
+
+    def setUp(self):
+        """Make a mix of public and private photos."""
+        cache.clear()
+        self.sampler = sampler
+        self.sampler.clear()
+        self.public = [PhotoFactory.create(published='PUBLIC') for i in range(6)]
+        self.private = [PhotoFactory.create() for i in range(4)]
+
+    def test_random_public_photo_is_public(self):
+        """The sampled photo is always a public one."""
+        for i in range(10):
+            self.assertIn(random_public_photo(), self.public)
+
+    def test_featured_photos_are_distinct_and_public(self):
+        """The featured set has no repeats and only public photos."""
+        photos = featured_photos(4)
+        self.assertEqual(len(photos), 4)
+        self.assertEqual(len(set(p.id for p in photos)), 4)
+        self.assertTrue(set(photos) <= set(self.public))
+
+    def test_photo_made_private_leaves_the_pool(self):
+        """Saving a photo as private takes it out of the pool."""
+        featured_photos(1)
+        for photo in self.public[1:]:
+            photo.published = 'PRIVATE'
+            photo.save()
+        self.assertEqual(featured_photos(5), [self.public[0]])
+
+    def test_new_public_photo_joins_the_pool(self):
+        """A newly public photo can be sampled without a pool reload."""
+        featured_photos(1)
+        photo = PhotoFactory.create(published='PUBLIC')
+        self.assertIn(photo, featured_photos(20))
+
+    def test_deleted_photo_leaves_the_pool(self):
+        """Deleted photos are never sampled."""
+        featured_photos(1)
+        deleted = self.public.pop()
+        deleted.delete()
+        self.assertNotIn(deleted, featured_photos(20))
+
+    @override_settings(IMAGER_SAMPLING_POOL_LIMIT=2)
+    def test_probe_used_when_pool_is_too_big(self):
+        """Large catalogues are sampled through the id index instead."""
+        photos = featured_photos(3)
+        self.assertEqual(len(photos), 3)
+        self.assertTrue(set(photos) <= set(self.public))
+
+    def test_home_page_query_count_does_not_grow_with_photos(self):
+        """The home page costs the same however many public photos exist."""
+        self.client.get('/')
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get('/')
+        for i in range(10):
+            PhotoFactory.create(published='PUBLIC')
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get('/')
+
+    def test_home_page_without_public_photos(self):
+        """The home page still renders when nothing is public."""
+        for photo in self.public:
+            photo.delete()
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['random_photo'])
+
+
+class PhotoRenditionTests(TestCase):
+    """Test the renditions written when a photo is saved."""
+
+    def setUp(self):
+        """Make a public photo."""
+        self.photo = PhotoFactory.create(published='PUBLIC')
+
+    def test_renditions_are_written_on_save(self):
+        """Every configured size is stored next to the original."""
+        storage = self.photo.photo.storage
+        for rendition in rendition_specs():
+            self.assertTrue(storage.exists(rendition_name(self.photo.photo.name, rendition)))
+
+    def test_thumb_rendition_has_fixed_size(self):
+        """The thumb rendition is cropped to exactly 100x100."""
+        thumb = self.photo.renditions['thumb']
+        with self.photo.photo.storage.open(thumb.name) as f:
+            self.assertEqual(Image.open(f).size, (100, 100))
+
+    def test_display_rendition_is_never_upscaled(self):
+        """Bounded renditions keep the aspect ratio and fit their box."""
+        display = self.photo.renditions['display']
+        with self.photo.photo.storage.open(display.name) as f:
+            width, height = Image.open(f).size
+        self.assertTrue(width <= 1200 and height <= 1200)
+
+    def test_renditions_follow_exif_orientation(self):
+        """A photo stored on its side, as phones do, is rendered upright."""
+        # A big-endian TIFF block holding one tag: orientation 6, rotate 90 clockwise.
+        exif = (b'Exif\x00\x00MM\x00\x2a\x00\x00\x00\x08\x00\x01'
+                b'\x01\x12\x00\x03\x00\x00\x00\x01\x00\x06\x00\x00\x00\x00\x00\x00')
+        output = BytesIO()
+        Image.new('RGB', (60, 40), 'red').save(output, 'JPEG', exif=exif)
+        photo = PhotoFactory.create(photo=SimpleUploadedFile('side.jpg', output.getvalue()))
+        generate_renditions(photo.photo, force=True)
+        with photo.photo.storage.open(photo.renditions['card'].name) as card:
+            self.assertEqual(Image.open(card).size, (40, 60))
+
+    def test_srcset_covers_both_densities(self):
+        """The srcset lists the 1x and 2x files."""
+        card = self.photo.renditions['card']
+        self.assertEqual(card.srcset, '{} 1x, {} 2x'.format(card.url, card.url_2x))
+
+    def test_photo_without_image_has_no_renditions(self):
+        """A photo without an image has no renditions to look up."""
+        photo = Photo()
+        photo.save()
+        self.assertNotIn('thumb', photo.renditions)
+
+    def test_gallery_serves_renditions_not_originals(self):
+        """The gallery img tags point at the card rendition."""
+        response = self.client.get('/images/photos/')
+        soup = Soup(response.content, 'html.parser')
+        self.assertEqual(soup.find('img')['src'], self.photo.renditions['card'].url)
+
+    def test_backfill_command_writes_missing_renditions(self):
+        """The management command regenerates deleted renditions."""
+        storage = self.photo.photo.storage
+        name = self.photo.renditions['thumb'].name
+        storage.delete(name)
+        call_command('generate_renditions', stdout=StringIO())
+        self.assertTrue(storage.exists(name))
+
+
+# The most queries each page may issue, whatever the size of the library
+# behind it. Raise a budget only with a reason; a page that starts to
+# scale with its data will blow through these as the seed grows.
+QUERY_BUDGETS = {
+    'library': 7,
+    # One aggregate each for the conditional GET validators.
+    'album': 6,
+    'photo': 6,
+    'edit_photo': 4,
+    'edit_album': 7,
+    'album_gallery': 3,
+    'photo_gallery': 3,
+    # The tag id, a page of the tag index, then the photos on it.
+    'tagged_photos': 5,
+}
+
+
+class QueryBudgetTests(TestCase):
+    """Hold the gallery and library pages to a fixed query budget."""
+
+    def setUp(self):
+        """Log in a user who owns everything seeded."""
+        self.user = UserFactory.create()
+        self.client.force_login(self.user)
+        self.album = AlbumFactory.create(owner=self.user.profile, published='PUBLIC')
+
+    def seed(self, count):
+        """Add count tagged public photos and albums with covers."""
+        for i in range(count):
+            photo = PhotoFactory.create(owner=self.user.profile, published='PUBLIC')
+            photo.tags.add('budget', 'tag{}'.format(i))
+            self.album.photos.add(photo)
+            AlbumFactory.create(owner=self.user.profile, published='PUBLIC', cover_photo=photo)
+
+    def assertWithinQueryBudget(self, url_name, *args):
+        """Fetch the named url and fail if it goes over its budget."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse_lazy(url_name, args=args))
+        self.assertEqual(response.status_code, 200)
+        budget = QUERY_BUDGETS[url_name]
+        self.assertLessEqual(
+            len(queries), budget,
+            '{} made {} queries, budget is {}:\n{}'.format(
+                url_name, len(queries), budget,
+                '\n'.join(query['sql'] for query in queries.captured_queries)))
+        return len(queries)
+
+    def assertBudgetHoldsAsDataGrows(self, url_name, *args):
+        """The query count is the same for a small and a larger seed."""
+        self.seed(2)
+        small = self.assertWithinQueryBudget(url_name, *args)
+        self.seed(8)
+        large = self.assertWithinQueryBudget(url_name, *args)
+        self.assertEqual(small, large)
+
+    def test_library_budget(self):
+        """The library does not query per photo or per album."""
+        self.assertBudgetHoldsAsDataGrows('library')
+
+    def test_album_budget(self):
+        """The album page does not query per photo."""
+        self.assertBudgetHoldsAsDataGrows('album', self.album.id)
+
+    def test_photo_budget(self):
+        """The photo page loads the photo and its owner once."""
+        photo = PhotoFactory.create(owner=self.user.profile)
+        self.assertWithinQueryBudget('photo', photo.id)
+
+    def test_edit_photo_budget(self):
+        """The edit photo page loads the photo and its owner once."""
+        photo = PhotoFactory.create(owner=self.user.profile)
+        self.assertWithinQueryBudget('edit_photo', photo.id)
+
+    def test_edit_album_budget(self):
+        """The edit album page loads the album and its owner once."""
+        self.assertWithinQueryBudget('edit_album', self.album.id)
+
+    def test_album_gallery_budget(self):
+        """The album gallery does not query per cover photo."""
+        self.assertBudgetHoldsAsDataGrows('album_gallery')
+
+    def test_photo_gallery_budget(self):
+        """The photo gallery does not query per owner."""
+        self.assertBudgetHoldsAsDataGrows('photo_gallery')
+
+    def test_tagged_photos_budget(self):
+        """The tag gallery does not query per owner."""
+        self.assertBudgetHoldsAsDataGrows('tagged_photos', 'budget')
+
+
+class ResolvedObjectTests(TestCase):
+    """Test that detail and edit views resolve their object once."""
+
+    def setUp(self):
+        """Make an owner, a stranger and their photo and album."""
+        self.owner = UserFactory.create()
+        self.stranger = UserFactory.create()
+        self.photo = PhotoFactory.create(owner=self.owner.profile)
+        self.album = AlbumFactory.create(owner=self.owner.profile)
+
+    def object_queries(self, url, user):
+        """Return the captured queries that select from the object tables."""
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        sql = [q['sql'] for q in queries.captured_queries]
+        return response, [q for q in sql if q.startswith('SELECT') and (
+            'FROM "imager_images_photo"' in q or 'FROM "imager_images_album"' in q or
+            'FROM "imager_profile_imagerprofile"' in q)]
+
+    def test_photo_view_fetches_photo_once(self):
+        """The photo and its owner come from a single query."""
+        response, queries = self.object_queries('/images/photos/{}/'.format(self.photo.id), self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([q for q in queries if 'FROM "imager_images_photo"' in q and
+                              '"imager_images_photo"."id" = ' in q]), 1)
+
+    def test_album_view_fetches_album_once(self):
+        """The album and its owner come from a single query."""
+        response, queries = self.object_queries('/images/albums/{}/'.format(self.album.id), self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([q for q in queries if 'FROM "imager_images_album"' in q]), 1)
+        self.assertEqual(response.context['album'], self.album)
+
+    def test_edit_photo_forbidden_for_stranger(self):
+        """Only the owner can edit a photo, even a public one."""
+        self.photo.published = 'PUBLIC'
+        self.photo.save()
+        self.client.force_login(self.stranger)
+        response = self.client.get('/images/photos/{}/edit/'.format(self.photo.id))
+        self.assertEqual(response.status_code, 403)
+
+    def test_missing_album_is_not_found(self):
+        """A missing album is a 404, not a server error."""
+        self.client.force_login(self.stranger)
+        response = self.client.get('/images/albums/999999/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_ownerless_photo_visible_only_when_public(self):
+        """A photo without an owner is hidden unless it is public."""
+        photo = PhotoFactory.create()
+        self.client.force_login(self.stranger)
+        response = self.client.get('/images/photos/{}/'.format(photo.id))
+        self.assertEqual(response.status_code, 403)
+
+
+class SimilarPhotoIndexTests(TestCase):
+    """Test the precomputed similar photos index."""
+
+    def setUp(self):
+        """Make a few public photos with overlapping tags."""
+        self.photo = PhotoFactory.create(published='PUBLIC')
+        self.close = PhotoFactory.create(published='PUBLIC')
+        self.far = PhotoFactory.create(published='PUBLIC')
+        self.hidden = PhotoFactory.create()
+        self.photo.tags.add('red', 'green', 'blue')
+        self.close.tags.add('red', 'green')
+        self.far.tags.add('blue')
+        self.hidden.tags.add('red', 'green', 'blue')
+
+    def similar(self, photo):
+        """Return the similar public photos of photo."""
+        return similar_public_photos(photo)
+
+    def test_similar_photos_ranked_by_shared_tags(self):
+        """Photos sharing more tags come first."""
+        self.assertEqual(self.similar(self.photo), [self.close, self.far])
+
+    def test_private_photos_are_not_suggested(self):
+        """Private photos never show up as similar."""
+        self.assertNotIn(self.hidden, self.similar(self.close))
+
+    def test_neighbour_lists_are_updated(self):
+        """Tagging a photo adds it to the lists of the photos it now resembles."""
+        self.assertEqual(self.similar(self.far), [self.photo])
+        newcomer = PhotoFactory.create(published='PUBLIC')
+        newcomer.tags.add('blue', 'yellow')
+        self.far.tags.add('yellow')
+        self.assertEqual(self.similar(self.far), [newcomer, self.photo])
+
+    def test_removing_tags_drops_the_pair(self):
+        """A photo with no tags in common falls out of the list."""
+        self.far.tags.remove('blue')
+        self.assertEqual(self.similar(self.photo), [self.close])
+        self.assertEqual(self.similar(self.far), [])
+
+    def test_visibility_change_is_respected_without_reindexing(self):
+        """Making a photo public makes it suggestable straight away."""
+        self.hidden.published = 'PUBLIC'
+        self.hidden.save()
+        self.assertEqual(self.similar(self.close)[0], self.hidden)
+
+    def test_private_photos_do_not_take_the_slots(self):
+        """Photos other viewers cannot see are never kept as neighbours."""
+        with self.settings(IMAGER_SIMILAR_PHOTOS_KEPT=1):
+            rebuild_similar_photos(self.close.id)
+            self.assertEqual(self.similar(self.close), [self.photo])
+        self.assertFalse(SimilarPhoto.objects.filter(similar=self.hidden).exists())
+
+    def test_photos_made_private_leave_the_lists(self):
+        """A photo that stops being public is dropped from other photos' lists."""
+        self.close.published = 'PRIVATE'
+        self.close.save()
+        self.assertFalse(SimilarPhoto.objects.filter(similar=self.close).exists())
+        self.assertEqual(self.similar(self.photo), [self.far])
+
+    def test_rebuild_command_matches_incremental_index(self):
+        """A full rebuild gives the same lists as incremental updates."""
+        before = [self.similar(p) for p in (self.photo, self.close, self.far)]
+        call_command('rebuild_similar_photos', stdout=StringIO())
+        self.assertEqual(before, [self.similar(p) for p in (self.photo, self.close, self.far)])
+
+    def test_photo_page_lists_similar_photos(self):
+        """The photo page shows the indexed similar photos."""
+        response = self.client.get('/images/photos/{}/'.format(self.photo.id))
+        self.assertEqual(response.context['tag_photos'], [self.close, self.far])
+
+
+class TagIndexTests(TestCase):
+    """Test the denormalised public tag index and counts."""
+
+    def setUp(self):
+        """Make some tagged photos."""
+        self.public = [PhotoFactory.create(published='PUBLIC') for i in range(3)]
+        self.private = PhotoFactory.create()
+        for photo in self.public:
+            photo.tags.add('sky')
+        self.public[0].tags.add('sea')
+        self.private.tags.add('sky', 'sea')
+
+    def count(self, name):
+        """Return the maintained public photo count of a tag."""
+        return TagCount.objects.get(tag__name=name).public_photos
+
+    def test_counts_only_public_photos(self):
+        """Private photos are not counted."""
+        self.assertEqual(self.count('sky'), 3)
+        self.assertEqual(self.count('sea'), 1)
+
+    def test_visibility_change_updates_index(self):
+        """Making a photo private takes it out of its tags."""
+        photo = self.public[0]
+        photo.published = 'PRIVATE'
+        photo.save()
+        self.assertEqual(self.count('sky'), 2)
+        self.assertEqual(self.count('sea'), 0)
+        self.assertNotIn(photo.id, tag_entries(tag_id('sky')).values_list('photo_id', flat=True))
+
+    def test_paginator_pages_the_index(self):
+        """A tag's public photos page newest first through its entries."""
+        newest = sorted(self.public, key=lambda photo: (photo.date_uploaded, photo.id), reverse=True)
+        paginator = TaggedPhotoPaginator(tag_id('sky'), 2)
+        first = paginator.page()
+        self.assertEqual(first.object_list, newest[:2])
+        second = paginator.page(after=first.next_cursor)
+        self.assertEqual(second.object_list, newest[2:])
+        self.assertEqual(paginator.page(before=second.previous_cursor).object_list, newest[:2])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(TaggedPhotoPaginator(None, 2).page()), 0)
+
+    def test_stale_entries_do_not_show_private_photos(self):
+        """A photo made private behind the index's back stays hidden."""
+        photo = self.public[0]
+        Photo.objects.filter(pk=photo.pk).update(published='PRIVATE')
+        response = self.client.get(reverse_lazy('tagged_photos', args=['sky']))
+        self.assertNotIn(photo, response.context['photos'])
+        self.assertEqual(len(response.context['photos']), 2)
+        results = self.client.get('/api/tags/sky/photos/').json()['results']
+        self.assertNotIn(photo.id, [result['id'] for result in results])
+
+    def test_tag_removal_updates_count(self):
+        """Removing a tag decrements its count."""
+        self.public[1].tags.remove('sky')
+        self.assertEqual(self.count('sky'), 2)
+
+    def test_deleting_photo_updates_count(self):
+        """Deleting a public photo decrements its tags."""
+        self.public[0].delete()
+        self.assertEqual(self.count('sky'), 2)
+        self.assertEqual(self.count('sea'), 0)
+
+    def test_tag_gallery_reads_the_index(self):
+        """The tag gallery lists the indexed public photos."""
+        response = self.client.get('/images/photos/tagged/sea/')
+        self.assertEqual(list(response.context['photos']), [self.public[0]])
+
+    def test_unknown_tag_gallery_is_empty(self):
+        """An unknown tag gives an empty gallery."""
+        response = self.client.get('/images/photos/tagged/nothing-here/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['photos']), [])
+
+    def test_tag_cloud_lists_popular_tags_first(self):
+        """The tag cloud orders tags by public photo count."""
+        response = self.client.get(reverse_lazy('tag_cloud'))
+        names = [tag_count.tag.name for tag_count in response.context['tag_counts']]
+        self.assertEqual(names, ['sky', 'sea'])
+
+    def test_rebuild_command_matches_maintained_counts(self):
+        """A full rebuild agrees with the incrementally kept counts."""
+        self.public[2].tags.remove('sky')
+        call_command('rebuild_tag_index', stdout=StringIO())
+        self.assertEqual(self.count('sky'), 2)
+        self.assertEqual(self.count('sea'), 1)
+
+
+class QueryPlanTests(TestCase):
+    """Check with EXPLAIN that the main querysets are served by indexes."""
+
+    SEED_PHOTOS = 3000
+
+    @classmethod
+    def setUpTestData(cls):
+        """Seed enough rows that the planner prefers an index when it can."""
+        cls.users = [UserFactory.create() for i in range(10)]
+        profiles = [user.profile for user in cls.users]
+        Photo.objects.bulk_create([
+            Photo(title='seed{}'.format(i),
+                  photo='seed{}.jpg'.format(i),
+                  owner=profiles[i % len(profiles)],
+                  published='PUBLIC' if i % 20 == 0 else 'PRIVATE')
+            for i in range(cls.SEED_PHOTOS)
+        ], batch_size=500)
+        Album.objects.bulk_create([
+            Album(title='seed{}'.format(i),
+                  owner=profiles[i % len(profiles)],
+                  published='PUBLIC' if i % 20 == 0 else 'PRIVATE')
+            for i in range(cls.SEED_PHOTOS // 10)
+        ], batch_size=500)
+        photo_ids = list(Photo.objects.values_list('id', flat=True))
+        album_ids = list(Album.objects.values_list('id', flat=True))
+        Album.photos.through.objects.bulk_create([
+            Album.photos.through(album_id=album_ids[i % len(album_ids)], photo_id=photo_id)
+            for i, photo_id in enumerate(photo_ids)
+        ], batch_size=500)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def query_plan(self, queryset):
+        """Return the database's plan for queryset as text.
+
+        PostgreSQL rightly scans a table this small in full, so sequential
+        scans are priced out for the plan: what is checked is that an
+        index can serve the query, not what the planner picks at this size.
+        """
+        sql, params = queryset.query.sql_with_params()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(prefix + sql, params)
+            return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, table):
+        """Fail if the plan reads table with a full sequential scan."""
+        plan = self.query_plan(queryset)
+        full_scans = [line for line in plan.splitlines()
+                      if re.search(r'Seq Scan on {0}\b'.format(table), line) or
+                      (re.search(r'\bSCAN (TABLE )?{0}\b'.format(table), line) and 'USING' not in line)]
+        self.assertFalse(full_scans, 'Full scan of {}:\n{}'.format(table, plan))
+
+    def test_public_photo_gallery_uses_index(self):
+        """The first gallery page walks the visibility index."""
+        queryset = Photo.public.order_by('-date_uploaded', '-id')[:31]
+        self.assertUsesIndex(queryset, 'imager_images_photo')
+
+    def test_public_photo_gallery_deep_page_uses_index(self):
+        """A keyset page seeks into the visibility index."""
+        last = Photo.public.order_by('date_uploaded', 'id').first()
+        paginator = CursorPaginator(Photo.public.all(), 30)
+        queryset = paginator.seek([last.date_uploaded, last.id])[:31]
+        self.assertUsesIndex(queryset, 'imager_images_photo')
+
+    def test_public_album_gallery_uses_index(self):
+        """The album gallery walks the visibility index."""
+        queryset = Album.public.order_by('-date_uploaded', '-id')[:31]
+        self.assertUsesIndex(queryset, 'imager_images_album')
+
+    def test_recently_published_photos_use_index(self):
+        """Public photos by publish date use the publish date index."""
+        queryset = Photo.public.filter(date_published__isnull=False).order_by('-date_published')[:30]
+        self.assertUsesIndex(queryset, 'imager_images_photo')
+
+    def test_library_photos_use_owner_index(self):
+        """An owner's photos are read from the owner index."""
+        queryset = self.users[0].profile.photos.order_by('-date_uploaded')
+        self.assertUsesIndex(queryset, 'imager_images_photo')
+
+    def test_library_albums_use_owner_index(self):
+        """An owner's albums are read from the owner index."""
+        queryset = self.users[0].profile.albums.order_by('-date_uploaded')
+        self.assertUsesIndex(queryset, 'imager_images_album')
+
+    def test_album_photos_use_through_index(self):
+        """An album's photos are found through the membership index."""
+        album = Album.objects.first()
+        self.assertUsesIndex(album.photos.all(), 'imager_images_album_photos')
+
+    def test_photo_albums_use_through_index(self):
+        """A photo's albums are found through the membership index."""
+        photo = Photo.objects.first()
+        self.assertUsesIndex(photo.albums.all(), 'imager_images_album_photos')
+
+    def test_tag_gallery_uses_tag_index(self):
+        """The tag gallery reads the tag index rather than scanning photos."""
+        tags = [Tag.objects.create(name='seed{}'.format(i), slug='seed{}'.format(i)) for i in range(10)]
+        PublicTaggedPhoto.objects.bulk_create([
+            PublicTaggedPhoto(tag=tag, photo=photo, date_uploaded=photo.date_uploaded)
+            for photo in Photo.public.all() for tag in tags
+        ])
+        paginator = TaggedPhotoPaginator(tags[0].id, 30)
+        first = paginator.queryset.order_by(*paginator.ordering)[:31]
+        self.assertUsesIndex(first, 'imager_images_publictaggedphoto')
+        last = paginator.queryset.order_by('date_uploaded', 'photo_id').first()
+        deep = paginator.seek([last.date_uploaded, last.photo_id])[:31]
+        self.assertUsesIndex(deep, 'imager_images_publictaggedphoto')
+        self.assertNotIn('taggit_tag', str(deep.query))
+
+
+class PageCacheTests(TestCase):
+    """Test the anonymous page cache and its invalidation."""
+
+    def setUp(self):
+        """Start from an empty cache with some public content."""
+        cache.clear()
+        self.photo = PhotoFactory.create(published='PUBLIC')
+        self.photo.tags.add('sun', 'moon')
+        self.album = AlbumFactory.create(published='PUBLIC')
+
+    def assertCached(self, url):
+        """Fetching url a second time makes no queries."""
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def assertRefreshed(self, url):
+        """Fetching url runs the view again."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertTrue(len(queries))
+
+    def test_anonymous_galleries_are_cached(self):
+        """Repeat anonymous visits to the galleries make no queries."""
+        for url in ('/', '/images/photos/', '/images/albums/', '/images/photos/tagged/sun/'):
+            self.assertCached(url)
+
+    def test_pending_messages_are_not_cached(self):
+        """A visitor's messages are shown to them and kept out of the shared page."""
+        storage = CookieStorage(RequestFactory().get('/'))
+        self.client.cookies['messages'] = storage._encode([Message(constants.INFO, 'Just for you')])
+        self.assertContains(self.client.get('/images/photos/'), 'Just for you')
+        self.assertNotContains(Client().get('/images/photos/'), 'Just for you')
+
+    @override_settings(IMAGER_GALLERY_PAGE_SIZE=1)
+    def test_cursor_pages_are_cached_separately(self):
+        """Each cursor page has its own cache entry."""
+        newer = PhotoFactory.create(published='PUBLIC')
+        first = self.client.get('/images/photos/')
+        second_url = '/images/photos/?after=' + first.context['page_obj'].next_cursor
+        self.assertRefreshed(second_url)
+        self.assertCached(second_url)
+        self.assertEqual(list(first.context['photos']), [newer])
+
+    def test_authenticated_visits_are_not_cached(self):
+        """Logged in users always get a fresh page."""
+        self.client.force_login(UserFactory.create())
+        self.client.get('/images/photos/')
+        self.assertRefreshed('/images/photos/')
+
+    def test_new_public_photo_expires_gallery(self):
+        """Uploading a public photo shows up straight away."""
+        self.assertCached('/images/photos/')
+        photo = PhotoFactory.create(published='PUBLIC')
+        response = self.client.get('/images/photos/')
+        self.assertIn(photo, response.context['photos'])
+
+    def test_private_photo_leaves_gallery_cached(self):
+        """Changes to private photos do not expire the public pages."""
+        self.assertCached('/images/photos/')
+        PhotoFactory.create()
+        with self.assertNumQueries(0):
+            self.client.get('/images/photos/')
+
+    def test_photo_made_private_expires_gallery(self):
+        """Hiding a public photo takes it off the cached gallery."""
+        self.assertCached('/images/photos/')
+        self.photo.published = 'PRIVATE'
+        self.photo.save()
+        response = self.client.get('/images/photos/')
+        self.assertNotIn(self.photo, response.context['photos'])
+
+    def test_tag_change_expires_only_that_tag(self):
+        """Tagging a photo expires that tag's page and leaves the others."""
+        self.assertCached('/images/photos/tagged/sun/')
+        self.assertCached('/images/photos/tagged/star/')
+        self.photo.tags.add('star')
+        self.assertRefreshed('/images/photos/tagged/star/')
+        with self.assertNumQueries(0):
+            self.client.get('/images/photos/tagged/sun/')
+
+    def test_deleting_photo_expires_its_tag_pages(self):
+        """A deleted public photo leaves its cached tag pages."""
+        self.assertCached('/images/photos/tagged/moon/')
+        self.photo.delete()
+        response = self.client.get('/images/photos/tagged/moon/')
+        self.assertEqual(list(response.context['photos']), [])
+
+    def test_album_change_expires_album_gallery(self):
+        """Editing a public album refreshes the album gallery."""
+        self.assertCached('/images/albums/')
+        self.album.title = 'renamed'
+        self.album.save()
+        response = self.client.get('/images/albums/')
+        self.assertEqual(response.context['albums'][0].title, 'renamed')
+
+    def test_album_membership_change_expires_album_gallery(self):
+        """Adding photos to a public album refreshes the album gallery."""
+        self.assertCached('/images/albums/')
+        self.album.photos.add(self.photo)
+        self.assertRefreshed('/images/albums/')
+
+
+class BulkUploadTests(TestCase):
+    """Uploading many photos, loose or zipped, in one request."""
+
+    def setUp(self):
+        """Log in a user with an album."""
+        cache.clear()
+        self.user = UserFactory.create()
+        self.client.force_login(self.user)
+        self.album = AlbumFactory.create(owner=self.user.profile, published='PUBLIC')
+        with open('imager_images/static/generic.jpg', 'rb') as image:
+            self.image = image.read()
+
+    def upload(self, name):
+        """Return an uploaded copy of the test image."""
+        return SimpleUploadedFile(name, self.image, content_type='image/jpeg')
+
+    def archive(self, entries):
+        """Return an uploaded zip holding (name, bytes) entries."""
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as zipped:
+            for name, data in entries:
+                zipped.writestr(name, data)
+        return SimpleUploadedFile('photos.zip', buf.getvalue(), content_type='application/zip')
+
+    def post(self, **data):
+        """Send the bulk upload form."""
+        data.setdefault('published', 'PUBLIC')
+        return self.client.post(reverse_lazy('bulk_add_photo'), data)
+
+    def test_many_files_become_photos(self):
+        """Every file in the files field becomes one of the user's photos."""
+        response = self.post(files=[self.upload('a.jpg'), self.upload('b.jpg')])
+        photos = self.user.profile.photos.order_by('title')
+        self.assertEqual([photo.title for photo in photos], ['a', 'b'])
+        self.assertEqual([result.error for result in response.context['results']], [None, None])
+
+    def test_archive_entries_become_photos(self):
+        """Images in a zip are stored and other entries are reported."""
+        archive = self.archive([('trip/one.jpg', self.image),
+                                ('trip/two.jpg', self.image),
+                                ('notes.txt', b'not an image')])
+        response = self.post(archive=archive)
+        results = response.context['results']
+        self.assertEqual([result.name for result in results], ['one.jpg', 'two.jpg', 'notes.txt'])
+        self.assertEqual(self.user.profile.photos.count(), 2)
+        self.assertIsNone(results[2].photo)
+        self.assertTrue(results[2].error)
+
+    def test_photos_are_created_in_one_insert(self):
+        """The photo rows are written with a single statement."""
+        with CaptureQueriesContext(connection) as queries:
+            self.post(files=[self.upload('{}.jpg'.format(n)) for n in range(5)])
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "imager_images_photo"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(self.user.profile.photos.count(), 5)
+
+    def test_shared_settings_are_applied(self):
+        """Tags, visibility and album apply to every uploaded photo."""
+        self.post(files=[self.upload('a.jpg'), self.upload('b.jpg')],
+                  tags='beach, sunset', album=self.album.id)
+        for photo in self.user.profile.photos.all():
+            self.assertEqual(photo.published, 'PUBLIC')
+            self.assertEqual(sorted(photo.tags.names()), ['beach', 'sunset'])
+            self.assertIn(self.album, photo.albums.all())
+
+    def test_bulk_photos_reach_the_indexes(self):
+        """Bulk created photos show up in tag galleries and renditions."""
+        self.client.logout()
+        self.client.get('/images/photos/tagged/beach/')
+        self.client.force_login(self.user)
+        self.post(files=[self.upload('a.jpg'), self.upload('b.jpg')], tags='beach')
+        self.client.logout()
+        response = self.client.get('/images/photos/tagged/beach/')
+        self.assertEqual(len(response.context['photos']), 2)
+        first, second = self.user.profile.photos.order_by('id')
+        self.assertEqual(similar_public_photos(first), [second])
+        rendition = first.renditions['thumb']
+        self.assertTrue(first.photo.storage.exists(rendition.name))
+
+    def test_other_users_albums_are_refused(self):
+        """Photos cannot be added to someone else's album."""
+        album = AlbumFactory.create(owner=UserFactory.create().profile)
+        response = self.post(files=[self.upload('a.jpg')], album=album.id)
+        self.assertTrue(response.context['form'].errors)
+        self.assertEqual(self.user.profile.photos.count(), 0)
+
+    def test_empty_upload_is_refused(self):
+        """Sending neither files nor an archive is a form error."""
+        response = self.post()
+        self.assertTrue(response.context['form'].errors)
+
+    @override_settings(IMAGER_BULK_UPLOAD_MAX_FILES=1)
+    def test_file_limit_is_reported(self):
+        """Files past the limit are reported rather than stored."""
+        response = self.post(files=[self.upload('a.jpg'), self.upload('b.jpg')])
+        self.assertEqual(self.user.profile.photos.count(), 1)
+        self.assertTrue(response.context['results'][1].error)
+
+
+class ResumableUploadTests(TestCase):
+    """Uploading an original in chunks that can be resumed."""
+
+    def setUp(self):
+        """Log in a user and read the test image."""
+        cache.clear()
+        self.user = UserFactory.create()
+        self.client.force_login(self.user)
+        with open('imager_images/static/generic.jpg', 'rb') as image:
+            self.image = image.read()
+
+    def start(self, **data):
+        """Open an upload session for the test image and return its JSON."""
+        data.setdefault('filename', 'big.jpg')
+        data.setdefault('size', len(self.image))
+        data.setdefault('published', 'PUBLIC')
+        return self.client.post(reverse_lazy('upload_sessions'), data)
+
+    def put(self, url, start, end):
+        """Send the bytes start..end of the test image."""
+        return self.client.put(url, self.image[start:end + 1],
+                               content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE='bytes {}-{}/{}'.format(start, end, len(self.image)))
+
+    def test_chunks_then_finalize_create_photo(self):
+        """A file sent in chunks becomes the user's photo."""
+        url = self.start(title='Big one').json()['url']
+        half = len(self.image) // 2
+        self.assertEqual(self.put(url, 0, half - 1).json()['offset'], half)
+        self.assertTrue(self.put(url, half, len(self.image) - 1).json()['complete'])
+        response = self.client.post(url + 'finalize/')
+        self.assertEqual(response.status_code, 201)
+        photo = Photo.objects.get(id=response.json()['photo'])
+        self.assertEqual(photo.owner, self.user.profile)
+        self.assertEqual(photo.title, 'Big one')
+        self.assertEqual(photo.published, 'PUBLIC')
+        photo.photo.open('rb')
+        self.assertEqual(photo.photo.read(), self.image)
+
+    def test_filename_is_reduced_to_its_base_name(self):
+        """A client path in the announced file name is dropped."""
+        self.start(filename='ab/cd/..\\big.jpg')
+        self.assertEqual(UploadSession.objects.get().filename, 'big.jpg')
+
+    def test_offset_can_be_queried(self):
+        """A client that lost track asks where to resume."""
+        url = self.start().json()['url']
+        self.put(url, 0, 99)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['offset'], 100)
+        self.assertEqual(response['Upload-Offset'], '100')
+
+    def test_out_of_order_chunk_is_a_conflict(self):
+        """A chunk that skips ahead is refused with the real offset."""
+        url = self.start().json()['url']
+        self.put(url, 0, 99)
+        response = self.put(url, 200, 299)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+
+    def test_repeated_chunk_is_a_conflict(self):
+        """A chunk resent after it arrived does not write twice."""
+        url = self.start().json()['url']
+        self.put(url, 0, 99)
+        self.assertEqual(self.put(url, 0, 99).status_code, 409)
+
+    def test_chunk_racing_another_attempt_is_a_conflict(self):
+        """Only one of two attempts at the same chunk moves the offset."""
+        self.start()
+        session = UploadSession.objects.get()
+
+        class Racing(object):
+            """A request body sent while another attempt at it completes."""
+
+            def __init__(self, data):
+                self.data = BytesIO(data)
+
+            def read(self, size):
+                UploadSession.objects.filter(pk=session.pk).update(offset=100)
+                return self.data.read(size)
+
+        with self.assertRaises(uploads.UploadConflict) as raised:
+            uploads.append_chunk(session, Racing(self.image[:100]), 0, 100)
+        self.assertEqual(raised.exception.offset, 100)
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        """Finalizing before every byte arrived makes no photo."""
+        url = self.start().json()['url']
+        self.put(url, 0, 99)
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 409)
+        self.assertEqual(Photo.objects.count(), 0)
+
+    def test_finalize_twice_returns_same_photo(self):
+        """A retried finalize does not create a second photo."""
+        url = self.start().json()['url']
+        self.put(url, 0, len(self.image) - 1)
+        first = self.client.post(url + 'finalize/').json()['photo']
+        second = self.client.post(url + 'finalize/').json()['photo']
+        self.assertEqual(first, second)
+        self.assertEqual(Photo.objects.count(), 1)
+
+    def test_non_image_is_rejected(self):
+        """Bytes that are not an image do not become a photo."""
+        url = self.client.post(reverse_lazy('upload_sessions'),
+                               {'filename': 'x.jpg', 'size': 4, 'published': 'PRIVATE'}).json()['url']
+        self.client.put(url, b'nope', content_type='application/octet-stream',
+                        HTTP_CONTENT_RANGE='bytes 0-3/4')
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 400)
+        self.assertEqual(Photo.objects.count(), 0)
+
+    @override_settings(IMAGER_UPLOAD_MAX_BYTES=10)
+    def test_oversized_upload_is_refused(self):
+        """Files over the limit cannot start a session."""
+        self.assertEqual(self.start().status_code, 400)
+
+    def test_other_users_cannot_touch_session(self):
+        """Sessions are private to the user who started them."""
+        url = self.start().json()['url']
+        self.client.force_login(UserFactory.create())
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.put(url, 0, 99).status_code, 404)
+
+    def test_idle_sessions_expire(self):
+        """Abandoned sessions and their staged bytes are deleted."""
+        url = self.start().json()['url']
+        self.put(url, 0, 99)
+        session = UploadSession.objects.get()
+        self.assertTrue(os.path.exists(session.staging_path))
+        self.assertEqual(expire_sessions(), 0)
+        later = timezone.now() + datetime.timedelta(days=2)
+        self.assertEqual(expire_sessions(now=later), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(session.staging_path))
+
+
+class PhotoMetadataTests(TestCase):
+    """Metadata read from photo files into columns."""
+
+    def setUp(self):
+        """Make a photo with no metadata yet."""
+        self.photo = PhotoFactory.create()
+
+    def test_extract_reads_header(self):
+        """Dimensions and type come from the image header."""
+        with open('imager_images/static/generic.jpg', 'rb') as image_file:
+            fields = extract(image_file)
+            image_file.seek(0)
+            size = Image.open(image_file).size
+        self.assertEqual((fields['width'], fields['height']), size)
+        self.assertEqual(fields['mime_type'], 'image/jpeg')
+
+    def test_exif_fields(self):
+        """Camera, lens, orientation and date come from the EXIF tags."""
+        fields = exif_fields({274: 6, 272: 'X100F\x00', 42036: b'Fujinon 23mm',
+                              36867: '2016:07:04 18:30:00'})
+        self.assertEqual(fields['orientation'], 6)
+        self.assertEqual(fields['camera_model'], 'X100F')
+        self.assertEqual(fields['lens_model'], 'Fujinon 23mm')
+        self.assertEqual(fields['taken_at'].year, 2016)
+
+    def test_bad_exif_values_are_ignored(self):
+        """Malformed EXIF values leave the columns empty."""
+        fields = exif_fields({274: 42, 36867: 'sometime'})
+        self.assertIsNone(fields['orientation'])
+        self.assertIsNone(fields['taken_at'])
+
+    @override_settings(IMAGER_METADATA_WORKERS=0)
+    def test_schedule_without_workers_stores_inline(self):
+        """With no workers the columns are filled straight away."""
+        schedule(self.photo.id, self.photo.photo.name)
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.file_size, self.photo.photo.size)
+        self.assertTrue(self.photo.width)
+
+    def test_backfill_command_in_parallel(self):
+        """The backfill command fills every photo using worker processes."""
+        PhotoFactory.create()
+        out = StringIO()
+        call_command('extract_photo_metadata', workers=2, batch_size=1, stdout=out)
+        self.assertIn('2 photos', out.getvalue())
+        self.assertFalse(Photo.objects.filter(width__isnull=True).exists())
+
+    def test_backfill_skips_done_photos(self):
+        """Photos with metadata are left alone unless forced."""
+        call_command('extract_photo_metadata', workers=0, stdout=StringIO())
+        out = StringIO()
+        call_command('extract_photo_metadata', workers=0, stdout=out)
+        self.assertIn('0 photos', out.getvalue())
+
+    def test_forms_leave_metadata_alone(self):
+        """Users cannot type over the extracted columns."""
+        self.assertNotIn('width', AddPhotoForm().fields)
+        self.assertNotIn('taken_at', EditPhotoForm().fields)
+
+
+class DuplicateDetectionTests(TestCase):
+    """Perceptual hashes and the near-duplicate index."""
+
+    def setUp(self):
+        """Log in a user and start from an unloaded index."""
+        index.clear()
+        self.user = UserFactory.create()
+        self.client.force_login(self.user)
+        with open('imager_images/static/generic.jpg', 'rb') as image:
+            self.image = image.read()
+
+    def jpeg(self, size=None, flip=False):
+        """Return the test image, optionally resized or mirrored, as JPEG bytes."""
+        image = Image.open(io.BytesIO(self.image)).convert('RGB')
+        if size:
+            image = image.resize(size)
+        if flip:
+            image = ImageOps.flip(image)
+        out = io.BytesIO()
+        image.save(out, 'JPEG', quality=70)
+        return out.getvalue()
+
+    def upload(self, data, title='copy', follow=False):
+        """Upload image bytes through the add photo form."""
+        return self.client.post('/images/photos/add/', {
+            'title': title,
+            'published': 'PRIVATE',
+            'photo': SimpleUploadedFile('copy.jpg', data),
+        }, follow=follow)
+
+    def test_hash_survives_resizing(self):
+        """A resized, re-encoded copy hashes close to the original."""
+        original = int(dhash(io.BytesIO(self.image)), 16)
+        resized = int(dhash(io.BytesIO(self.jpeg((145, 125)))), 16)
+        flipped = int(dhash(io.BytesIO(self.jpeg(flip=True))), 16)
+        self.assertLessEqual(distance(original, resized), 6)
+        self.assertGreater(distance(original, flipped), 6)
+
+    def test_bk_tree_matches_brute_force(self):
+        """Tree searches find exactly the hashes a full scan finds."""
+        rng = random.Random(7)
+        values = [rng.getrandbits(64) for i in range(500)]
+        tree = BKTree()
+        for item, value in enumerate(values):
+            tree.add(value, item)
+        probe = values[0] ^ 0b1011
+        expected = sorted((distance(probe, value), item) for item, value in enumerate(values)
+                          if distance(probe, value) <= 10)
+        self.assertEqual(sorted(tree.search(probe, 10)), expected)
+
+    def test_photos_are_hashed_on_upload(self):
+        """Uploaded photos get a perceptual hash."""
+        self.upload(self.image)
+        self.assertEqual(len(self.user.profile.photos.get().phash), 16)
+
+    def test_upload_warns_about_near_duplicate(self):
+        """Uploading a copy of an owned photo shows a warning."""
+        self.upload(self.image, title='Original')
+        response = self.upload(self.jpeg((145, 125)), follow=True)
+        self.assertContains(response, 'looks like a photo you already have: &quot;Original&quot;')
+
+    def test_other_users_photos_are_not_duplicates(self):
+        """Only the uploader's own photos are offered as duplicates."""
+        PhotoFactory.create(owner=UserFactory.create().profile)
+        response = self.upload(self.image, follow=True)
+        self.assertNotContains(response, 'already have')
+
+    def test_bulk_upload_reports_duplicates(self):
+        """Bulk upload results name the photos each upload looks like."""
+        self.upload(self.image, title='Original')
+        response = self.client.post(reverse_lazy('bulk_add_photo'), {
+            'published': 'PRIVATE',
+            'files': [SimpleUploadedFile('again.jpg', self.image)],
+        })
+        duplicates = response.context['results'][0].duplicates
+        self.assertEqual([photo.title for photo in duplicates], ['Original'])
+
+    def test_report_lists_groups_per_profile(self):
+        """The report command groups each user's look-alike photos."""
+        self.upload(self.image, title='Original')
+        self.upload(self.jpeg((145, 125)), title='Smaller')
+        self.upload(self.jpeg(flip=True), title='Flipped')
+        out = StringIO()
+        call_command('duplicate_report', self.user.username, stdout=out)
+        report = out.getvalue()
+        self.assertIn('1 groups', report)
+        self.assertIn('Original', report)
+        self.assertIn('Smaller', report)
+        self.assertNotIn('Flipped', report)
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Photos stored under the hash of their bytes."""
+
+    def setUp(self):
+        """Read the test image."""
+        self.storage = photo_storage
+        with open('imager_images/static/generic.jpg', 'rb') as image:
+            self.image = image.read()
+
+    def test_name_is_sharded_hash(self):
+        """Files are named by their sha256, two directory levels deep."""
+        digest = hashlib.sha256(self.image).hexdigest()
+        name = self.storage.save('holiday.JPEG', ContentFile(self.image))
+        self.assertEqual(name, '{}/{}/{}.jpg'.format(digest[:2], digest[2:4], digest))
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), self.image)
+
+    def test_identical_bytes_are_stored_once(self):
+        """Saving the same bytes twice returns the same name."""
+        first = self.storage.save('a.jpg', ContentFile(self.image))
+        second = self.storage.save('b.jpg', ContentFile(self.image))
+        other = self.storage.save('c.jpg', ContentFile(self.image + b'\0'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_addressed_names_are_kept(self):
+        """Files named after an address, like renditions, keep their name."""
+        original = self.storage.save('a.jpg', ContentFile(self.image))
+        name = rendition_name(original, 'thumb')
+        self.assertEqual(self.storage.save(name, ContentFile(b'thumb')), name)
+
+    def test_a_name_claiming_another_address_is_hashed(self):
+        """Bytes offered under someone else's address are stored under their own."""
+        claimed = 'ab/cd/abcd{}.jpg'.format('0' * 60)
+        name = self.storage.save(claimed, ContentFile(self.image))
+        digest = hashlib.sha256(self.image).hexdigest()
+        self.assertEqual(name, '{}/{}/{}.jpg'.format(digest[:2], digest[2:4], digest))
+        self.assertFalse(self.storage.exists(claimed))
+
+    def test_generated_names_drop_client_paths(self):
+        """A file name from a client cannot choose the directory it lands in."""
+        field = Photo._meta.get_field('photo')
+        self.assertEqual(field.generate_filename(None, 'ab/cd/x.jpg'), 'x.jpg')
+
+    def test_store_reports_whether_it_wrote_the_file(self):
+        """Only the first save of some bytes is told it created the file."""
+        content = self.image + b'store'
+        first = self.storage.store('a.jpg', ContentFile(content))
+        second = self.storage.store('b.jpg', ContentFile(content))
+        self.addCleanup(self.storage.delete, first[0])
+        self.assertEqual((first[1], second[1]), (True, False))
+        self.assertEqual(first[0], second[0])
+
+    def age(self, name, days=2):
+        """Make the stored file look as if nothing had touched it for days."""
+        then = time.time() - days * 24 * 60 * 60
+        os.utime(self.storage.path(name), (then, then))
+
+    def test_sweep_deletes_only_old_unreferenced_files(self):
+        """Files no photo points at go once the grace period is over."""
+        photo = PhotoFactory.create()
+        orphan = self.storage.save('orphan.jpg', ContentFile(self.image + b'orphan'))
+        recent = self.storage.save('recent.jpg', ContentFile(self.image + b'recent'))
+        self.addCleanup(self.storage.delete, recent)
+        self.age(orphan)
+        self.age(photo.photo.name)
+        self.assertGreaterEqual(sweep_orphans(), 1)
+        self.assertFalse(self.storage.exists(orphan))
+        self.assertTrue(self.storage.exists(photo.photo.name))
+        self.assertTrue(self.storage.exists(recent))
+
+    def test_storing_again_keeps_a_file_from_the_sweep(self):
+        """Finding the bytes already stored restarts their grace period."""
+        content = self.image + b'again'
+        name = self.storage.save('a.jpg', ContentFile(content))
+        self.addCleanup(self.storage.delete, name)
+        self.age(name)
+        self.assertEqual(self.storage.store('b.jpg', ContentFile(content)), (name, False))
+        sweep_orphans()
+        self.assertTrue(self.storage.exists(name))
+
+    def test_uploaded_photos_are_addressed(self):
+        """Photos saved through the model get addressed names and renditions."""
+        photo = PhotoFactory.create()
+        self.assertTrue(is_addressed(photo.photo.name))
+        self.assertTrue(self.storage.exists(photo.renditions['card'].name))
+
+    def test_relocate_command_moves_flat_files(self):
+        """The relocation command repoints old rows and copies renditions."""
+        flat = FileSystemStorage(location=self.storage.location)
+        photo = PhotoFactory.create()
+        legacy = flat.save('legacy.jpg', ContentFile(self.image + b'\0'))
+        flat.save(rendition_name(legacy, 'thumb'), ContentFile(b'old thumb'))
+        Photo.objects.filter(pk=photo.pk).update(photo=legacy)
+        out = StringIO()
+        call_command('relocate_photos', batch_size=1, stdout=out)
+        photo.refresh_from_db()
+        self.assertIn('Relocated 1 photos', out.getvalue())
+        self.assertTrue(is_addressed(photo.photo.name))
+        with self.storage.open(photo.renditions['thumb'].name) as thumb:
+            self.assertEqual(thumb.read(), b'old thumb')
+        self.assertTrue(self.storage.exists(photo.renditions['card'].name))
+        self.assertTrue(flat.exists(legacy))
+
+    def test_relocate_can_delete_old_files(self):
+        """With --delete-old the flat file goes once nothing uses it."""
+        flat = FileSystemStorage(location=self.storage.location)
+        photo = PhotoFactory.create()
+        legacy = flat.save('legacy.jpg', ContentFile(self.image))
+        Photo.objects.filter(pk=photo.pk).update(photo=legacy)
+        call_command('relocate_photos', delete_old=True, stdout=StringIO())
+        self.assertFalse(flat.exists(legacy))
+
+
+class MediaDeliveryTests(TestCase):
+    """Photo files served only to viewers allowed to see the photo."""
+
+    def setUp(self):
+        """Make a public and a private photo."""
+        self.owner = UserFactory.create()
+        self.public = PhotoFactory.create(owner=self.owner.profile, published='PUBLIC')
+        self.private = PhotoFactory.create(owner=self.owner.profile, photo=SimpleUploadedFile(
+            'private.jpg', open('imager_images/static/generic.jpg', 'rb').read() + b'\0'))
+        with self.public.photo.storage.open(self.public.photo.name) as stored:
+            self.data = stored.read()
+
+    def get(self, photo, rendition=None, **headers):
+        """Fetch a photo's file or one of its renditions."""
+        url = photo.renditions[rendition].url if rendition else photo.photo.url
+        return self.client.get(url, **headers)
+
+    def content(self, response):
+        """Return a possibly streamed response body."""
+        return b''.join(response.streaming_content)
+
+    def test_public_photo_is_served(self):
+        """Anyone gets the file of a public photo."""
+        response = self.get(self.public)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.data)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_private_photo_is_hidden(self):
+        """Private files and renditions are not found by other viewers."""
+        self.assertEqual(self.get(self.private).status_code, 404)
+        self.assertEqual(self.get(self.private, 'thumb').status_code, 404)
+        self.client.force_login(UserFactory.create())
+        self.assertEqual(self.get(self.private).status_code, 404)
+
+    def test_owner_gets_private_photo(self):
+        """The owner can fetch their private files, which proxies may not cache."""
+        self.client.force_login(self.owner)
+        response = self.get(self.private, 'card')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_unknown_files_are_not_found(self):
+        """Paths no photo refers to are not served."""
+        self.assertEqual(self.client.get('/media/nothing.jpg').status_code, 404)
+
+    def test_range_request(self):
+        """A byte range returns just those bytes."""
+        response = self.get(self.public, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.content(response), self.data[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/{}'.format(len(self.data)))
+
+    def test_suffix_range_request(self):
+        """A suffix range returns the end of the file."""
+        response = self.get(self.public, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.content(response), self.data[-5:])
+
+    def test_unsatisfiable_range(self):
+        """A range past the end is refused."""
+        response = self.get(self.public, HTTP_RANGE='bytes={}-'.format(len(self.data)))
+        self.assertEqual(response.status_code, 416)
+
+    def test_stale_if_range_sends_whole_file(self):
+        """A range is ignored when If-Range names another version."""
+        response = self.get(self.public, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_revalidation(self):
+        """A matching If-None-Match gets 304 Not Modified."""
+        etag = self.get(self.public)['ETag']
+        self.assertEqual(self.get(self.public, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_last_modified_revalidation(self):
+        """A current If-Modified-Since gets 304 Not Modified."""
+        modified = self.get(self.public)['Last-Modified']
+        self.assertEqual(self.get(self.public, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+
+    @override_settings(IMAGER_MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_proxy_sends_the_bytes(self):
+        """With a proxy the response names the internal location only."""
+        response = self.get(self.public, 'thumb')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/' + self.public.renditions['thumb'].name)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(IMAGER_MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_proxy_still_checks_visibility(self):
+        """Private files are refused before anything is handed to the proxy."""
+        self.assertEqual(self.get(self.private).status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    """Revalidating photo, album and gallery pages."""
+
+    def setUp(self):
+        """Make a public photo in a public album."""
+        cache.clear()
+        self.photo = PhotoFactory.create(published='PUBLIC')
+        self.photo.tags.add('sun')
+        self.album = AlbumFactory.create(published='PUBLIC')
+        self.album.photos.add(self.photo)
+
+    def revalidate(self, url, **headers):
+        """Fetch url, then fetch it again with its validators."""
+        first = self.client.get(url)
+        return first, self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'], **headers)
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Repeat fetches with the ETag get 304."""
+        for url in ('/images/photos/{}/'.format(self.photo.id),
+                    '/images/albums/{}/'.format(self.album.id),
+                    '/images/photos/', '/images/albums/', '/images/photos/tagged/sun/'):
+            first, second = self.revalidate(url)
+            self.assertEqual(second.status_code, 304, url)
+            self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_not_modified_skips_the_page(self):
+        """A 304 for the photo page costs the access check and one aggregate."""
+        url = '/images/photos/{}/'.format(self.photo.id)
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(2):
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_last_modified_is_sent(self):
+        """Detail pages say when they last changed."""
+        response = self.client.get('/images/photos/{}/'.format(self.photo.id))
+        self.assertIn('Last-Modified', response)
+
+    def test_photo_edit_changes_etag(self):
+        """Editing the photo changes its page."""
+        url = '/images/photos/{}/'.format(self.photo.id)
+        etag = self.client.get(url)['ETag']
+        self.photo.title = 'renamed'
+        self.photo.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_retagging_changes_photo_etag(self):
+        """Tag changes count as a change to the photo."""
+        url = '/images/photos/{}/'.format(self.photo.id)
+        etag = self.client.get(url)['ETag']
+        self.photo.tags.add('moon')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_album_membership_changes_album_etag(self):
+        """Removing a photo from an album changes the album page."""
+        url = '/images/albums/{}/'.format(self.album.id)
+        etag = self.client.get(url)['ETag']
+        self.photo.albums.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_viewer_is_part_of_etag(self):
+        """Another viewer does not get a 304 for someone else's page."""
+        url = '/images/photos/'
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(UserFactory.create())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_new_public_photo_changes_gallery_etag(self):
+        """A new public photo changes the gallery's ETag."""
+        etag = self.client.get('/images/photos/')['ETag']
+        PhotoFactory.create(published='PUBLIC')
+        response = self.client.get('/images/photos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_private_page_still_forbidden(self):
+        """Validators are only checked after the access test."""
+        self.photo.published = 'PRIVATE'
+        self.photo.save()
+        response = self.client.get('/images/photos/{}/'.format(self.photo.id), HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, 403)
+
+
+class AlbumDownloadTests(TestCase):
+    """Streaming an album as a zip."""
+
+    def setUp(self):
+        """Make an owner with a public album holding a public and a private photo."""
+        self.owner = UserFactory.create()
+        self.public = PhotoFactory.create(owner=self.owner.profile, published='PUBLIC', title='Beach')
+        with open('imager_images/static/generic.jpg', 'rb') as original:
+            self.other_bytes = original.read() + b'album download'
+        self.private = PhotoFactory.create(owner=self.owner.profile, published='PRIVATE', title='Beach',
+                                           photo=SimpleUploadedFile('other.jpg', self.other_bytes))
+        self.album = AlbumFactory.create(owner=self.owner.profile, published='PUBLIC', title='Summer')
+        self.album.photos.add(self.public, self.private)
+        self.url = '/images/albums/{}/download/'.format(self.album.id)
+
+    def download(self):
+        """Fetch the album and return the response and its opened archive."""
+        response = self.client.get(self.url)
+        body = b''.join(response.streaming_content)
+        return response, body, zipfile.ZipFile(io.BytesIO(body))
+
+    def test_archive_holds_visible_originals(self):
+        """Anonymous viewers get the public photos, byte for byte."""
+        response, body, archive = self.download()
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('Summer.zip', response['Content-Disposition'])
+        self.assertEqual(archive.namelist(), ['Beach.jpg'])
+        self.assertIsNone(archive.testzip())
+        with open('imager_images/static/generic.jpg', 'rb') as original:
+            self.assertEqual(archive.read('Beach.jpg'), original.read())
+
+    def test_members_are_stored_with_descriptors(self):
+        """Members are not recompressed and carry their CRC after the data."""
+        response, body, archive = self.download()
+        info = archive.infolist()[0]
+        self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+        self.assertTrue(info.flag_bits & 0x08)
+
+    def test_content_length_is_exact(self):
+        """The length sent up front is the length of the archive."""
+        response, body, archive = self.download()
+        self.assertEqual(int(response['Content-Length']), len(body))
+
+    def test_owner_gets_every_photo_with_unique_names(self):
+        """Photos with the same title are numbered."""
+        self.client.force_login(self.owner)
+        response, body, archive = self.download()
+        self.assertEqual(archive.namelist(), ['Beach.jpg', 'Beach (2).jpg'])
+        self.assertEqual(archive.read('Beach (2).jpg'), self.other_bytes)
+        self.assertEqual(int(response['Content-Length']), len(body))
+
+    def test_private_album_is_forbidden(self):
+        """Viewers who may not see the album may not download it."""
+        self.album.published = 'PRIVATE'
+        self.album.save()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class ProfileCounterTests(TestCase):
+    """The photo, album, byte and tag totals kept on profiles."""
+
+    def setUp(self):
+        """Make a photographer."""
+        self.user = UserFactory.create()
+        self.profile = self.user.profile
+        with open('imager_images/static/generic.jpg', 'rb') as original:
+            self.size = len(original.read())
+
+    def counters(self):
+        """Return the profile's counters as stored."""
+        return ImagerProfile.objects.filter(pk=self.profile.pk).values(*COUNTER_FIELDS)[0]
+
+    def assertCounters(self, **expected):
+        """The named counters have these values and the rest are zero."""
+        wanted = dict.fromkeys(COUNTER_FIELDS, 0)
+        wanted.update(expected)
+        self.assertEqual(self.counters(), wanted)
+
+    def test_new_photos_and_albums_are_counted(self):
+        """Creating photos and albums counts them by visibility."""
+        PhotoFactory.create(owner=self.profile, published='PUBLIC')
+        PhotoFactory.create(owner=self.profile, published='PRIVATE')
+        AlbumFactory.create(owner=self.profile, published='SHARED')
+        self.assertCounters(public_photos=1, private_photos=1, shared_albums=1,
+                            photo_bytes=2 * self.size)
+
+    def test_visibility_change_moves_the_count(self):
+        """Publishing a photo moves it between counters."""
+        photo = PhotoFactory.create(owner=self.profile)
+        photo.published = 'PUBLIC'
+        photo.save()
+        photo.save()
+        self.assertCounters(public_photos=1, photo_bytes=self.size)
+
+    def test_deletes_are_uncounted(self):
+        """Deleting photos and albums takes them out again."""
+        photo = PhotoFactory.create(owner=self.profile, published='PUBLIC')
+        photo.tags.add('sea')
+        album = AlbumFactory.create(owner=self.profile)
+        photo.delete()
+        album.delete()
+        self.assertCounters()
+
+    def test_distinct_tags_are_counted(self):
+        """Tags shared by several photos count once, until the last goes."""
+        first = PhotoFactory.create(owner=self.profile)
+        second = PhotoFactory.create(owner=self.profile)
+        first.tags.add('sea', 'sun')
+        second.tags.add('sea')
+        self.assertEqual(self.counters()['tag_count'], 2)
+        first.tags.clear()
+        self.assertEqual(self.counters()['tag_count'], 1)
+        second.tags.remove('sea')
+        self.assertEqual(self.counters()['tag_count'], 0)
+
+    def test_bulk_uploads_are_counted(self):
+        """Photos made by a bulk upload are counted with their tags."""
+        with open('imager_images/static/generic.jpg', 'rb') as original:
+            data = original.read()
+        bulk_upload(self.profile, files=[SimpleUploadedFile('a.jpg', data),
+                                         SimpleUploadedFile('b.jpg', data)],
+                    published='SHARED', tags=['trip'])
+        self.assertCounters(shared_photos=2, photo_bytes=2 * self.size, tag_count=1)
+
+    def test_reconcile_repairs_drift(self):
+        """The reconcile command recomputes counters from the tables."""
+        photo = PhotoFactory.create(owner=self.profile, published='PUBLIC')
+        photo.tags.add('sea')
+        AlbumFactory.create(owner=self.profile, published='PUBLIC')
+        expected = self.counters()
+        ImagerProfile.objects.filter(pk=self.profile.pk).update(public_photos=7, tag_count=0)
+        Photo.objects.filter(pk=photo.pk).update(file_size=None)
+        out = StringIO()
+        call_command('reconcile_profile_counters', stdout=out)
+        self.assertEqual(self.counters(), expected)
+        self.assertIn('Corrected the counters of 1 profiles', out.getvalue())
+        photo.tags.add('sun')
+        self.assertEqual(self.counters()['tag_count'], 2)
+
+
+class SearchTests(TestCase):
+    """Ranked full-text search over titles, descriptions and tags."""
+
+    def setUp(self):
+        """Make a photographer and start from an empty search index."""
+        memory_index.clear()
+        self.addCleanup(memory_index.clear)
+        self.user = UserFactory.create()
+        self.profile = self.user.profile
+
+    def found(self, text, model=Photo, user=None, per_page=10, **cursors):
+        """Return the search page for text as seen by user."""
+        return search(visible_to(model, user or AnonymousUser()), text, per_page, **cursors)
+
+    def test_title_matches_rank_first(self):
+        """A word in the title outranks the same word in a description."""
+        described = PhotoFactory.create(owner=self.profile, published='PUBLIC',
+                                        title='Evening', description='a lighthouse at dusk')
+        titled = PhotoFactory.create(owner=self.profile, published='PUBLIC',
+                                     title='Lighthouse', description='')
+        PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Harbour')
+        found = list(self.found('lighthouse'))
+        self.assertEqual(found, [titled, described])
+        self.assertGreater(found[0].rank, found[1].rank)
+
+    def test_every_word_must_match(self):
+        """Tags are searched too, and all words have to be found."""
+        photo = PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Waves')
+        photo.tags.add('sea')
+        PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Sea wall')
+        self.assertEqual(list(self.found('Sea waves')), [photo])
+        self.assertEqual(list(self.found('')), [])
+
+    def test_private_matches_are_hidden(self):
+        """Only the owner finds their private photos."""
+        photo = PhotoFactory.create(owner=self.profile, published='PRIVATE', title='Secret')
+        self.assertEqual(list(self.found('secret')), [])
+        self.assertEqual(list(self.found('secret', user=self.user)), [photo])
+
+    def test_edits_and_deletes_update_the_index(self):
+        """Saved titles are found at once and deleted rows disappear."""
+        photo = PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Harbour')
+        self.assertEqual(list(self.found('harbour')), [photo])
+        photo.title = 'Lighthouse'
+        photo.save()
+        album = AlbumFactory.create(owner=self.profile, published='PUBLIC', title='Lighthouse keeper')
+        self.assertEqual(list(self.found('harbour')), [])
+        self.assertEqual(list(self.found('lighthouse')), [photo])
+        self.assertEqual(list(self.found('lighthouse', model=Album)), [album])
+        photo.delete()
+        self.assertEqual(list(self.found('lighthouse')), [])
+
+    def test_results_are_paginated_by_cursor(self):
+        """Following the cursors walks every match once, and back again."""
+        photos = [PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Bridge')
+                  for _ in range(5)]
+        first = self.found('bridge', per_page=2)
+        second = self.found('bridge', per_page=2, after=first.next_cursor)
+        third = self.found('bridge', per_page=2, after=second.next_cursor)
+        seen = list(first) + list(second) + list(third)
+        self.assertEqual(sorted(seen, key=lambda photo: photo.id), photos)
+        self.assertIsNone(third.next_cursor)
+        self.assertEqual(list(self.found('bridge', per_page=2, before=second.previous_cursor)),
+                         list(first))
+
+    def test_cursors_move_past_unequal_ranks(self):
+        """A page at a time, every match comes once, however it ranked."""
+        photos = [
+            PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Canal'),
+            PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Canal boats moored'),
+            PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Lock',
+                                description='the canal at dawn'),
+            PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Barge'),
+        ]
+        photos[3].tags.add('canal')
+        seen = []
+        page = self.found('canal', per_page=1)
+        while True:
+            seen.extend(page)
+            if page.next_cursor is None:
+                break
+            self.assertLessEqual(len(seen), len(photos))
+            page = self.found('canal', per_page=1, after=page.next_cursor)
+        self.assertEqual(sorted(photo.id for photo in seen), [photo.id for photo in photos])
+        ranks = [photo.rank for photo in seen]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    def test_search_page(self):
+        """The search page lists matches and links to more."""
+        for _ in range(3):
+            PhotoFactory.create(owner=self.profile, published='PUBLIC', title='Dune')
+        with self.settings(IMAGER_GALLERY_PAGE_SIZE=2):
+            response = self.client.get(reverse_lazy('search'), {'q': 'dune'})
+        self.assertEqual(len(response.context['results']), 2)
+        self.assertContains(response, 'after=')
+        self.assertEqual(self.client.get(reverse_lazy('search'), {'q': 'x', 'after': 'bad'}).status_code,
+                         404)
+
+
+class AlbumEditingTests(TestCase):
+    """Album membership picked a page at a time and saved as deltas."""
+
+    def setUp(self):
+        """Log in an owner with an album holding two of three photos."""
+        memory_index.clear()
+        self.addCleanup(memory_index.clear)
+        self.user = UserFactory.create()
+        self.client.force_login(self.user)
+        self.photos = [PhotoFactory.create(owner=self.user.profile, title='Photo {}'.format(i))
+                       for i in range(3)]
+        self.album = AlbumFactory.create(owner=self.user.profile, title='Trip')
+        self.album.photos.add(self.photos[0], self.photos[1])
+
+    def edit(self, **data):
+        """Post the album form with data."""
+        form = {'title': 'Trip', 'description': '', 'published': 'PRIVATE', 'cover_photo': ''}
+        form.update(data)
+        return self.client.post(reverse_lazy('edit_album', args=[self.album.id]), form)
+
+    def picker(self, **params):
+        """Return the photo picker's JSON."""
+        return self.client.get(reverse_lazy('photo_picker'), params).json()
+
+    def test_edit_page_does_not_list_every_photo(self):
+        """The form renders no option per photo."""
+        response = self.client.get(reverse_lazy('edit_album', args=[self.album.id]))
+        self.assertNotContains(response, 'Photo 2')
+        self.assertContains(response, 'photo-picker')
+
+    def test_picker_pages_photos_and_marks_members(self):
+        """The picker pages the owner's photos and flags the album's."""
+        with self.settings(IMAGER_PHOTO_PICKER_PAGE_SIZE=2):
+            first = self.picker(album=self.album.id)
+            second = self.picker(album=self.album.id, after=first['next'])
+        flags = dict((photo['id'], photo['in_album']) for photo in first['results'] + second['results'])
+        self.assertEqual(flags, {self.photos[0].id: True, self.photos[1].id: True,
+                                 self.photos[2].id: False})
+        self.assertIsNone(second['next'])
+
+    def test_picker_searches_and_stays_private(self):
+        """The picker searches only the user's photos and albums."""
+        self.photos[2].title = 'Lighthouse'
+        self.photos[2].save()
+        other = PhotoFactory.create(owner=UserFactory.create().profile, title='Lighthouse')
+        results = self.picker(q='lighthouse')['results']
+        self.assertEqual([photo['id'] for photo in results], [self.photos[2].id])
+        other_album = AlbumFactory.create(owner=other.owner)
+        response = self.client.get(reverse_lazy('photo_picker'), {'album': other_album.id})
+        self.assertEqual(response.status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse_lazy('photo_picker')).status_code, 403)
+
+    def test_picker_rejects_a_malformed_album(self):
+        """An album that is not an id is a bad request, not an error."""
+        response = self.client.get(reverse_lazy('photo_picker'), {'album': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_deltas_change_only_what_was_picked(self):
+        """Added and removed ids are applied and the rest left alone."""
+        response = self.edit(add_photos='{},{}'.format(self.photos[2].id, self.photos[0].id),
+                             remove_photos=str(self.photos[1].id),
+                             cover_photo=self.photos[2].id)
+        self.assertEqual(response.status_code, 302)
+        album = Album.objects.get(pk=self.album.pk)
+        self.assertEqual(set(album.photos.all()), set([self.photos[0], self.photos[2]]))
+        self.assertEqual(album.cover_photo, self.photos[2])
+
+    def test_other_peoples_photos_are_refused(self):
+        """Photos of other users cannot be added or made the cover."""
+        other = PhotoFactory.create(owner=UserFactory.create().profile)
+        response = self.edit(add_photos=str(other.id), cover_photo=other.id)
+        self.assertEqual(set(response.context['form'].errors), set(['add_photos', 'cover_photo']))
+        self.assertEqual(self.album.photos.count(), 2)
+
+    def test_new_album_gets_the_picked_photos(self):
+        """Creating an album adds the picked photos."""
+        self.client.post(reverse_lazy('add_album'), {
+            'title': 'New', 'description': '', 'published': 'PUBLIC', 'cover_photo': '',
+            'add_photos': str(self.photos[2].id),
+        })
+        album = Album.objects.get(title='New')
+        self.assertEqual(album.owner, self.user.profile)
+        self.assertEqual(list(album.photos.all()), [self.photos[2]])
+
+
+class LargeAdminTests(TestCase):
+    """The admin pages stay bounded as the photo tables grow."""
+
+    def setUp(self):
+        """Log in a superuser with an album of 25 photos."""
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.user = UserFactory.create()
+        self.photos = [PhotoFactory.create(owner=self.user.profile, title='Photo {}'.format(i))
+                       for i in range(25)]
+        self.album = AlbumFactory.create(owner=self.user.profile, title='Big')
+        self.album.photos.add(*self.photos)
+
+    def album_url(self, **params):
+        """Return the admin change url of the album."""
+        url = reverse_lazy('admin:imager_images_album_change', args=[self.album.id])
+        return '{}?{}'.format(url, urlencode(params)) if params else url
+
+    def test_album_inline_is_paginated(self):
+        """The album form edits its photos twenty at a time."""
+        first = self.client.get(self.album_url())
+        second = self.client.get(self.album_url(inline_page=2))
+        self.assertEqual(len(first.context['inline_admin_formsets'][0].formset.initial_forms), 20)
+        self.assertEqual(len(second.context['inline_admin_formsets'][0].formset.initial_forms), 5)
+        self.assertNotContains(first, '<option value="{}"'.format(self.photos[0].id))
+        self.assertContains(first, 'inline_page=2')
+
+    def test_saving_a_page_leaves_other_pages_alone(self):
+        """Deleting a row on page two keeps the rows of page one."""
+        response = self.client.get(self.album_url(inline_page=2))
+        formset = response.context['inline_admin_formsets'][0].formset
+        data = {
+            'title': 'Big', 'description': '', 'published': 'PRIVATE',
+            'owner': self.user.profile.id, 'cover_photo': '',
+            formset.management_form.add_prefix('TOTAL_FORMS'): len(formset.initial_forms),
+            formset.management_form.add_prefix('INITIAL_FORMS'): len(formset.initial_forms),
+        }
+        for form in formset.initial_forms:
+            data[form.add_prefix('id')] = form.instance.pk
+            data[form.add_prefix('album')] = self.album.id
+            data[form.add_prefix('photo')] = form.instance.photo_id
+        data[formset.initial_forms[0].add_prefix('DELETE')] = 'on'
+        response = self.client.post(self.album_url(inline_page=2), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.album.photos.count(), 24)
+
+    def test_change_list_queries_do_not_grow(self):
+        """The photo change list costs the same with more rows."""
+        url = reverse_lazy('admin:imager_images_photo_changelist')
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for i in range(10):
+            PhotoFactory.create(owner=UserFactory.create().profile)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(small), len(large))
+        self.assertNotContains(self.client.get(reverse_lazy('admin:imager_images_photo_add')),
+                               '<option value="{}"'.format(self.user.profile.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_uses_ids_prefixes_and_usernames(self):
+        """Search matches ids, title prefixes and exact usernames."""
+        url = reverse_lazy('admin:imager_images_photo_changelist')
+
+        def found(term):
+            return set(self.client.get(url, {'q': term}).context['cl'].result_list)
+
+        self.assertEqual(found(str(self.photos[3].id)), set([self.photos[3]]))
+        self.assertEqual(found('Photo 2'), set([self.photos[2]] + self.photos[20:25]))
+        self.assertEqual(found('hoto'), set())
+        self.assertEqual(found(self.user.username), set(self.photos))
+
+    def test_large_tables_are_estimated(self):
+        """Unfiltered change lists over a large table use the estimate."""
+        class Estimated(EstimatedCountPaginator):
+            def estimate(self):
+                return 5000000
+
+        self.assertEqual(Estimated(Photo.objects.all(), 100).count, 5000000)
+        self.assertEqual(Estimated(Photo.objects.filter(title='Photo 1'), 100).count, 1)
+        self.assertEqual(EstimatedCountPaginator(Photo.objects.all(), 100).count, 25)
+
+
+class TieredCacheTests(TestCase):
+    """The in-process LRU, the shared SQLite cache and single-flight fills."""
+
+    def setUp(self):
+        """Give two simulated workers their own L1 over one shared file."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        options = {'SHARED': 'shared', 'MAX_ENTRIES': 3, 'LOCAL_TIMEOUT': 60}
+        settings = override_settings(CACHES={
+            'default': {'BACKEND': 'imager_images.tieredcache.TieredCache', 'OPTIONS': options},
+            'shared': {'BACKEND': 'imager_images.tieredcache.SQLiteCache',
+                       'LOCATION': os.path.join(directory, 'cache.sqlite3')},
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.workers = [TieredCache(None, {'OPTIONS': options}) for i in range(2)]
+        self.shared = self.workers[0].shared
+
+    def test_lru_evicts_the_least_recently_used(self):
+        """The local level holds MAX_ENTRIES values, dropping the coldest."""
+        worker = self.workers[0]
+        for key in 'abc':
+            worker.set(key, key.upper())
+        worker.get('a')
+        worker.set('d', 'D')
+        self.assertEqual(worker.local.get(worker.make_key('b'))[0], False)
+        self.assertEqual(worker.local.get(worker.make_key('a'))[0], True)
+        self.assertEqual(worker.get('b'), 'B')
+
+    def test_values_are_shared_between_workers(self):
+        """A value one worker stores is read by the other from the shared level."""
+        self.workers[0].set('gallery', [1, 2], 60)
+        self.assertEqual(self.workers[1].get('gallery'), [1, 2])
+        self.assertEqual(self.workers[1].get_many(['gallery', 'none']), {'gallery': [1, 2]})
+        self.workers[0].delete('gallery')
+        self.assertIsNone(self.workers[0].get('gallery'))
+
+    def test_version_bumps_reach_every_worker(self):
+        """Version keys skip the local level, so a bump is seen at once."""
+        key = 'imager:version:photos'
+        self.assertTrue(self.workers[0].add(key, 1, None))
+        self.assertFalse(self.workers[1].add(key, 5, None))
+        self.assertEqual(self.workers[1].get(key), 1)
+        self.workers[0].incr(key)
+        self.assertEqual(self.workers[1].get(key), 2)
+
+    def test_dropped_profiles_are_gone_from_every_worker(self):
+        """Profile keys skip the local level, so a delete in one worker reaches all."""
+        key = PROFILE_KEY.format(1)
+        self.workers[0].set(key, 'old', 60)
+        self.assertEqual(self.workers[0].get(key), 'old')
+        self.workers[1].delete(key)
+        self.assertIsNone(self.workers[0].get(key))
+
+    def test_shared_level_expires_and_counts(self):
+        """The SQLite level honours timeouts and refuses to increment nothing."""
+        self.shared.set('gone', 1, -1)
+        self.assertIsNone(self.shared.get('gone'))
+        self.assertTrue(self.shared.add('gone', 2))
+        self.assertEqual(self.shared.incr('gone', 3), 5)
+        with self.assertRaises(ValueError):
+            self.shared.incr('missing')
+
+    def test_remember_computes_a_missing_value_once(self):
+        """A computed value is stored and served to later callers."""
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        self.assertEqual(remember('imager:test', compute, 60), 1)
+        self.assertEqual(remember('imager:test', compute, 60), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_remember_serves_stale_while_another_refreshes(self):
+        """Callers that lose the lock get the old value instead of computing."""
+        cache.set('imager:test', ('old', time.time() - 1, 0.1), 60)
+        cache.add(LOCK_KEY.format('imager:test'), 1, 30)
+        self.assertEqual(remember('imager:test', lambda: 'new', 60), 'old')
+        cache.delete(LOCK_KEY.format('imager:test'))
+        self.assertEqual(remember('imager:test', lambda: 'new', 60), 'new')
+
+    def test_remember_waits_then_computes_without_a_value(self):
+        """With nothing to serve and the lock held, a caller computes after waiting."""
+        cache.add(LOCK_KEY.format('imager:test'), 1, 30)
+        with self.settings(IMAGER_CACHE_LOCK_WAIT=0.1):
+            self.assertEqual(remember('imager:test', lambda: 'computed', 60), 'computed')
+
+
+class SeedAndBenchmarkTests(TestCase):
+    """The synthetic data generator and the page benchmark."""
+
+    def setUp(self):
+        """Seed a small library."""
+        cache.clear()
+        self.out = StringIO()
+        call_command('seed_data', users=4, photos=60, albums=5, tags=8, images=2, seed=1,
+                     stdout=self.out)
+
+    def test_seed_data_creates_consistent_rows(self):
+        """Seeded rows come with profiles, tags, albums and reconciled counters."""
+        self.assertIn('Created 4 users, 60 photos', self.out.getvalue())
+        profiles = ImagerProfile.objects.filter(user__username__startswith='seed')
+        self.assertEqual(profiles.count(), 4)
+        self.assertEqual(Photo.objects.count(), 60)
+        self.assertEqual(Album.objects.count(), 5)
+        self.assertEqual(set(Photo.objects.values_list('published', flat=True)) <= {'PUBLIC', 'SHARED', 'PRIVATE'},
+                         True)
+        self.assertTrue(TaggedItem.objects.exists())
+        self.assertEqual(sum(TagCount.objects.values_list('public_photos', flat=True)),
+                         TaggedItem.objects.filter(object_id__in=Photo.public.values('id')).count())
+        self.assertEqual(sum(profile.public_photos + profile.shared_photos + profile.private_photos
+                             for profile in profiles), 60)
+        for album in Album.objects.all():
+            self.assertEqual(album.cover_photo.owner_id, album.owner_id)
+            self.assertFalse(album.photos.exclude(owner_id=album.owner_id).exists())
+
+    def test_seed_data_is_repeatable(self):
+        """A second run continues the usernames instead of clashing."""
+        call_command('seed_data', users=2, photos=5, albums=1, images=1, stdout=StringIO())
+        self.assertTrue(User.objects.filter(username='seed5').exists())
+        self.assertEqual(Photo.objects.count(), 65)
+
+    def test_benchmark_reports_every_named_url(self):
+        """Each named page gets timings, a query count and a size."""
+        out = StringIO()
+        call_command('benchmark', requests=2, warmup=0, stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['urls']) | set(report['skipped']), set(url_names()))
+        self.assertNotIn('logout', report['urls'])
+        self.assertNotIn('api_photos', report['skipped'])
+        gallery = report['urls']['photo_gallery']
+        self.assertEqual(gallery['status'], 200)
+        self.assertGreater(gallery['bytes'], 0)
+        self.assertGreater(report['urls']['api_photo']['max_queries'], 0)
+        self.assertLessEqual(gallery['p50_ms'], gallery['p95_ms'])
+        self.assertEqual(report['rows']['photos'], 60)
+
+    def test_benchmark_signed_in_compares_with_a_baseline(self):
+        """A signed-in run reaches the owner's pages and diffs against a report."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        baseline = os.path.join(directory, 'before.json')
+        owner = Photo.objects.order_by('id').first().owner.user
+        call_command('benchmark', 'edit_photo', 'library', user=owner.username, requests=1,
+                     output=baseline, stdout=StringIO())
+        err = StringIO()
+        call_command('benchmark', 'edit_photo', 'library', user=owner.username, requests=1,
+                     compare=baseline, stdout=StringIO(), stderr=err)
+        with open(baseline) as report:
+            report = json.load(report)
+        self.assertEqual(report['user'], owner.username)
+        self.assertEqual(report['urls']['edit_photo']['status'], 200)
+        self.assertIn('library', err.getvalue())
@@ -0,0 +1,333 @@
+"""A two-level cache: a small LRU in each process in front of a shared store.
+
+LocMemCache gives every worker its own cold copy, and a version bump in
+one worker never reaches the others. TieredCache keeps recently read
+values in a bounded in-process LRU (L1) and reads everything else from
+a cache every worker shares (L2), by default SQLiteCache, a file on the
+local disk.
+
+L1 copies live at most LOCAL_TIMEOUT seconds, which bounds how long a
+worker can miss another's write. Keys starting with one of
+SHARED_PREFIXES never enter L1: the namespace version keys of
+imager_images.cache are read from L2 every time, so a bump in any
+worker retires the versioned pages in all of them at once, and the
+single-flight lock keys are always decided by L2. Cached profiles
+bypass L1 too, so dropping one takes effect in every worker at once.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.six.moves import cPickle as pickle
+
+SQL_BATCH = 500
+SHARED_PREFIXES = ('imager:version:', 'imager:lock:', 'imager:profile:')
+
+
+class LocalLRU(object):
+    """A thread-safe, size-bounded LRU of pickled values with expiry times."""
+
+    def __init__(self, max_entries):
+        """Start empty."""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (True, pickled) for a live entry, else (False, None)."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False, None
+            if entry[1] <= time.time():
+                return False, None
+            # Re-inserting moves the entry to the recently used end.
+            self._entries[key] = entry
+            return True, entry[0]
+
+    def set(self, key, pickled, expires):
+        """Store a value until expires, evicting the least recently used."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (pickled, expires)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Drop an entry."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        """Return how many entries are held, live or not."""
+        return len(self._entries)
+
+
+class SQLiteCache(BaseCache):
+    """A cache in an SQLite file, shared by every process on the machine.
+
+    add() and incr() are atomic across processes, which the version
+    keys and single-flight locks of imager_images.cache rely on.
+    LOCATION is the path of the database file.
+    """
+
+    cull_every = 100
+
+    def __init__(self, location, params):
+        """Remember where the database lives; connect lazily."""
+        super(SQLiteCache, self).__init__(params)
+        self.path = location
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        """Return this thread's connection, opening it after a fork too."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    if not os.path.isdir(directory):
+                        raise
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _key(self, key, version):
+        """Return the stored form of a key."""
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _live(self, row, now):
+        """Return True if a (value, expires) row has not expired."""
+        return row is not None and (row[1] is None or row[1] > now)
+
+    def get(self, key, default=None, version=None):
+        """Return the value of key, or default."""
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (self._key(key, version),)).fetchone()
+        if not self._live(row, time.time()):
+            return default
+        return pickle.loads(bytes(row[0]))
+
+    def get_many(self, keys, version=None):
+        """Return the live values of keys, a batch of keys per query."""
+        stored = OrderedDict((self._key(key, version), key) for key in keys)
+        names = list(stored)
+        found = {}
+        now = time.time()
+        for start in range(0, len(names), SQL_BATCH):
+            batch = names[start:start + SQL_BATCH]
+            rows = self._connection().execute(
+                'SELECT key, value, expires FROM cache WHERE key IN ({})'.format(','.join('?' * len(batch))),
+                batch)
+            for name, value, expires in rows:
+                if self._live((value, expires), now):
+                    found[stored[name]] = pickle.loads(bytes(value))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Store value under key."""
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (self._key(key, version), self._dumps(value), self.get_backend_timeout(timeout)))
+        self._maybe_cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Store value unless key holds a live value; return True if stored."""
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, time.time()))
+        added = connection.execute(
+            'INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, self._dumps(value), self.get_backend_timeout(timeout))).rowcount == 1
+        if added:
+            self._maybe_cull()
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        """Add delta to the number under key in one transaction."""
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if not self._live(row, time.time()):
+                raise ValueError("Key '{}' not found".format(key))
+            value = pickle.loads(bytes(row[0])) + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?', (self._dumps(value), key))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        """Remove key."""
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def has_key(self, key, version=None):
+        """Return True if key holds a live value."""
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (self._key(key, version),)).fetchone()
+        return self._live(row, time.time())
+
+    def clear(self):
+        """Remove every key."""
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        """Keep the connection; SQLite files are cheap to hold open."""
+        pass
+
+    def _dumps(self, value):
+        """Return value pickled for a BLOB column."""
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def _maybe_cull(self):
+        """Every cull_every writes, trim the table back under MAX_ENTRIES."""
+        self._sets += 1
+        if self._sets % self.cull_every == 0:
+            self._cull()
+
+    def _cull(self):
+        """Drop expired rows, then the soonest to expire while over the limit."""
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (max(count - self._max_entries, count // self._cull_frequency),))
+
+
+class TieredCache(BaseCache):
+    """An in-process LRU in front of the cache named by OPTIONS['SHARED'].
+
+    Other OPTIONS: MAX_ENTRIES bounds the LRU, LOCAL_TIMEOUT caps how
+    long a value stays in it and SHARED_PREFIXES lists the keys that
+    bypass it. Key prefixes and versions are applied by the shared
+    cache.
+    """
+
+    def __init__(self, location, params):
+        """Read the options; the shared cache is looked up on first use."""
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 10)
+        self.shared_prefixes = tuple(options.get('SHARED_PREFIXES', SHARED_PREFIXES))
+        super(TieredCache, self).__init__(params)
+        self.local = LocalLRU(self._max_entries)
+
+    @property
+    def shared(self):
+        """Return the L2 cache."""
+        return caches[self.shared_alias]
+
+    def _local_key(self, key, version):
+        """Return the L1 key, or None if key must always be read from L2."""
+        if key.startswith(self.shared_prefixes):
+            return None
+        return self.make_key(key, version=version)
+
+    def _remember(self, local_key, value, timeout=DEFAULT_TIMEOUT):
+        """Copy a value into L1 for at most LOCAL_TIMEOUT seconds."""
+        if local_key is None:
+            return
+        expires = time.time() + self.local_timeout
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None:
+            expires = min(expires, backend_timeout)
+        self.local.set(local_key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+
+    def get(self, key, default=None, version=None):
+        """Return the value from L1, else from L2."""
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            hit, pickled = self.local.get(local_key)
+            if hit:
+                return pickle.loads(pickled)
+        missing = object()
+        value = self.shared.get(key, missing, version=version)
+        if value is missing:
+            return default
+        self._remember(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        """Return what L1 holds and fetch the rest from L2 at once."""
+        found = {}
+        wanted = []
+        for key in keys:
+            local_key = self._local_key(key, version)
+            hit, pickled = self.local.get(local_key) if local_key is not None else (False, None)
+            if hit:
+                found[key] = pickle.loads(pickled)
+            else:
+                wanted.append(key)
+        if wanted:
+            fetched = self.shared.get_many(wanted, version=version)
+            for key, value in fetched.items():
+                self._remember(self._local_key(key, version), value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Write through to L2."""
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(self._local_key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Let L2 decide whether the key is free."""
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(self._local_key(key, version), value, timeout)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        """Increment in L2."""
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self.local.delete(local_key)
+        return self.shared.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        """Delete from both levels."""
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self.local.delete(local_key)
+        self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        """Return True if either level holds key."""
+        local_key = self._local_key(key, version)
+        if local_key is not None and self.local.get(local_key)[0]:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        """Empty both levels."""
+        self.local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        """Close the shared cache's connections."""
+        self.shared.close(**kwargs)
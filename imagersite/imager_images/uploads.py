@@ -0,0 +1,157 @@
+"""Resumable uploads gathered chunk by chunk before they become a photo."""
+import os
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from imager_images.models import Photo, UploadSession, upload_staging_dir
+
+CHUNK_SIZE = 64 * 1024
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadConflict(Exception):
+    """A chunk that does not start where the upload left off."""
+
+    def __init__(self, offset):
+        """Remember the offset the client should resume from."""
+        super(UploadConflict, self).__init__('Upload is at byte {}.'.format(offset))
+        self.offset = offset
+
+
+class UploadIncomplete(Exception):
+    """An upload finalized before all of its bytes arrived."""
+
+
+class UploadRejected(Exception):
+    """An upload that cannot be stored as a photo."""
+
+
+def max_upload_bytes():
+    """Return the largest original a session may announce."""
+    return getattr(settings, 'IMAGER_UPLOAD_MAX_BYTES', 100 * 1024 * 1024)
+
+
+def session_ttl():
+    """Return how long an idle session is kept."""
+    return timedelta(seconds=getattr(settings, 'IMAGER_UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+
+def parse_content_range(header, size):
+    """Return (start, length) from a "bytes start-end/total" header."""
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        raise ValueError('Send a Content-Range of the form "bytes start-end/total".')
+    start, end, total = [int(group) for group in match.groups()]
+    if total != size or end < start or end >= size:
+        raise ValueError('The Content-Range does not fit the upload.')
+    return start, end - start + 1
+
+
+class StagedFile(File):
+    """A staging file the storage may move into place instead of copying."""
+
+    def temporary_file_path(self):
+        """Return where the staged bytes are on disk."""
+        return self.file.name
+
+
+def append_chunk(session, stream, start, length):
+    """Write length bytes read from stream into the session at start.
+
+    The bytes are copied a block at a time, so a chunk is never held in
+    memory whole, and outside any transaction, so a slow client holds no
+    row lock while it sends. The offset then moves with a compare-and-set:
+    of two attempts at the same chunk, from any connections, one counts
+    and the other gets a conflict. Returns the number of bytes written,
+    which is short if the client went away mid-chunk.
+    """
+    offset, photo_id = UploadSession.objects.values_list('offset', 'photo_id').get(pk=session.pk)
+    if photo_id or start != offset:
+        raise UploadConflict(offset)
+    path = session.staging_path
+    if not os.path.isdir(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+    written = 0
+    # Never truncate: a racing attempt may already have written further.
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as staged:
+        staged.seek(start)
+        while written < length:
+            block = stream.read(min(CHUNK_SIZE, length - written))
+            if not block:
+                break
+            staged.write(block)
+            written += len(block)
+    moved = (UploadSession.objects.filter(pk=session.pk, offset=start, photo__isnull=True)
+             .update(offset=start + written, date_modified=timezone.now()))
+    if not moved:
+        raise UploadConflict(UploadSession.objects.values_list('offset', flat=True).get(pk=session.pk))
+    session.offset = start + written
+    return written
+
+
+def finalize(session):
+    """Turn a complete upload into a photo and return the photo.
+
+    Finalizing twice returns the same photo.
+    """
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if locked.photo_id:
+            return locked.photo
+        if not locked.is_complete:
+            raise UploadIncomplete('Only {} of {} bytes have arrived.'.format(locked.offset, locked.size))
+        try:
+            # Drop any bytes a losing attempt wrote past the end.
+            with open(locked.staging_path, 'r+b') as staged:
+                staged.truncate(locked.size)
+            with open(locked.staging_path, 'rb') as staged:
+                Image.open(staged).verify()
+        except Exception:
+            raise UploadRejected('Not a valid image.')
+        field = Photo._meta.get_field('photo')
+        with open(locked.staging_path, 'rb') as staged:
+            stored = field.storage.save(field.generate_filename(None, locked.filename),
+                                        StagedFile(staged, locked.filename))
+        photo = Photo.objects.create(
+            owner=locked.owner,
+            title=locked.title or os.path.splitext(locked.filename)[0][:128],
+            published=locked.published,
+            photo=stored,
+        )
+        locked.photo = photo
+        locked.save(update_fields=['photo', 'date_modified'])
+    session.photo = photo
+    return photo
+
+
+def expire_sessions(now=None):
+    """Delete sessions idle for longer than the TTL and stray staging files.
+
+    Returns how many sessions were deleted.
+    """
+    cutoff = (now or timezone.now()) - session_ttl()
+    expired = 0
+    for session in UploadSession.objects.filter(date_modified__lt=cutoff).iterator():
+        session.delete()
+        expired += 1
+    staging_dir = upload_staging_dir()
+    if os.path.isdir(staging_dir):
+        known = set(session_id.hex for session_id in
+                    UploadSession.objects.values_list('id', flat=True))
+        for name in os.listdir(staging_dir):
+            path = os.path.join(staging_dir, name)
+            stem = name.split('.')[0]
+            modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+            if stem not in known and modified < cutoff:
+                os.remove(path)
+    return expired
@@ -3,26 +3,42 @@ from django.conf.urls import url
 from imager_images.models import Photo
 from imager_images.views import (
     AlbumView,
+    AlbumDownloadView,
     PhotoView,
     AlbumGalleryView,
     PhotoGalleryView,
     LibraryView,
     AddAlbumView,
     AddPhotoView,
+    BulkAddPhotoView,
     EditAlbumView,
     EditPhotoView,
+    PhotoPickerView,
     TagPhotoGalleryView,
+    TagCloudView,
+    SearchView,
+    UploadSessionsView,
+    UploadSessionView,
+    FinalizeUploadView,
 )
 
 urlpatterns = [
     url(r'^library/$', LibraryView.as_view(), name='library'),
     url(r'albums/(?P<albumid>\d+)/$', AlbumView.as_view(), name='album'),
+    url(r'albums/(?P<pk>\d+)/download/$', AlbumDownloadView.as_view(), name='download_album'),
     url(r'albums/$', AlbumGalleryView.as_view(), name='album_gallery'),
     url(r'photos/$', PhotoGalleryView.as_view(), name='photo_gallery'),
     url(r'photos/(?P<pk>\d+)/$', PhotoView.as_view(), name='photo'),
     url(r'albums/add/$', AddAlbumView.as_view(), name='add_album'),
     url(r'photos/add/$', AddPhotoView.as_view(), name='add_photo'),
+    url(r'photos/add/bulk/$', BulkAddPhotoView.as_view(), name='bulk_add_photo'),
     url(r'albums/(?P<pk>\d+)/edit/$', EditAlbumView.as_view(), name='edit_album'),
     url(r'photos/(?P<pk>\d+)/edit/$', EditPhotoView.as_view(), name='edit_photo'),
+    url(r'photos/picker/$', PhotoPickerView.as_view(), name='photo_picker'),
     url(r'photos/tagged/(?P<slug>[-\w]+)/$', TagPhotoGalleryView.as_view(), name="tagged_photos"),
+    url(r'photos/tags/$', TagCloudView.as_view(), name="tag_cloud"),
+    url(r'search/$', SearchView.as_view(), name='search'),
+    url(r'uploads/$', UploadSessionsView.as_view(), name='upload_sessions'),
+    url(r'uploads/(?P<pk>[0-9a-f]{32})/$', UploadSessionView.as_view(), name='upload_session'),
+    url(r'uploads/(?P<pk>[0-9a-f]{32})/finalize/$', FinalizeUploadView.as_view(), name='finalize_upload'),
 ]
@@ -1,21 +1,62 @@
 """Views for albums and photos."""
-from django.views.generic.edit import CreateView, UpdateView
-from django.views.generic import ListView, DetailView
-from django.urls import reverse_lazy
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.views.generic.edit import CreateView, FormView, UpdateView
+from django.views.generic import ListView, DetailView, View
+from django.urls import reverse, reverse_lazy
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseRedirect
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-
-from imager_profile.models import ImagerProfile
-from imager_images.models import Album, Photo
+from django.db.models import Count, Max
+
+from imager_profile.middleware import get_profile
+from imager_images import tagindex
+from imager_images.bulkupload import bulk_upload
+from imager_images.cache import AnonymousPageCacheMixin, namespace_versions, tag_namespace
+from imager_images.conditional import ConditionalGetMixin
+from imager_images.duplicates import near_duplicates
+from imager_images import downloads, media, membership, search, uploads
+from imager_images.models import Album, Photo, SimilarPhoto, UploadSession, visible_to
+from imager_images.pagination import CursorPaginationMixin, CursorPaginator
+from imager_images.similarity import similar_public_photos
 from imager_images.forms import (AddAlbumForm,
                                  AddPhotoForm,
+                                 BulkUploadForm,
+                                 UploadSessionForm,
                                  EditPhotoForm,
                                  EditAlbumForm)
 
 # Create your views here.
 
 
+class ResolvedObjectMixin(object):
+    """Load the object once, with its owner, for the access test and the view.
+
+    UserPassesTestMixin runs test_func before the view fetches anything, so
+    the object the test loads is kept and handed back by get_object.
+    """
+
+    owner_only = False
+
+    def get_queryset(self):
+        """Join the owner and their user onto the object."""
+        return super(ResolvedObjectMixin, self).get_queryset().select_related('owner__user')
+
+    def get_object(self, queryset=None):
+        """Return the object, fetching it on first use only."""
+        if not hasattr(self, '_resolved_object'):
+            self._resolved_object = super(ResolvedObjectMixin, self).get_object(queryset)
+        return self._resolved_object
+
+    def test_func(self):
+        """Override the userpassestest test_func."""
+        obj = self.get_object()
+        if self.owner_only:
+            return obj.is_owned_by(self.request.user)
+        return obj.is_visible_to(self.request.user)
+
+
 class LibraryView(ListView):
     """"LibraryView."""
 
@@ -23,9 +64,9 @@ class LibraryView(ListView):
 
     def get_context_data(self):
         """Get albums and photos and return them."""
-        profile = ImagerProfile.active.get(user__username=self.request.user.username)
-        photos = profile.photos.all()
-        albums = profile.albums.all()
+        profile = get_profile(self.request)
+        photos = profile.photos.prefetch_related('tags').order_by('-date_uploaded')
+        albums = profile.albums.select_related('cover_photo').order_by('-date_uploaded')
         username = self.request.user.username
         return {'photos': photos,
                 'profile': profile,
@@ -37,27 +78,45 @@ class LibraryView(ListView):
         return {}
 
 
-class AlbumView(UserPassesTestMixin, ListView):
+class AlbumView(ResolvedObjectMixin, UserPassesTestMixin, ConditionalGetMixin, DetailView):
     """"AlbumView."""
 
     template_name = 'imager_images/album.html'
     model = Album
+    pk_url_kwarg = 'albumid'
     raise_exception = True
     permission_denied_message = "You don't have access to this album."
 
-    def test_func(self):
-        """Override the userpassestest test_func."""
-        album = get_object_or_404(Album, id=self.kwargs['albumid'])
-        return album.published == 'PUBLIC' or album.owner.user == self.request.user
+    def get_validators(self):
+        """Depend on the album and the newest change among its photos."""
+        album = self.get_object()
+        self._photos_state = album.photos.aggregate(modified=Max('date_modified'), count=Count('id'))
+        return [album.date_modified, self._photos_state['modified'], self._photos_state['count']]
 
-    def get_context_data(self):
+    def get_last_modified(self):
+        """Return the later of the album's and its photos' last change."""
+        return max(filter(None, [self.get_object().date_modified, self._photos_state['modified']]))
+
+    def get_context_data(self, **kwargs):
         """Get albums and photos and return them."""
-        album = Album.objects.get(id=self.kwargs['albumid'])
-        photos = album.photos.all()
-        return {'album': album, 'photos': photos}
+        context = super(AlbumView, self).get_context_data(**kwargs)
+        context['photos'] = self.object.photos.prefetch_related('tags')
+        return context
+
+
+class AlbumDownloadView(ResolvedObjectMixin, UserPassesTestMixin, DetailView):
+    """Download an album's photos as one zip file."""
+
+    model = Album
+    raise_exception = True
+    permission_denied_message = "You don't have access to this album."
+
+    def get(self, request, *args, **kwargs):
+        """Stream the archive of the photos the viewer may see."""
+        return downloads.album_response(self.get_object(), request.user)
 
 
-class PhotoView(UserPassesTestMixin, DetailView):
+class PhotoView(ResolvedObjectMixin, UserPassesTestMixin, ConditionalGetMixin, DetailView):
     """"AlbumView."""
 
     template_name = 'imager_images/photo.html'
@@ -65,38 +124,56 @@ class PhotoView(UserPassesTestMixin, DetailView):
     raise_exception = True
     permission_denied_message = "You don't have access to this photo."
 
-    def test_func(self):
-        """Override the userpassestest test_func."""
-        photo = get_object_or_404(Photo, id=self.kwargs['pk'])
-        return photo.published == 'PUBLIC' or photo.owner.user == self.request.user
+    def get_validators(self):
+        """Depend on the photo and the newest change among its similar photos."""
+        photo = self.get_object()
+        self._similar_state = (SimilarPhoto.objects.filter(photo=photo)
+                               .aggregate(modified=Max('similar__date_modified'), count=Count('id')))
+        return [photo.date_modified, self._similar_state['modified'], self._similar_state['count']]
+
+    def get_last_modified(self):
+        """Return the later of the photo's and its similar photos' last change."""
+        return max(filter(None, [self.get_object().date_modified, self._similar_state['modified']]))
 
     def get_context_data(self, **kwargs):
         """Include like-tagged photos."""
         context = super(PhotoView, self).get_context_data(**kwargs)
-        context['tag_photos'] = context['photo'].tags.similar_objects()[:5]
+        context['tag_photos'] = similar_public_photos(self.object)
         return context
 
 
-class AlbumGalleryView(ListView):
+class GalleryConditionalGetMixin(ConditionalGetMixin):
+    """Validate cached galleries by the versions of the namespaces they show."""
+
+    def get_validators(self):
+        """Return the namespace versions, which change whenever the page would."""
+        return namespace_versions(self.get_cache_namespaces())
+
+
+class AlbumGalleryView(GalleryConditionalGetMixin, AnonymousPageCacheMixin,
+                       CursorPaginationMixin, ListView):
     """"AlbumGalleryView."""
 
     template_name = 'imager_images/album_gallery.html'
     context_object_name = 'albums'
+    cache_namespaces = ('albums',)
 
     def get_queryset(self):
         """Redefining because I have to."""
-        return Album.public.all()
+        return Album.public.select_related('cover_photo')
 
 
-class PhotoGalleryView(ListView):
+class PhotoGalleryView(GalleryConditionalGetMixin, AnonymousPageCacheMixin,
+                       CursorPaginationMixin, ListView):
     """"PhotoGalleryView."""
 
     template_name = 'imager_images/photo_gallery.html'
     context_object_name = 'photos'
+    cache_namespaces = ('photos',)
 
     def get_queryset(self):
         """Redefining because I have to."""
-        return Photo.public.all()
+        return Photo.public.select_related('owner__user')
 
 
 class AddAlbumView(LoginRequiredMixin, CreateView):
@@ -108,24 +185,20 @@ class AddAlbumView(LoginRequiredMixin, CreateView):
     model = Album
     form_class = AddAlbumForm
 
-    def get_form(self):
-        """Retrieve form and customize some fields."""
-        form = super(AddAlbumView, self).get_form()
-        form.fields['cover_photo'].queryset = self.request.user.profile.photos.all()
-        form.fields['photos'].queryset = self.request.user.profile.photos.all()
-        # import pdb; pdb.set_trace()
-        return form
+    def get_form_kwargs(self):
+        """Offer only the user's own photos."""
+        kwargs = super(AddAlbumView, self).get_form_kwargs()
+        kwargs['owner'] = get_profile(self.request)
+        return kwargs
 
     def form_valid(self, form):
-        """If form post is successful, set the object's owner."""
-        # import pdb; pdb.set_trace()
+        """Set the owner before the album is first saved."""
+        form.instance.owner = get_profile(self.request)
         self.object = form.save()
-        self.object.owner = self.request.user.profile
-        self.object.save()
         return HttpResponseRedirect(self.get_success_url())
 
 
-class EditAlbumView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class EditAlbumView(LoginRequiredMixin, ResolvedObjectMixin, UserPassesTestMixin, UpdateView):
     """Edit an album."""
 
     login_required = True
@@ -133,20 +206,15 @@ class EditAlbumView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     template_name = 'imager_images/edit_album.html'
     model = Album
     form_class = EditAlbumForm
+    owner_only = True
     raise_exception = True
     permission_denied_message = "You don't have access to this album."
 
-    def test_func(self):
-        """Override the userpassestest test_func."""
-        album = self.get_object()
-        return album.owner.user == self.request.user
-
-    def get_form(self):
-        """Retrieve form and customize some fields."""
-        form = super(EditAlbumView, self).get_form()
-        form.fields['cover_photo'].queryset = self.request.user.profile.photos.all()
-        form.fields['photos'].queryset = self.request.user.profile.photos.all()
-        return form
+    def get_form_kwargs(self):
+        """Offer only the user's own photos."""
+        kwargs = super(EditAlbumView, self).get_form_kwargs()
+        kwargs['owner'] = get_profile(self.request)
+        return kwargs
 
 
 class AddPhotoView(LoginRequiredMixin, CreateView):
@@ -159,14 +227,43 @@ class AddPhotoView(LoginRequiredMixin, CreateView):
     form_class = AddPhotoForm
 
     def form_valid(self, form):
-        """If form post is successful, set the object's owner."""
-        self.object = form.save()
-        self.object.owner = self.request.user.profile
-        self.object.save()
-        return HttpResponseRedirect(self.get_success_url())
+        """Set the owner before the photo is first saved."""
+        form.instance.owner = get_profile(self.request)
+        response = super(AddPhotoView, self).form_valid(form)
+        duplicates = near_duplicates(self.object)
+        if duplicates:
+            messages.warning(self.request, 'This looks like a photo you already have: {}.'.format(
+                ', '.join('"{}"'.format(photo.title) for photo in duplicates[:3])))
+        return response
 
 
-class EditPhotoView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class BulkAddPhotoView(LoginRequiredMixin, FormView):
+    """Upload many photos, or a zip of them, in one request."""
+
+    login_required = True
+    template_name = 'imager_images/bulk_add_photo.html'
+    form_class = BulkUploadForm
+
+    def get_form(self):
+        """Offer only the user's own albums."""
+        form = super(BulkAddPhotoView, self).get_form()
+        form.fields['album'].queryset = get_profile(self.request).albums.all()
+        return form
+
+    def form_valid(self, form):
+        """Create the photos and show how each file fared."""
+        results = bulk_upload(
+            get_profile(self.request),
+            files=form.uploaded_files(),
+            archive=form.cleaned_data['archive'],
+            published=form.cleaned_data['published'],
+            tags=form.cleaned_data['tags'],
+            album=form.cleaned_data['album'],
+        )
+        return self.render_to_response(self.get_context_data(form=form, results=results))
+
+
+class EditPhotoView(LoginRequiredMixin, ResolvedObjectMixin, UserPassesTestMixin, UpdateView):
     """Edit a photo."""
 
     login_required = True
@@ -175,27 +272,229 @@ class EditPhotoView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Photo
     form_class = EditPhotoForm
     form_class.Meta.exclude.append('photo')
+    owner_only = True
     raise_exception = True
     permission_denied_message = "You don't have access to this album."
 
-    def test_func(self):
-        """Override the userpassestest test_func."""
-        photo = self.get_object()
-        return photo.owner.user == self.request.user
-
 
-class TagPhotoGalleryView(ListView):
+class TagPhotoGalleryView(GalleryConditionalGetMixin, AnonymousPageCacheMixin,
+                          CursorPaginationMixin, ListView):
     """List photos with a tag."""
 
     template_name = 'imager_images/photo_gallery.html'
     context_object_name = 'photos'
 
+    def get_cache_namespaces(self):
+        """Depend only on the photos filed under this tag."""
+        return (tag_namespace(self.kwargs.get("slug")),)
+
     def get_queryset(self):
-        """Define a restricted queryset just for certain tag."""
-        return Photo.public.filter(tags__slug=self.kwargs.get("slug")).all()
+        """Load the public photos the tag index pages through with their owners."""
+        return Photo.public.select_related('owner__user')
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        """Page the tag's entries in the public tag index."""
+        tag_id = tagindex.tag_id(self.kwargs.get("slug"))
+        return tagindex.TaggedPhotoPaginator(tag_id, per_page, queryset)
 
     def get_context_data(self, **kwargs):
         """Get context."""
         context = super(TagPhotoGalleryView, self).get_context_data(**kwargs)
         context["tag"] = self.kwargs.get("slug")
         return context
+
+
+class TagCloudView(ListView):
+    """List the tags with the most public photos."""
+
+    template_name = 'imager_images/tag_cloud.html'
+    context_object_name = 'tag_counts'
+
+    def get_queryset(self):
+        """Read the maintained counts instead of grouping the tagging tables."""
+        return tagindex.popular_tags()
+
+
+class SearchView(ListView):
+    """Find photos or albums by their titles, descriptions and tags."""
+
+    template_name = 'imager_images/search.html'
+    context_object_name = 'results'
+    kinds = {'photos': Photo, 'albums': Album}
+
+    def get_kind(self):
+        """Return whether photos or albums are being searched."""
+        kind = self.request.GET.get('kind')
+        return kind if kind in self.kinds else 'photos'
+
+    def get_paginate_by(self, queryset):
+        """Page like the galleries."""
+        return getattr(settings, 'IMAGER_GALLERY_PAGE_SIZE', 30)
+
+    def get_queryset(self):
+        """Limit the search to what the viewer may see."""
+        if self.get_kind() == 'albums':
+            return visible_to(Album, self.request.user).select_related('cover_photo')
+        return visible_to(Photo, self.request.user).select_related('owner__user')
+
+    def paginate_queryset(self, queryset, page_size):
+        """Return the page of ranked matches selected by the cursors."""
+        try:
+            page = search.search(queryset, self.request.GET.get('q', ''), page_size,
+                                 after=self.request.GET.get('after'),
+                                 before=self.request.GET.get('before'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return (None, page, page.object_list, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        """Add the query and what was searched."""
+        context = super(SearchView, self).get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        context['kind'] = self.get_kind()
+        return context
+
+
+class PhotoPickerView(LoginRequiredMixin, View):
+    """Page through the user's photos as JSON, to pick some for an album.
+
+    "?q=" searches the photos, "?album=<id>" marks which are already in
+    that album, and "after" and "before" take the cursors returned.
+    """
+
+    raise_exception = True
+
+    def get(self, request):
+        """Return one page of the user's photos."""
+        profile = get_profile(request)
+        photos = profile.photos.only('id', 'title', 'photo', 'date_uploaded')
+        size = getattr(settings, 'IMAGER_PHOTO_PICKER_PAGE_SIZE', 60)
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        album_id = request.GET.get('album')
+        if album_id and not album_id.isdigit():
+            return JsonResponse({'error': 'The album must be given by its id.'}, status=400)
+        try:
+            if request.GET.get('q'):
+                page = search.search(photos, request.GET['q'], size, after=after, before=before)
+            else:
+                page = CursorPaginator(photos, size, ('-date_uploaded', '-id')).page(after=after, before=before)
+        except InvalidPage as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        in_album = set()
+        if album_id:
+            album = get_object_or_404(profile.albums.only('id'), pk=int(album_id))
+            in_album = membership.members(album, [photo.id for photo in page])
+        return JsonResponse({
+            'results': [{
+                'id': photo.id,
+                'title': photo.title,
+                'thumb': photo.renditions['thumb'].url if 'thumb' in photo.renditions else None,
+                'in_album': photo.id in in_album,
+            } for photo in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+
+def describe_upload(session):
+    """Return the JSON a client needs to resume or finish an upload."""
+    return {
+        'id': session.id.hex,
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.offset,
+        'complete': session.is_complete,
+        'photo': session.photo_id,
+        'url': reverse('upload_session', args=[session.id.hex]),
+    }
+
+
+def upload_response(session, status=200):
+    """Return the session as JSON, with its offset in a header too."""
+    response = JsonResponse(describe_upload(session), status=status)
+    response['Upload-Offset'] = session.offset
+    return response
+
+
+class UploadSessionsView(LoginRequiredMixin, View):
+    """Start a resumable upload."""
+
+    raise_exception = True
+
+    def post(self, request):
+        """Create a session for the announced file."""
+        form = UploadSessionForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        form.instance.owner = get_profile(request)
+        session = form.save()
+        response = upload_response(session, status=201)
+        response['Location'] = describe_upload(session)['url']
+        return response
+
+
+class UploadSessionView(LoginRequiredMixin, View):
+    """Report on, add bytes to, or abandon one of the user's uploads."""
+
+    raise_exception = True
+
+    def get_session(self):
+        """Return the session if it belongs to the user."""
+        return get_object_or_404(UploadSession, pk=self.kwargs['pk'], owner__user=self.request.user)
+
+    def get(self, request, pk):
+        """Say how many bytes have arrived so the client can resume."""
+        return upload_response(self.get_session())
+
+    def put(self, request, pk):
+        """Append the chunk in the request body at its Content-Range."""
+        session = self.get_session()
+        try:
+            start, length = uploads.parse_content_range(request.META.get('HTTP_CONTENT_RANGE'), session.size)
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+            return JsonResponse({'error': 'Content-Length does not match the Content-Range.'}, status=400)
+        try:
+            uploads.append_chunk(session, request, start, length)
+        except uploads.UploadConflict:
+            return upload_response(self.get_session(), status=409)
+        return upload_response(session)
+
+    def delete(self, request, pk):
+        """Abandon the upload and its bytes."""
+        self.get_session().delete()
+        return HttpResponse(status=204)
+
+
+class FinalizeUploadView(LoginRequiredMixin, View):
+    """Turn a finished upload into a photo."""
+
+    raise_exception = True
+
+    def post(self, request, pk):
+        """Create the photo from the staged bytes."""
+        session = get_object_or_404(UploadSession, pk=pk, owner__user=request.user)
+        try:
+            photo = uploads.finalize(session)
+        except uploads.UploadIncomplete as error:
+            return JsonResponse(dict(describe_upload(session), error=str(error)), status=409)
+        except uploads.UploadRejected as error:
+            return JsonResponse(dict(describe_upload(session), error=str(error)), status=400)
+        data = describe_upload(session)
+        data['photo_url'] = reverse('photo', args=[photo.id])
+        data['duplicates'] = [duplicate.id for duplicate in near_duplicates(photo)]
+        return JsonResponse(data, status=201)
+
+
+class MediaView(View):
+    """Serve a photo file or rendition to viewers allowed to see the photo."""
+
+    def get(self, request, path):
+        """Check the owning photo's visibility, then deliver the file."""
+        photo = media.visible_photo(path, request.user)
+        response = media.serve(request, path, photo) if photo else None
+        if response is None:
+            raise Http404('No such photo file.')
+        return response
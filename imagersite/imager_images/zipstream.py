@@ -0,0 +1,163 @@
+"""Zip archives written front to back as a stream of bytes.
+
+Members are stored without compression, since photos do not shrink,
+and each member's CRC follows its data in a data descriptor, so a
+member is read once, a chunk at a time, and nothing is buffered but the
+small central directory. Sizes are known up front, which makes the
+length of the whole archive known before the first byte is sent.
+Archives or members past 4 GiB get Zip64 records.
+"""
+import struct
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_COUNT_LIMIT = 0xFFFF
+
+# Bit 3: sizes and CRC follow the data. Bit 11: names are UTF-8.
+FLAGS = 0x0008 | 0x0800
+VERSION = 20
+VERSION_ZIP64 = 45
+MADE_BY_UNIX = 3 << 8
+FILE_ATTRIBUTES = 0o100644 << 16
+
+LOCAL_HEADER = struct.Struct('<4sHHHHHLLLHH')
+DATA_DESCRIPTOR = struct.Struct('<4sLLL')
+DATA_DESCRIPTOR_64 = struct.Struct('<4sLQQ')
+CENTRAL_HEADER = struct.Struct('<4sHHHHHHLLLHHHHHLL')
+END_RECORD = struct.Struct('<4sHHHHLLH')
+END_RECORD_64 = struct.Struct('<4sQHHLLQQQQ')
+END_LOCATOR_64 = struct.Struct('<4sLQL')
+
+
+class ZipMember(object):
+    """A file to put in the archive.
+
+    open() must return a binary file object with exactly size bytes.
+    """
+
+    def __init__(self, name, size, date_time, opener):
+        """Describe the member."""
+        self.name = name
+        self.size = size
+        self.date_time = date_time
+        self.open = opener
+
+    @property
+    def encoded_name(self):
+        """Return the name as stored in the archive."""
+        return self.name.encode('utf-8')
+
+    @property
+    def zip64(self):
+        """Return True if the member is too big for 32 bit sizes."""
+        return self.size >= ZIP64_LIMIT
+
+
+def dos_date_time(value):
+    """Return the (time, date) pair zip headers use for a datetime."""
+    year = min(max(value.year, 1980), 2107)
+    date = (year - 1980) << 9 | value.month << 5 | value.day
+    time = value.hour << 11 | value.minute << 5 | value.second // 2
+    return time, date
+
+
+class ZipStream(object):
+    """Iterate over the bytes of a zip archive of members."""
+
+    def __init__(self, members):
+        """Lay out the archive; no file is opened until iteration."""
+        self.members = list(members)
+
+    def __len__(self):
+        """Return the size of the archive in bytes."""
+        offset = 0
+        central = 0
+        for member in self.members:
+            central += len(self._central_header(member, offset, 0))
+            offset += len(self._local_header(member)) + member.size
+            offset += len(self._data_descriptor(member, 0))
+        return offset + central + len(self._end(offset, central))
+
+    def __iter__(self):
+        """Yield the archive a header or chunk at a time."""
+        offset = 0
+        directory = []
+        for member in self.members:
+            header = self._local_header(member)
+            yield header
+            crc = 0
+            written = 0
+            with member.open() as source:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+                    written += len(chunk)
+                    yield chunk
+            if written != member.size:
+                raise IOError('{} changed size while being archived.'.format(member.name))
+            crc &= 0xFFFFFFFF
+            descriptor = self._data_descriptor(member, crc)
+            yield descriptor
+            directory.append(self._central_header(member, offset, crc))
+            offset += len(header) + written + len(descriptor)
+        central = 0
+        for record in directory:
+            central += len(record)
+            yield record
+        yield self._end(offset, central)
+
+    def _local_header(self, member):
+        """Return the header before a member's data."""
+        name = member.encoded_name
+        time, date = dos_date_time(member.date_time)
+        if member.zip64:
+            # Sizes live in the descriptor; the extra field marks them 64 bit.
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            return LOCAL_HEADER.pack(b'PK\x03\x04', VERSION_ZIP64, FLAGS, 0, time, date,
+                                     0, ZIP64_LIMIT, ZIP64_LIMIT, len(name), len(extra)) + name + extra
+        return LOCAL_HEADER.pack(b'PK\x03\x04', VERSION, FLAGS, 0, time, date,
+                                 0, 0, 0, len(name), 0) + name
+
+    def _data_descriptor(self, member, crc):
+        """Return the record after a member's data."""
+        if member.zip64:
+            return DATA_DESCRIPTOR_64.pack(b'PK\x07\x08', crc, member.size, member.size)
+        return DATA_DESCRIPTOR.pack(b'PK\x07\x08', crc, member.size, member.size)
+
+    def _central_header(self, member, offset, crc):
+        """Return a member's central directory record."""
+        name = member.encoded_name
+        time, date = dos_date_time(member.date_time)
+        wide = []
+        size = member.size
+        if member.zip64:
+            wide.extend([member.size, member.size])
+            size = ZIP64_LIMIT
+        local_offset = offset
+        if offset >= ZIP64_LIMIT:
+            wide.append(offset)
+            local_offset = ZIP64_LIMIT
+        extra = b''
+        version = VERSION
+        if wide:
+            extra = struct.pack('<HH{}Q'.format(len(wide)), 1, 8 * len(wide), *wide)
+            version = VERSION_ZIP64
+        return CENTRAL_HEADER.pack(b'PK\x01\x02', MADE_BY_UNIX | version, version, FLAGS, 0,
+                                   time, date, crc, size, size, len(name), len(extra), 0, 0, 0,
+                                   FILE_ATTRIBUTES, local_offset) + name + extra
+
+    def _end(self, offset, central):
+        """Return the end of central directory records."""
+        count = len(self.members)
+        records = b''
+        if count >= ZIP_COUNT_LIMIT or offset >= ZIP64_LIMIT or central >= ZIP64_LIMIT:
+            records = END_RECORD_64.pack(b'PK\x06\x06', END_RECORD_64.size - 12,
+                                         MADE_BY_UNIX | VERSION_ZIP64, VERSION_ZIP64, 0, 0,
+                                         count, count, central, offset)
+            records += END_LOCATOR_64.pack(b'PK\x06\x07', 0, offset + central, 1)
+        return records + END_RECORD.pack(b'PK\x05\x06', 0, 0,
+                                         min(count, ZIP_COUNT_LIMIT), min(count, ZIP_COUNT_LIMIT),
+                                         min(central, ZIP64_LIMIT), min(offset, ZIP64_LIMIT), 0)
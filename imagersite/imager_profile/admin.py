@@ -1,6 +1,22 @@
 from django.contrib import admin
+from imager_images.largeadmin import LargeTableAdmin
 from imager_profile.models import ImagerProfile
 
 
-# Register your models here.
-admin.site.register(ImagerProfile)
\ No newline at end of file
+@admin.register(ImagerProfile)
+class ImagerProfileAdmin(LargeTableAdmin):
+    list_display = ('user', 'camera_type', 'hireable')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_lookups = ('user__username',)
+    # Kept by imager_images.profilestats; see reconcile_profile_counters.
+    readonly_fields = (
+        'public_photos',
+        'shared_photos',
+        'private_photos',
+        'public_albums',
+        'shared_albums',
+        'private_albums',
+        'photo_bytes',
+        'tag_count',
+    )
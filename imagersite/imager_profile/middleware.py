@@ -0,0 +1,75 @@
+"""The signed-in user's profile on every request, as request.profile.
+
+The profile is loaded lazily, on first use, from the shared cache and
+only on a miss from the database. It comes attached to request.user in
+both directions, so request.user.profile and request.profile.user cost
+no further queries. Saving a profile or user, or changing the counters
+kept by imager_images.profilestats, drops the cached copy.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+from imager_profile.models import ImagerProfile
+
+PROFILE_KEY = 'imager:profile:{}'
+
+
+def get_profile(request):
+    """Return the profile of the signed-in user, or None, once per request."""
+    if not hasattr(request, '_cached_profile'):
+        request._cached_profile = load_profile(request.user)
+    return request._cached_profile
+
+
+def load_profile(user):
+    """Return user's profile from the cache or the database, or None."""
+    if not user.is_authenticated:
+        return None
+    key = PROFILE_KEY.format(user.pk)
+    profile = cache.get(key)
+    if profile is None:
+        profile = ImagerProfile.objects.filter(user_id=user.pk).first()
+        if profile is None:
+            return None
+        cache.set(key, profile, getattr(settings, 'IMAGER_PROFILE_CACHE_TIMEOUT', 300))
+    # Link the two so neither side goes back to the database for the other.
+    user.profile = profile
+    return profile
+
+
+def forget_profiles(user_ids):
+    """Drop the cached profiles of users, now and when the transaction commits.
+
+    The second delete catches a request that read the old row and cached
+    it while the change was still uncommitted.
+    """
+    keys = [PROFILE_KEY.format(user_id) for user_id in set(user_ids)]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def forget_profiles_by_id(profile_ids):
+    """Drop the cached copies of profiles given by their own ids."""
+    profile_ids = [profile_id for profile_id in profile_ids if profile_id is not None]
+    if profile_ids:
+        forget_profiles(ImagerProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True))
+
+
+class ProfileMiddleware(object):
+    """Attach the signed-in user's profile to the request as request.profile.
+
+    Must come after AuthenticationMiddleware. Anonymous requests get a
+    profile that is falsy.
+    """
+
+    def __init__(self, get_response):
+        """Keep the next handler."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Add the lazy profile and carry on."""
+        request.profile = SimpleLazyObject(lambda: get_profile(request))
+        return self.get_response(request)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.5 on 2026-10-18 17:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imager_profile', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='photo_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='private_albums',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='private_photos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='public_albums',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='public_photos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='shared_albums',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='shared_photos',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagerprofile',
+            name='tag_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
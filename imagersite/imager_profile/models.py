@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from phonenumber_field.modelfields import PhoneNumberField
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -51,11 +51,31 @@ class ImagerProfile(models.Model):
                                            choices=PHOTOGRAPHY_CHOICES,
                                            null=True)
 
+    # Kept up to date by imager_images.profilestats, never by forms.
+    public_photos = models.PositiveIntegerField(default=0, editable=False)
+    shared_photos = models.PositiveIntegerField(default=0, editable=False)
+    private_photos = models.PositiveIntegerField(default=0, editable=False)
+    public_albums = models.PositiveIntegerField(default=0, editable=False)
+    shared_albums = models.PositiveIntegerField(default=0, editable=False)
+    private_albums = models.PositiveIntegerField(default=0, editable=False)
+    photo_bytes = models.BigIntegerField(default=0, editable=False)
+    tag_count = models.PositiveIntegerField(default=0, editable=False)
+
     @property
     def is_active(self):
         """Return if user of profile is active."""
         return self.user.is_active
 
+    @property
+    def photo_count(self):
+        """Return how many photos the profile owns."""
+        return self.public_photos + self.shared_photos + self.private_photos
+
+    @property
+    def album_count(self):
+        """Return how many albums the profile owns."""
+        return self.public_albums + self.shared_albums + self.private_albums
+
     def __str__(self):
         """Return string representation of model instance."""
         return str(self.user.username)
@@ -67,3 +87,19 @@ def make_profile_from_user(sender, instance, **kwargs):
     if kwargs['created']:
         profile = ImagerProfile(user=instance)
         profile.save()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user_profile(sender, instance, **kwargs):
+    """Drop the cached profile of a changed user."""
+    from imager_profile.middleware import forget_profiles
+    forget_profiles([instance.pk])
+
+
+@receiver(post_save, sender=ImagerProfile)
+@receiver(post_delete, sender=ImagerProfile)
+def forget_cached_profile(sender, instance, **kwargs):
+    """Drop the cached copy of a changed profile."""
+    from imager_profile.middleware import forget_profiles
+    forget_profiles([instance.user_id])
@@ -1,11 +1,18 @@
 """Tests for the imager app."""
-from django.test import TestCase, Client, RequestFactory
-from django.contrib.auth.models import User
-from imager_profile.models import ImagerProfile
-from imager_profile.views import EditProfileView
-from imager_profile.forms import EditProfileForm
 import factory
 from bs4 import BeautifulSoup
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from imager_images.models import Photo
+from imager_profile.forms import EditProfileForm
+from imager_profile.middleware import ProfileMiddleware
+from imager_profile.models import ImagerProfile
+from imager_profile.views import EditProfileView
 
 
 class UserFactory(factory.django.DjangoModelFactory):
@@ -86,6 +93,7 @@ class ProfileFrontendTests(TestCase):
 
     def setUp(self):
         """Set up test tool instances."""
+        cache.clear()
         self.client = Client()
         self.request = RequestFactory()
 
@@ -258,3 +266,81 @@ class ProfileFrontendTests(TestCase):
         })
         user = User.objects.first()
         self.assertTrue(user.profile.camera_type == 'CANNON')
+
+    def test_edit_profile_cannot_set_counters(self):
+        """The counters are neither on the edit form nor taken from a post."""
+        test_user = self.add_billy()
+        self.client.force_login(test_user.user)
+        response = self.client.get('/profile/edit/')
+        self.assertNotContains(response, 'name="public_photos"')
+        self.client.post("/profile/edit/", {
+            'camera_type': 'CANNON',
+            'hireable': 'True',
+            'type_of_photography': 'NATURE',
+            'public_photos': 999,
+            'photo_bytes': 123456789,
+            'tag_count': 42,
+        })
+        test_user.refresh_from_db()
+        self.assertEqual(test_user.camera_type, 'CANNON')
+        self.assertEqual((test_user.public_photos, test_user.photo_bytes, test_user.tag_count), (0, 0, 0))
+
+    def test_profile_page_reads_one_row(self):
+        """The public profile page loads the profile, user and counters in one query."""
+        self.add_billy()
+        with self.assertNumQueries(1):
+            response = self.client.get('/profile/BillyTheGoat/')
+        self.assertContains(response, 'Public photos: 0')
+
+
+class ProfileMiddlewareTests(TestCase):
+    """The signed-in user's profile, cached on request.profile."""
+
+    def setUp(self):
+        """Log in a photographer."""
+        cache.clear()
+        self.user = UserFactory.create()
+        self.client.force_login(self.user)
+
+    def profile_queries(self, url):
+        """Fetch url and return the queries that read profiles."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return [query['sql'] for query in queries.captured_queries
+                if 'FROM "imager_profile_imagerprofile"' in query['sql']]
+
+    def test_profile_is_loaded_once_and_cached(self):
+        """The first request loads the profile; later ones use the cache."""
+        self.assertEqual(len(self.profile_queries('/profile/')), 1)
+        self.assertEqual(self.profile_queries('/profile/'), [])
+        self.assertEqual(self.profile_queries('/images/library/'), [])
+
+    def test_changes_drop_the_cached_profile(self):
+        """Saving the profile or changing its counters shows at once."""
+        self.client.get('/profile/')
+        profile = ImagerProfile.objects.get(user=self.user)
+        profile.website = 'example.com'
+        profile.save()
+        self.assertContains(self.client.get('/profile/'), 'Website: example.com')
+        Photo.objects.create(owner=profile, title='New', published='PUBLIC')
+        self.assertContains(self.client.get('/profile/'), 'Public photos: 1')
+
+    def test_editing_keeps_counters_changed_since_caching(self):
+        """The edit view saves its own fields over the current row, not the cached copy."""
+        self.client.get('/profile/')
+        ImagerProfile.objects.filter(user=self.user).update(public_photos=F('public_photos') + 3)
+        self.client.post('/profile/edit/', {
+            'camera_type': 'NIKON',
+            'hireable': 'True',
+            'type_of_photography': 'URBAN',
+        })
+        profile = ImagerProfile.objects.get(user=self.user)
+        self.assertEqual(profile.camera_type, 'NIKON')
+        self.assertEqual(profile.public_photos, 3)
+
+    def test_anonymous_requests_have_no_profile(self):
+        """request.profile is falsy for visitors who are not signed in."""
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        ProfileMiddleware(lambda request: None)(request)
+        self.assertFalse(request.profile)
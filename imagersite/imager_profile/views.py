@@ -2,6 +2,8 @@
 from django.views.generic import DetailView, TemplateView, UpdateView
 from django.urls import reverse_lazy
 from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from imager_profile.middleware import get_profile
 from imager_profile.models import ImagerProfile
 from imager_profile.forms import EditProfileForm
 
@@ -12,13 +14,11 @@ class ProfileView(DetailView):
     template_name = 'imager_profile/profile.html'
     model = ImagerProfile
     slug_field = 'user__username'
+    context_object_name = 'profile'
 
-    def get_context_data(self, **kwargs):
-        """Get profile information and return it."""
-        context = super(ProfileView, self).get_context_data(**kwargs)
-        profile = ImagerProfile.active.get(user__username=self.kwargs['slug'])
-        context['profile'] = profile
-        return context
+    def get_queryset(self):
+        """Load active profiles with their user, counters included, in one row."""
+        return ImagerProfile.active.select_related('user')
 
 
 class ProfileUserView(TemplateView):
@@ -30,8 +30,7 @@ class ProfileUserView(TemplateView):
     def get_context_data(self, **kwargs):
         """Get profile information and return it."""
         context = super(ProfileUserView, self).get_context_data(**kwargs)
-        profile = ImagerProfile.active.get(user__username=self.request.user)
-        context['profile'] = profile
+        context['profile'] = get_profile(self.request)
         return context
 
 
@@ -45,15 +44,17 @@ class EditProfileView(UpdateView):
     model = ImagerProfile
 
     def get_object(self):
-        """Define what profile to edit."""
-        return self.request.user.profile
+        """Load the signed-in user's profile from the database, not the cache."""
+        return get_object_or_404(ImagerProfile.objects.select_related('user'),
+                                 user_id=self.request.user.pk)
 
     def form_valid(self, form):
-        """If form post is successful, set the object's owner."""
-        self.object = form.save()
+        """Save only the edited columns, leaving the counters to their own updates."""
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=[field.name for field in ImagerProfile._meta.concrete_fields
+                                        if field.name in form.fields])
         self.object.user.first_name = form.cleaned_data['First Name']
         self.object.user.last_name = form.cleaned_data['Last Name']
         self.object.user.email = form.cleaned_data['Email']
-        self.object.user.save()
-        self.object.save()
+        self.object.user.save(update_fields=['first_name', 'last_name', 'email'])
         return HttpResponseRedirect(self.get_success_url())
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'taggit',
     'imager_profile',
     'imager_images',
+    'imager_api',
     'imagersite',
     'sorl.thumbnail',
 
@@ -51,6 +52,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'imager_profile.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -151,3 +153,60 @@ EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'MEDIA')
 MEDIA_URL = "/media/"
+
+IMAGER_GALLERY_PAGE_SIZE = 30
+IMAGER_FEATURED_COUNT = 5
+IMAGER_SAMPLING_REFRESH = 600
+IMAGER_SAMPLING_POOL_LIMIT = 100000
+IMAGER_RENDITIONS = {
+    'thumb': (100, 100, True),
+    'card': (400, 400, False),
+    'display': (1200, 1200, False),
+}
+IMAGER_SIMILAR_PHOTOS_KEPT = 20
+
+# A small LRU in each worker in front of an SQLite file every worker
+# shares; see imager_images.tieredcache.
+CACHES = {
+    'default': {
+        'BACKEND': 'imager_images.tieredcache.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 10,
+        },
+    },
+    'shared': {
+        'BACKEND': 'imager_images.tieredcache.SQLiteCache',
+        'LOCATION': os.environ.get('IMAGER_CACHE_PATH') or os.path.join(BASE_DIR, 'CACHE', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+IMAGER_PAGE_CACHE_TIMEOUT = 300
+IMAGER_HOME_CACHE_TIMEOUT = 60
+IMAGER_CACHE_LOCK_WAIT = 2.0
+IMAGER_PROFILE_CACHE_TIMEOUT = 300
+IMAGER_BULK_UPLOAD_MAX_FILES = 200
+IMAGER_BULK_UPLOAD_MAX_ARCHIVE_BYTES = 500 * 1024 * 1024
+IMAGER_UPLOAD_STAGING_DIR = os.path.join(BASE_DIR, 'STAGING')
+IMAGER_UPLOAD_MAX_BYTES = 100 * 1024 * 1024
+IMAGER_UPLOAD_SESSION_TTL = 24 * 60 * 60
+IMAGER_ORPHAN_FILE_GRACE = 24 * 60 * 60
+IMAGER_METADATA_WORKERS = 2
+IMAGER_METADATA_QUEUE_LIMIT = 100
+IMAGER_DUPLICATE_DISTANCE = 6
+IMAGER_DUPLICATE_INDEX_REFRESH = 600
+# Internal nginx location serving MEDIA_ROOT; see simple_nginx_config.
+# Leave as None to stream media from Django.
+IMAGER_MEDIA_ACCEL_PREFIX = os.environ.get('IMAGER_MEDIA_ACCEL_PREFIX') or None
+IMAGER_MEDIA_MAX_AGE = 24 * 60 * 60
+IMAGER_API_PAGE_SIZE = 50
+IMAGER_API_MAX_PAGE_SIZE = 200
+IMAGER_SEARCH_CONFIG = 'english'
+# How often processes without PostgreSQL text search reload their index.
+IMAGER_SEARCH_INDEX_REFRESH = 600
+IMAGER_PHOTO_PICKER_PAGE_SIZE = 60
+# Unfiltered admin change lists bigger than this show PostgreSQL's row estimate.
+IMAGER_ADMIN_EXACT_COUNT_LIMIT = 100000
@@ -0,0 +1,76 @@
+// Pick an album's photos a page at a time from the photo picker endpoint.
+// Only the ids added and removed are sent back with the album form.
+$(document).ready(function() {
+  var picker = $('#photo-picker');
+  var form = picker.closest('form');
+  var adding = {};
+  var removing = {};
+  var timer = null;
+
+  function write() {
+    form.find('[name=add_photos]').val(Object.keys(adding).join(','));
+    form.find('[name=remove_photos]').val(Object.keys(removing).join(','));
+  }
+
+  function load(params) {
+    params.q = picker.find('.picker-search').val();
+    if (picker.data('album')) {
+      params.album = picker.data('album');
+    }
+    $.getJSON(picker.data('url'), params, show);
+  }
+
+  function item(photo) {
+    var chosen = adding[photo.id] || (photo.in_album && !removing[photo.id]);
+    var member = $('<input type="checkbox">').prop('checked', !!chosen).change(function() {
+      delete adding[photo.id];
+      delete removing[photo.id];
+      if (this.checked && !photo.in_album) {
+        adding[photo.id] = true;
+      } else if (!this.checked && photo.in_album) {
+        removing[photo.id] = true;
+      }
+      write();
+    });
+    var cover = $('<input type="radio" name="picker_cover" title="Cover photo">')
+      .prop('checked', String(photo.id) === form.find('[name=cover_photo]').val())
+      .change(function() {
+        form.find('[name=cover_photo]').val(photo.id);
+      });
+    return $('<div class="col-xs-4 col-sm-2">').append(
+      $('<label>').attr('title', photo.title).append(member, ' ', $('<img>').attr('src', photo.thumb)),
+      $('<div>').append(cover, ' cover')
+    );
+  }
+
+  function show(data) {
+    var list = picker.find('.picker-photos').empty();
+    var row = $('<div class="row">').appendTo(list);
+    $.each(data.results, function(i, photo) {
+      row.append(item(photo));
+    });
+    picker.find('.picker-previous').parent().toggle(!!data.previous);
+    picker.find('.picker-next').parent().toggle(!!data.next);
+    picker.data('previous', data.previous);
+    picker.data('next', data.next);
+  }
+
+  picker.find('.picker-previous').click(function(event) {
+    event.preventDefault();
+    load({before: picker.data('previous')});
+  });
+  picker.find('.picker-next').click(function(event) {
+    event.preventDefault();
+    load({after: picker.data('next')});
+  });
+  picker.find('.picker-no-cover').click(function(event) {
+    event.preventDefault();
+    form.find('[name=cover_photo]').val('');
+    picker.find('[name=picker_cover]').prop('checked', false);
+  });
+  picker.find('.picker-search').on('input', function() {
+    clearTimeout(timer);
+    timer = setTimeout(function() { load({}); }, 300);
+  });
+  load({});
+});
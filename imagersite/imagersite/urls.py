@@ -13,12 +13,14 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
-from django.conf.urls.static import static
 from django.conf.urls import url, include
 from django.conf import settings
 
+from imager_images.views import MediaView
 from imagersite.views import HomeView
 
 urlpatterns = [
@@ -29,6 +31,7 @@ urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^profile/', include('imager_profile.urls')),
     url(r'^images/', include('imager_images.urls')),
+    url(r'^api/', include('imager_api.urls')),
+    url(r'^{}(?P<path>.+)$'.format(re.escape(settings.MEDIA_URL.lstrip('/'))),
+        MediaView.as_view(), name='media'),
 ]
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
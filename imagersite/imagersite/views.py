@@ -1,17 +1,18 @@
+from django.conf import settings
 from django.views.generic import TemplateView
-from django.shortcuts import render
-from imager_images.models import Photo
-from random import randint
+from imager_images.cache import AnonymousPageCacheMixin
+from imager_images.sampling import featured_photos
 
 
-class HomeView(TemplateView):
+class HomeView(AnonymousPageCacheMixin, TemplateView):
     template_name = 'imagersite/home.html'
+    cache_namespaces = ('photos',)
+
+    def get_cache_timeout(self):
+        return getattr(settings, 'IMAGER_HOME_CACHE_TIMEOUT', 60)
 
     def get_context_data(self):
-        photos = Photo.public.all()
-        if photos:
-            random_photo_index = randint(1, len(photos)) - 1
-            random_photo = photos[random_photo_index]
-        else:
-            random_photo = None
-        return {'random_photo': random_photo}
+        photos = featured_photos()
+        random_photo = photos[0] if photos else None
+        return {'random_photo': random_photo,
+                'featured_photos': photos[1:]}